@@ -0,0 +1,32 @@
+from surface_crns.models.grids import SquareGrid, HexGrid
+from surface_crns.models.compact_grids import CompactSquareGrid, CompactHexGrid
+import numpy as np
+import tracemalloc
+import time
+
+def measure_grid(Grid, size, states):
+    '''
+    Build a size x size grid of class Grid and fill it with random states.
+    Returns (bytes per node, seconds to build).
+    '''
+    init_state = np.random.default_rng(0).choice(states, size = (size, size))
+    tracemalloc.start()
+    start_time = time.time()
+    grid = Grid(size, size)
+    grid.set_global_state(init_state)
+    build_time = time.time() - start_time
+    used_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return used_bytes / (size * size), build_time
+
+def main():
+    states = ["A", "B", "C", "D"]
+    for size in [100, 300, 1000]:
+        print(f"{size} x {size} lattice:")
+        for Grid in [SquareGrid, CompactSquareGrid, HexGrid, CompactHexGrid]:
+            bytes_per_node, build_time = measure_grid(Grid, size, states)
+            print(f"\t{Grid.__name__}: {bytes_per_node:.1f} bytes/node, "
+                  f"built in {build_time:.2f} sec")
+
+if __name__ == "__main__":
+    main()
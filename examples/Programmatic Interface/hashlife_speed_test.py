@@ -0,0 +1,86 @@
+from surface_crns.readers.manifest_readers import read_manifest
+from surface_crns.readers.totalistic_readers import \
+                                                parse_totalistic_rule_stream
+from surface_crns.options.option_processor import SurfaceCRNOptionParser
+from surface_crns.models.compact_grids import CompactSquareGridWithCornerLeak
+from surface_crns.simulators.simulator_factory import get_simulator_class
+import numpy as np
+import time
+import os
+
+# How fast HashLife skips ahead, compared with the bit-packed simulator
+# advancing tick by tick. Both run with the simulators' advance method, and
+# both get the same answer.
+seed = 635253461
+parity_file = os.path.join("..", "Other", "parity_totalistic.txt")
+parity_ticks = [1 << 10, 1 << 14, 1 << 20]
+
+# Conway's Game of Life (born with 3 live neighbors, survives with 2 or 3).
+game_of_life_rule = [f"{count}, {state} -> " +
+                     ("1" if count == 3 or (count == 2 and state == 1)
+                      else "0")
+                     for count in range(9) for state in range(2)]
+game_of_life_size  = 256
+game_of_life_ticks = [1 << 8, 1 << 12, 1 << 16]
+# Above this many ticks, the bit-packed simulator isn't timed.
+max_binary_ticks = 1 << 14
+
+def time_advance(name, surface, update_rule, ticks):
+    '''
+    Advance the named synchronous simulator by ticks ticks. Returns the time
+    taken and the final state of the surface.
+    '''
+    simulator = get_simulator_class("synchronous", name)(
+                                    surface = surface,
+                                    update_rule = update_rule,
+                                    seed = seed,
+                                    simulation_duration = ticks)
+    start_time = time.time()
+    simulator.advance(ticks)
+    return time.time() - start_time, surface.get_global_state()
+
+def compare(make_surface, update_rule, ticks):
+    hashlife_time, hashlife_state = time_advance("hashlife", make_surface(),
+                                                 update_rule, ticks)
+    print(f"\t{ticks} ticks: hashlife {hashlife_time:.3f} sec "
+          f"({ticks / hashlife_time:.3g} ticks/sec)", end = "")
+    if ticks <= max_binary_ticks:
+        binary_time, binary_state = time_advance("binary", make_surface(),
+                                                 update_rule, ticks)
+        same = (binary_state == hashlife_state).all()
+        print(f", binary {binary_time:.3f} sec "
+              f"({ticks / binary_time:.3g} ticks/sec), "
+              f"{'same' if same else 'DIFFERENT'} result", end = "")
+    print()
+
+def game_of_life_soup():
+    '''
+    An unwrapped Game of Life board, with a random soup in the middle
+    eighth of it.
+    '''
+    rng = np.random.default_rng(seed)
+    size = game_of_life_size
+    surface = CompactSquareGridWithCornerLeak(size, size, corner_rate = 1,
+                                              wrap = False)
+    states = np.full((size, size), "0", dtype = object)
+    soup = slice(size * 7 // 16, size * 9 // 16)
+    states[soup, soup] = rng.integers(0, 2, (size // 8, size // 8)).astype(
+                                                        str).astype(object)
+    surface.set_global_state(states)
+    return surface
+
+def main():
+    print(f"Simulation {parity_file}:")
+    manifest = read_manifest(parity_file)
+    update_rule = SurfaceCRNOptionParser(manifest).update_rule
+    for ticks in parity_ticks:
+        compare(lambda: SurfaceCRNOptionParser(manifest).grid, update_rule,
+                ticks)
+
+    print(f"Game of Life soup, {game_of_life_size} x {game_of_life_size}:")
+    update_rule = parse_totalistic_rule_stream(game_of_life_rule)
+    for ticks in game_of_life_ticks:
+        compare(game_of_life_soup, update_rule, ticks)
+
+if __name__ == "__main__":
+    main()
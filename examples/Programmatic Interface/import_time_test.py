@@ -0,0 +1,66 @@
+import statistics
+import subprocess
+import sys
+
+# Measures how long importing surface_crns takes, using python -X importtime,
+# for short scripts that only need part of the package (batch runs launched
+# thousands of times, say). "Before" imports every subpackage up front, as
+# surface_crns/__init__.py used to; "after" is what the statement costs now
+# that the package imports its submodules on first use.
+repeats = 7
+
+# What "import surface_crns" used to do.
+EAGER_IMPORT = "; ".join(["import surface_crns"] +
+                         ["from surface_crns." + package + " import *"
+                          for package in ["base", "models", "profiling",
+                                          "readers", "simulators", "views"]])
+STATEMENTS = ["import surface_crns",
+              "from surface_crns.simulators.queue_simulator import "
+              "QueueSimulator"]
+
+def import_time(statement):
+    '''
+    Runs statement in a new interpreter and returns the time spent importing
+    (in seconds) and the names of the modules imported.
+    '''
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             statement],
+                            stdout = subprocess.DEVNULL,
+                            stderr = subprocess.PIPE, text = True, check = True)
+    total = 0
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.append(name.strip())
+        # Top-level imports aren't indented; their times include everything
+        # they import.
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+    return total / 1e6, modules
+
+def median_import_time(statement):
+    baseline = statistics.median(import_time("pass")[0]
+                                 for _ in range(repeats))
+    times = []
+    for _ in range(repeats):
+        total, modules = import_time(statement)
+        times.append(total - baseline)
+    return statistics.median(times), modules
+
+def describe(statement):
+    seconds, modules = median_import_time(statement)
+    package_modules = [m for m in modules if m.startswith("surface_crns")]
+    heavy = [m for m in ["numpy", "pygame"] if m in modules]
+    return (f"{1000 * seconds:7.1f} ms, {len(package_modules):2d} "
+            f"surface_crns modules, {', '.join(heavy) or 'no numpy/pygame'}")
+
+def main():
+    for statement in STATEMENTS:
+        print(statement)
+        print("    before: " + describe(EAGER_IMPORT + "; " + statement))
+        print("    after:  " + describe(statement))
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,8 @@ seed = 635253461
 
 def simulate_without_display(manifest, Simulator):
     '''
-    Run to completion with a given Simulator class.
+    Run to completion with a given Simulator class. Returns the number of
+    events processed and the largest size the event queue reached.
     '''
     manifest_options = read_manifest(manifest)
     opts = SurfaceCRNOptionParser(manifest_options)
@@ -17,10 +18,14 @@ def simulate_without_display(manifest, Simulator):
                            transition_rules = opts.transition_rules,
                            seed = seed,
                            simulation_duration = opts.max_duration)
+    n_events = 0
+    max_queue = len(simulator.event_queue)
     while not simulator.done():
-        simulator.process_next_reaction()
+        if simulator.process_next_reaction() is not None:
+            n_events += 1
+        max_queue = max(max_queue, len(simulator.event_queue))
         
-    return simulator.time
+    return n_events, max_queue
 
 def main():
 	simulation_list = ["rule_110_example_manifest.txt", 
@@ -33,8 +38,12 @@ def main():
 		for simulator, s in [(QueueSimulator, "QueueSimulator"), 
 							 (EagerQueueSimulator, "EagerQueueSimulator")]:
 			start_time = time.time()
-			simulate_without_display(manifest_file, simulator)
-			print(f"\t{s}: {time.time() - start_time} sec")
+			n_events, max_queue = simulate_without_display(manifest_file,
+														   simulator)
+			run_time = time.time() - start_time
+			print(f"\t{s}: {run_time:.2f} sec, {n_events} events "
+				  f"({run_time / max(n_events, 1) * 1e6:.1f} usec/event), "
+				  f"largest queue {max_queue}")
 
 
 if __name__ == "__main__":
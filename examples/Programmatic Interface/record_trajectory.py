@@ -0,0 +1,50 @@
+from surface_crns.readers.manifest_readers import read_manifest
+from surface_crns.options.option_processor import SurfaceCRNOptionParser
+from surface_crns.simulators.simulator_factory import make_simulator
+from surface_crns.simulators.trajectory import record_trajectory, \
+                                               TrajectoryReader
+import numpy as np
+import time
+import os
+
+# Record a run once to a trajectory file, then look at it as often as you like
+# without re-simulating. The reader memory-maps the events, so the run never
+# has to fit in memory.
+manifest_file   = os.path.join("..", "Other", "GH_big_spiral.txt")
+trajectory_file = "GH_big_spiral.traj"
+duration        = 20
+analysis_times  = [5, 10, 15, 20]
+
+def main():
+    opts = SurfaceCRNOptionParser(read_manifest(manifest_file))
+    simulator = make_simulator(opts, duration = duration)
+    start_time = time.time()
+    n_events = record_trajectory(simulator, trajectory_file)
+    print(f"Recorded {n_events} events in {time.time() - start_time:.2f} "
+          f"seconds ({os.path.getsize(trajectory_file) / 1e6:.1f} MB).")
+
+    reader = TrajectoryReader(trajectory_file)
+    print(f"Species: {reader.species}")
+    for t in analysis_times:
+        start_time = time.time()
+        states = reader.states_at(t)
+        run_time = time.time() - start_time
+        species, counts = np.unique(states, return_counts = True)
+        print(f"T = {t} (rebuilt in {run_time:.3f} seconds): "
+              + ", ".join(f"{s}: {c}" for s, c in zip(species, counts)))
+
+    # The history of the busiest site, and the events around it, without
+    # scanning the whole run.
+    start_time = time.time()
+    index = reader.event_index()
+    print(f"Indexed events by site in {time.time() - start_time:.2f} seconds.")
+    busiest = int(np.argmax(np.diff(index.starts)))
+    x, y = divmod(busiest, reader.shape[1])
+    times, states = index.node_history(x, y)
+    print(f"Site ({x}, {y}) changed {len(times) - 1} times: " +
+          " ".join(f"{s}@{t:.2f}" for t, s in zip(times, states)))
+    events = index.region_events(x - 5, y - 5, x + 5, y + 5)
+    print(f"{len(events)} events in the 10 x 10 square around it.")
+
+if __name__ == "__main__":
+    main()
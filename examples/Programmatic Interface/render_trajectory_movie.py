@@ -0,0 +1,40 @@
+from surface_crns.readers.manifest_readers import read_manifest
+from surface_crns.options.option_processor import SurfaceCRNOptionParser
+from surface_crns.simulators.simulator_factory import make_simulator
+from surface_crns.simulators.trajectory import record_trajectory
+from surface_crns.views.movie_renderer import render_movie, find_ffmpeg
+import multiprocessing
+import time
+import os
+
+# Simulate once, then render the movie offline, split across worker processes,
+# instead of capturing frames through pygame while the simulation runs. Frames
+# are written as PNGs, or, if ffmpeg is installed, straight into a movie.
+manifest_file   = os.path.join("..", "Other", "GH_big_spiral.txt")
+trajectory_file = "GH_big_spiral.traj"
+duration        = 20
+
+def main():
+    opts = SurfaceCRNOptionParser(read_manifest(manifest_file))
+    simulator = make_simulator(opts, duration = duration)
+    start_time = time.time()
+    record_trajectory(simulator, trajectory_file)
+    print(f"Simulated in {time.time() - start_time:.2f} seconds.")
+
+    try:
+        find_ffmpeg()
+        output = "GH_big_spiral.mp4"
+    except Exception:
+        output = "GH_big_spiral_frames"
+    for processes in sorted({1, multiprocessing.cpu_count()}):
+        start_time = time.time()
+        n_frames = render_movie(trajectory_file, opts.COLORMAP, output,
+                                capture_rate = opts.capture_rate,
+                                duration = duration,
+                                pixels_per_node = opts.pixels_per_node,
+                                processes = processes)
+        print(f"Rendered {n_frames} frames to {output} with {processes} "
+              f"process(es) in {time.time() - start_time:.2f} seconds.")
+
+if __name__ == "__main__":
+    main()
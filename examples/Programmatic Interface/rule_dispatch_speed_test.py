@@ -0,0 +1,49 @@
+from surface_crns.simulators.queue_simulator import QueueSimulator
+from surface_crns.readers.manifest_readers import read_manifest
+from surface_crns.options.option_processor import SurfaceCRNOptionParser
+import time
+import os
+
+seed = 635253461
+
+# Manifests from the paper, with the (simulated) time to run each one for.
+# Durations are capped so that the whole test finishes in a few minutes.
+paper_3 = os.path.join("..", "Paper", "3 - Dynamic Spatial Patterns")
+paper_6 = os.path.join("..", "Paper", "6 - Robots and Swarms")
+simulation_list = [
+    (os.path.join(paper_3, "3.1_GH_asynchronous_manifest.txt"), 100),
+    (os.path.join(paper_3, "3.2_GH_spinning_arrow_manifest.txt"), 20),
+    (os.path.join(paper_3, "3.3_GH_broadcast_swap_sum_manifest.txt"), 100),
+    (os.path.join(paper_3, "3.3_Game_of_Life_broadcast_swap_sum_manifest.txt"),
+     100),
+    (os.path.join(paper_6, "Fig6a-anthill_manifest.txt"), 5000),
+    (os.path.join(paper_6, "Fig6b-scouting_ant_manifest.txt"), 100),
+    (os.path.join(paper_6, "Fig6c-cargo_sorter_manifest.txt"), 2000)]
+
+def time_simulation(manifest, duration):
+    '''
+    Run a manifest with QueueSimulator for the given simulated duration.
+    Returns (number of events, wall-clock seconds spent simulating).
+    '''
+    manifest_options = read_manifest(manifest)
+    opts = SurfaceCRNOptionParser(manifest_options)
+    start_time = time.time()
+    simulator = QueueSimulator(surface = opts.grid,
+                               transition_rules = opts.transition_rules,
+                               seed = seed,
+                               simulation_duration = duration)
+    n_events = 0
+    while not simulator.done():
+        if simulator.process_next_reaction():
+            n_events += 1
+    return n_events, time.time() - start_time
+
+def main():
+    for manifest_file, duration in simulation_list:
+        n_events, run_time = time_simulation(manifest_file, duration)
+        print(f"{os.path.basename(manifest_file)} (T = {duration}): "
+              f"{n_events} events in {run_time:.2f} sec "
+              f"({n_events / run_time:.0f} events/sec)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+from surface_crns.models.compact_grids import CompactSquareGrid
+from surface_crns.base.transition_rule import TransitionRule
+from surface_crns.simulators.simulator_factory import get_simulator_class
+import numpy as np
+import time
+
+# Per-event cost of the SSA simulators as the lattice grows. The surface is a
+# wrapped compact grid with 1% of sites holding random walkers, which blink
+# between two states, so the number of live reactions grows with the lattice
+# while each event only touches a couple of sites.
+seed = 635253461
+walker_density = 0.01
+n_events = 100000
+sizes = [100, 300, 1000, 2000]
+simulators = ["next_reaction", "direct", "composition_rejection"]
+rules = [TransitionRule(["W", "O"], ["O", "W"], 1),
+         TransitionRule(["V", "O"], ["O", "V"], 2),
+         TransitionRule("W", "V", 0.1),
+         TransitionRule("V", "W", 0.1)]
+
+def make_surface(size):
+    '''
+    Build a size x size wrapped compact grid of empty sites ("O") sprinkled
+    with walkers ("W").
+    '''
+    rng = np.random.default_rng(seed)
+    surface = CompactSquareGrid(size, size, wrap = True)
+    empty  = surface.species.intern("O")
+    walker = surface.species.intern("W")
+    surface.species.intern("V")
+    walkers = rng.random(size * size) < walker_density
+    surface.set_state_codes(np.where(walkers, walker, empty))
+    return surface
+
+def time_simulator(name, size):
+    '''
+    Returns (seconds to set up, seconds per event over n_events events).
+    '''
+    surface = make_surface(size)
+    start_time = time.time()
+    simulator = get_simulator_class("asynchronous", name)(
+                                            surface = surface,
+                                            transition_rules = rules,
+                                            seed = seed,
+                                            simulation_duration = float("inf"))
+    setup_time = time.time() - start_time
+    start_time = time.time()
+    for _ in range(n_events):
+        simulator.process_next_reaction()
+    return setup_time, (time.time() - start_time) / n_events
+
+def main():
+    for size in sizes:
+        print(f"{size} x {size} lattice:")
+        for name in simulators:
+            setup_time, event_time = time_simulator(name, size)
+            print(f"\t{name}: {event_time * 1e6:.1f} usec/event "
+                  f"(set up in {setup_time:.1f} sec)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+from surface_crns.readers.manifest_readers import read_manifest
+from surface_crns.readers.totalistic_readers import \
+                                                parse_totalistic_rule_stream
+from surface_crns.options.option_processor import SurfaceCRNOptionParser
+from surface_crns.models.grids import SquareGridWithCornerLeak
+from surface_crns.models.compact_grids import CompactSquareGridWithCornerLeak
+from surface_crns.simulators.simulator_factory import get_simulator_class
+import numpy as np
+import time
+import os
+
+# Speed of the synchronous simulators: the generic one, which calls the update
+# rule node by node, the numpy totalistic one, and the bit-packed one for
+# rules with states "0" and "1" only.
+seed = 635253461
+simulation_list = [os.path.join("..", "Other", "majority_totalistic.txt"),
+                   os.path.join("..", "Other", "parity_totalistic.txt")]
+simulators = ["synchronous", "totalistic", "binary"]
+
+# Conway's Game of Life (born with 3 live neighbors, survives with 2 or 3).
+game_of_life_rule = [f"{count}, {state} -> " +
+                     ("1" if count == 3 or (count == 2 and state == 1)
+                      else "0")
+                     for count in range(9) for state in range(2)]
+game_of_life_sizes = [200, 1000, 4000]
+game_of_life_ticks = 20
+
+def time_simulator(name, surface, update_rule, duration, advance = False):
+    '''
+    Run to completion with the named synchronous simulator, one tick at a
+    time or, if advance is True, all at once with the simulator's advance
+    method. Returns the number of ticks run and the total time taken.
+    '''
+    simulator = get_simulator_class("synchronous", name)(
+                                    surface = surface,
+                                    update_rule = update_rule,
+                                    seed = seed,
+                                    simulation_duration = duration)
+    start_time = time.time()
+    if advance:
+        simulator.advance(duration)
+    while not simulator.done():
+        simulator.process_next_reaction()
+    return simulator.time, time.time() - start_time
+
+def report(name, n_cells, ticks, run_time):
+    print(f"\t{name}: {run_time / ticks * 1e3:.2f} msec/tick, "
+          f"{n_cells * ticks / run_time:.3g} cells/sec")
+
+def game_of_life_soup(size, compact):
+    '''
+    A wrapped size x size Game of Life board (a square grid with corner
+    connections, so each cell has 8 neighbors), half full at random.
+    '''
+    rng = np.random.default_rng(seed)
+    if compact:
+        grid_class = CompactSquareGridWithCornerLeak
+    else:
+        grid_class = SquareGridWithCornerLeak
+    surface = grid_class(size, size, corner_rate = 1, wrap = True)
+    surface.set_global_state(
+                rng.integers(0, 2, (size, size)).astype(str).astype(object))
+    return surface
+
+def main():
+    for manifest_file in simulation_list:
+        print(f"Simulation {manifest_file}:")
+        for name in simulators:
+            opts = SurfaceCRNOptionParser(read_manifest(manifest_file))
+            ticks, run_time = time_simulator(name, opts.grid, opts.update_rule,
+                                             opts.max_duration)
+            report(name, opts.grid.x_size * opts.grid.y_size, ticks,
+                   run_time)
+
+    update_rule = parse_totalistic_rule_stream(game_of_life_rule)
+    for size in game_of_life_sizes:
+        print(f"Game of Life, {size} x {size}:")
+        # The generic simulator needs Node objects; the others run on a
+        # compact grid, which they can write to without a per-node loop.
+        for name in simulators:
+            if name == "synchronous":
+                if size > 200:
+                    continue
+                surface = game_of_life_soup(size, compact = False)
+            else:
+                surface = game_of_life_soup(size, compact = True)
+            ticks, run_time = time_simulator(name, surface, update_rule,
+                                             game_of_life_ticks)
+            report(name, size * size, ticks, run_time)
+            if name != "synchronous":
+                ticks, run_time = time_simulator(
+                                        name, game_of_life_soup(size, True),
+                                        update_rule, game_of_life_ticks,
+                                        advance = True)
+                report(name + " (advance)", size * size, ticks, run_time)
+
+if __name__ == "__main__":
+    main()
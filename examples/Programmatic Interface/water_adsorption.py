@@ -256,44 +256,64 @@ class HexGridPlusIntersectionDisplay(HexGridDisplay):
     '''
     See documentation in surface_crns.views.grid_display.SurfaceDisplay for
     details on how to make a valid display class. Briefly, a SurfaceDisplay
-    needs to override the __init__, render, and update_node functions.
+    needs to override the __init__, render, update_node, and flush functions.
 
     This particular class subclasses the HexGridDisplay clas (in the
     same file as SurfaceDisplay; a lot of the display code is re-used from that.
-    In brief, this class uses the same rendering function as HexGridDisplay,
-    then draws another layer on top of that with the intersection nodes. The
-    only change between this class and HexGridDisplay is that this class has
-    an extended render function that knows how to handle intersection nodes.
+    HexGridDisplay notes changed nodes in update_node and draws them in flush
+    (which render also uses), so this class only changes flush and draw_node:
+    it draws the hex nodes the same way, then draws another layer on top of
+    that with the intersection nodes.
     '''
-    def update_node(self, node):
+    def flush(self):
         '''
-        This function should blit a single node, or otherwise do whatever is
-        required when a node changes state. This will be called whenever the
-        state of a node is changed, passing the node that changed.
+        Draw the nodes changed since the last flush. Returns the list of
+        rectangles of the parent surface that changed.
+
+        Intersection nodes sit on the corners of hex nodes, so they are drawn
+        after every hex node, and redrawn whenever a hex next to them is.
+        '''
+        hex_nodes = []
+        intersections = dict()
+        for node in self.dirty.values():
+            if node.is_intersection:
+                intersections[node] = node
+            else:
+                hex_nodes.append(node)
+                for n, weight in node.neighbors:
+                    if n.is_intersection:
+                        intersections[n] = n
+        self.dirty = dict()
+        return [self.draw_node(node).move(self.x_pos, self.y_pos)
+                for node in hex_nodes + list(intersections.values())]
+
+    def draw_node(self, node):
+        '''
+        Draw a single node: hex nodes as HexGridDisplay does, intersection
+        nodes as circles. Returns the rectangle drawn, relative to this
+        display.
 
         params:
-            node: The node that just changed state.
+            node: The node to draw.
         '''
-        if node.is_intersection:
-            center = self.get_center(node)
-            center = list(map(int, center))
-            radius = int(self.pixels_per_node[0] / 4)
-            node_color = self.colormap[node.state]
-            pygame.draw.circle(self.display_surface, node_color, center, radius)
-            pygame.draw.circle(self.display_surface, (0,0,0), center, radius,
-                               1)
-            if self.display_text:
-                node_text_surface = self.make_node_text(node)
-                text_rect = node_text_surface.get_rect()
-                text_rect.center = center
-                self.display_surface.blit(node_text_surface,
-                                          text_rect)
-        else:
-            super(HexGridPlusIntersectionDisplay, self).update_node(node)
-            for n, weight in node.neighbors:
-                if n.is_intersection:
-                    self.update_node(n)
-            # center = self.get_center(node)
+        if not node.is_intersection:
+            return super(HexGridPlusIntersectionDisplay, self).draw_node(node)
+        center = self.get_center(node)
+        center = list(map(int, center))
+        radius = int(self.pixels_per_node[0] / 4)
+        node_color = self.colormap[node.state]
+        rect = pygame.draw.circle(self.display_surface, node_color, center,
+                                  radius)
+        rect = rect.union(pygame.draw.circle(self.display_surface, (0,0,0),
+                                             center, radius, 1))
+        if self.display_text:
+            node_text_surface = self.make_node_text(node)
+            text_rect = node_text_surface.get_rect()
+            text_rect.center = center
+            self.display_surface.blit(node_text_surface,
+                                      text_rect)
+            rect = rect.union(text_rect)
+        return rect
 
     def get_center(self, node):
         '''
@@ -127,5 +127,8 @@ setup(
         'gui_scripts': [
             'SurfaceCRNQueueSimulator=surface_crns.SurfaceCRNQueueSimulator:main',
         ],
+        'console_scripts': [
+            'surface-crn-run=surface_crns.batch_runner:main',
+        ],
     },
 )
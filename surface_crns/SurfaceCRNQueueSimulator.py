@@ -23,9 +23,11 @@ from surface_crns.views.time_display import TimeDisplay
 from surface_crns.views.text_display import TextDisplay
 from surface_crns.views.grid_display import SquareGridDisplay, HexGridDisplay
 from surface_crns.views.legend_display import LegendDisplay
-from surface_crns.simulators.queue_simulator import QueueSimulator
-from surface_crns.simulators.synchronous_simulator import SynchronousSimulator
-from surface_crns.simulators.event_history import EventHistory
+from surface_crns.views.frame_pacer import FramePacer
+from surface_crns.simulators.simulator_factory import make_simulator
+from surface_crns.simulators.event_history import CompactEventHistory
+from surface_crns.simulators.event_producer import EventProducer, copy_surface
+from surface_crns.views.movie_renderer import FramePipe, find_ffmpeg
 from surface_crns.pygbutton import PygButton
 
 import cProfile
@@ -74,6 +76,8 @@ FRAME_SUBDIRECTORY = "frames"
 CUTOFF_TIME     = 600 # Cut off simulation at 10 minutes
 CUTOFF_SIZE     = 10000 * 500000 # Cut off simulation at roughly 1000 frames for
                                 # a typical image size.
+REPORT_INTERVAL = 5000 # With debug on, report throughput every 5 seconds.
+IDLE_WAIT       = 250  # While paused, check for input every 250 ms.
 
 #############
 # VARIABLES #
@@ -141,6 +145,8 @@ def simulate_surface_crn(manifest_filename, display_class = None,
                 os.mkdir(d)
         os.environ["SDL_VIDEODRIVER"] = "dummy"
         print("SDL_VIDEODRIVER set to 'dummy'")
+        # Fail now, rather than after the simulation, if there's no ffmpeg.
+        ffmpeg_name = find_ffmpeg()
     else:
         FRAME_DIRECTORY = ""
 
@@ -158,28 +164,36 @@ def simulate_surface_crn(manifest_filename, display_class = None,
             for x in range(grid.x_size):
                 for y in range(grid.y_size):
                     print("(" + str(x) + "," + str(y) + "): " + str(grid.grid[x,y]))
-        simulation = QueueSimulator(surface = grid,
-                                    transition_rules = opts.transition_rules,
-                                    seed = opts.rng_seed,
-                                    simulation_duration = opts.max_duration)
+        if opts.background_simulation and init_state is None and \
+           opts.capture_directory is None:
+            # Simulate on a copy of the grid in another thread, while this
+            # one displays the grid.
+            simulation = make_simulator(opts, surface = copy_surface(grid))
+            producer = EventProducer(simulation, grid)
+        else:
+            simulation = make_simulator(opts, surface = grid)
+            producer = None
         simulation.init_wall_time = process_time()
     elif opts.simulation_type == "synchronous":
-        simulation = SynchronousSimulator(
-                                    surface = grid,
-                                    update_rule = opts.update_rule,
-                                    seed = opts.rng_seed,
-                                    simulation_duration = opts.max_duration)
+        simulation = make_simulator(opts, surface = grid)
         simulation.init_wall_time = process_time()
+        producer = None
     else:
         raise Exception('Unknown simulation type "' + opts.simulation_type+'".')
     time = simulation.time
     seed = simulation.seed
-    event_history = EventHistory()
+    # Where new events come from: the simulator, or the thread running it.
+    event_source = producer if producer else simulation
+    event_history = CompactEventHistory(
+                                grid,
+                                keyframe_interval = opts.keyframe_interval,
+                                keyframe_time = opts.keyframe_time)
 
     if not opts.capture_directory is None:
         simulation.pixels_saved = 0
         simulation.frame_number = 0
         simulation.capture_time = 0
+        simulation.frame_pipe = None
 
     ################
     # PYGAME SETUP #
@@ -313,6 +327,7 @@ def simulate_surface_crn(manifest_filename, display_class = None,
         save_image_button.draw(display_surface)
 
     pygame.display.flip()
+    grid_display.flush()
     update_display(opts, simulation, FRAME_DIRECTORY)
 
     if "SDL_VIDEODRIVER" in os.environ:
@@ -330,6 +345,11 @@ def simulate_surface_crn(manifest_filename, display_class = None,
     last_frame  = False
     running_backward = False
 
+    last_report = 0 # When the simulator thread's throughput was reported.
+    # Paces live playback (see FramePacer); movie frames are evenly spaced.
+    pacer = FramePacer(opts.fps, opts.speedup_factor)
+    frame_events = 0 # Events shown in the current frame.
+
     # Resource limit flags
     terminate = False
     termination_string = ""
@@ -337,8 +357,13 @@ def simulate_surface_crn(manifest_filename, display_class = None,
     print("Beginning simulation....")
     # Iterate through events
     while True:
-        # Check for interface events
-        for event in pygame.event.get():
+        # Check for interface events. While paused or finished, there's
+        # nothing else to do, so wait for some rather than spinning.
+        if running:
+            events = pygame.event.get()
+        else:
+            events = [pygame.event.wait(IDLE_WAIT)] + pygame.event.get()
+        for event in events:
             if 'click' in play_back_button.handleEvent(event):
                 running = True
                 running_backward = True
@@ -350,7 +375,8 @@ def simulate_surface_crn(manifest_filename, display_class = None,
                     time = 0
                     time_display.time = 0
                     time_display.render(display_surface, x_pos = 0, y_pos = 0)
-                    pygame.display.update()
+                    update_display(opts, simulation, FRAME_DIRECTORY,
+                                   changed_rects(grid_display, time_display))
                 else:
                     prev_reaction = event_history.previous_event()
                     event_history.increment_event(-1)
@@ -372,7 +398,8 @@ def simulate_surface_crn(manifest_filename, display_class = None,
                         time = event_history.previous_event().time
                     time_display.time = time
                     time_display.render(display_surface, x_pos = 0, y_pos = 0)
-                    pygame.display.update()
+                    update_display(opts, simulation, FRAME_DIRECTORY,
+                                   changed_rects(grid_display, time_display))
             if 'click' in pause_button.handleEvent(event):
                 running = False
             if 'click' in step_button.handleEvent(event):
@@ -390,7 +417,7 @@ def simulate_surface_crn(manifest_filename, display_class = None,
                         state = next_reaction_rule.outputs[i]
                         cell.state = state
                 if not next_reaction:
-                    next_reaction = simulation.process_next_reaction()
+                    next_reaction = event_source.process_next_reaction()
                     if not reading_history:
                         event_history.add_event(next_reaction)
                         event_history.increment_event(1)
@@ -400,7 +427,8 @@ def simulate_surface_crn(manifest_filename, display_class = None,
                     time = next_reaction_time
                     time_display.time = time
                     time_display.render(display_surface, x_pos = 0, y_pos = 0)
-                    pygame.display.update()
+                    update_display(opts, simulation, FRAME_DIRECTORY,
+                                   changed_rects(grid_display, time_display))
                     next_reaction = None
                     if opts.debug:
                         print("State after update: " + str(grid))
@@ -410,11 +438,16 @@ def simulate_surface_crn(manifest_filename, display_class = None,
                 first_frame = False
             if 'click' in clip_button.handleEvent(event):
                 event_history.clip()
-                simulation.time = time
-                simulation.reset()
-                for rxn in list(simulation.event_queue):
-                    print(rxn)
+                if producer:
+                    producer.restart(time)
+                else:
+                    simulation.time = time
+                    simulation.reset()
+                    for rxn in list(simulation.event_queue):
+                        print(rxn)
             if 'click' in save_image_button.handleEvent(event):
+                update_display(opts, simulation, FRAME_DIRECTORY,
+                               changed_rects(grid_display, time_display))
                 base_name = \
                     manifest_filename.split(os.path.sep)[-1].split(".")[0]
                 save_name = base_name + "_snapshot.png"
@@ -435,10 +468,12 @@ def simulate_surface_crn(manifest_filename, display_class = None,
                 if opts.saving_movie:
                     movie_file.close()
                 current_state = FINISHED_CLEAN
-                cleanup_and_exit(simulation, current_state)
+                cleanup_and_exit(simulation, grid, time, current_state)
         # Don't do anything if paused.
         if not running:
-            pygame.display.update()
+            pacer.pause()
+            update_display(opts, simulation, FRAME_DIRECTORY,
+                           changed_rects(grid_display, time_display))
             continue
 
         # Update time
@@ -446,13 +481,19 @@ def simulate_surface_crn(manifest_filename, display_class = None,
             print(f"Updating time: time = {time}, running_backward = "
                   f"{running_backward}, first_frame = {first_frame}, "
                   f"last_frame = {last_frame}")
+        if real_time:
+            time_step = pacer.time_step(frame_events)
+            time_display.status = pacer.status()
+        else:
+            time_step = opts.speedup_factor * 1./opts.fps
+        frame_events = 0
         if running_backward and not first_frame:
             #prev_reaction_time = time
-            time -= opts.speedup_factor * 1./opts.fps
+            time -= time_step
             last_frame = False
         elif not running_backward and not last_frame:
             #next_reaction_time = time
-            time += opts.speedup_factor * 1./opts.fps
+            time += time_step
             first_frame = False
         if opts.debug:
             print(f"Updating time to {time}")
@@ -468,34 +509,26 @@ def simulate_surface_crn(manifest_filename, display_class = None,
                 print(f"While running backwards, checking if there are any "
                       f"events: time = {time}, previous event time = "
                       f"{event_history.previous_event().time}")
-            while not event_history.at_beginning() and \
-             event_history.previous_event().time > time:
+            # Jump back to the last event at or before the new time, by way
+            # of the nearest keyframe if that's quicker than undoing events.
+            if not event_history.at_beginning() and \
+               event_history.previous_event().time > time:
+                start_idx = event_history.idx
+                for node in event_history.seek(time):
+                    grid_display.update_node(node)
+                frame_events += start_idx - event_history.idx
                 prev_reaction = event_history.previous_event()
-                if event_history.at_beginning():
-                    first_frame = True
-                event_history.increment_event(-1)
-                # if opts.debug:
-                #     print("While running backwards, undoing reaction: "
-                #           f"{prev_reaction}")
-                for i in range(len(prev_reaction.participants)):
-                    cell  = prev_reaction.participants[i]
-                    state = prev_reaction.rule.inputs[i]
-                    cell.state = state
-                next_reaction_time = prev_reaction_time
                 prev_reaction_time = prev_reaction.time if prev_reaction \
                                                         else 0
+                next_reaction_time = event_history.next_event().time
                 if opts.debug:
-                    print("Displaying a new event")
-                display_next_event(prev_reaction, grid_display)
-                if opts.debug and not event_history.at_beginning():
-                    print(f"While running backwards, checking if there are any "
-                      f"events: time = {time}, previous event time = "
-                      f"{event_history.previous_event().time}")
+                    print(f"Ran backwards to event {event_history.idx}, "
+                          f"time = {prev_reaction_time}")
         elif not running_backward and not last_frame:
-            while (not event_history.at_end() or not simulation.done()) \
+            while (not event_history.at_end() or not event_source.done()) \
                and next_reaction_time < time:
                 if event_history.at_end():
-                    next_reaction = simulation.process_next_reaction()
+                    next_reaction = event_source.process_next_reaction()
                     if next_reaction:
                         event_history.add_event(next_reaction)
                         event_history.increment_event(1)
@@ -513,17 +546,24 @@ def simulate_surface_crn(manifest_filename, display_class = None,
                 if opts.debug:
                     print("Displaying a new event")
                 display_next_event(next_reaction, grid_display)
+                frame_events += 1
 
         # Render updates and make the next clock tick.
         if opts.debug:
             print("Updating display.")
-        update_display(opts, simulation, FRAME_DIRECTORY)
+        update_display(opts, simulation, FRAME_DIRECTORY,
+                       changed_rects(grid_display, time_display))
         if real_time:
             fpsClock.tick(opts.fps)
+        if producer and opts.debug and \
+           pygame.time.get_ticks() - last_report > REPORT_INTERVAL:
+            report_throughput(producer, fpsClock, real_time)
+            last_report = pygame.time.get_ticks()
 
         # Movie-capturing termination conditions
         if not opts.capture_directory is None:
-            if simulation.pixels_saved > CUTOFF_SIZE:
+            if opts.capture_mode == "png" and \
+               simulation.pixels_saved > CUTOFF_SIZE:
                 termination_string = "Simulation terminated after " + \
                                      str(simulation.pixels_saved) + \
                                      " pixels saved (~" + \
@@ -549,6 +589,20 @@ def simulate_surface_crn(manifest_filename, display_class = None,
                 text_display = TextDisplay(width)
                 text_display.text = termination_string
                 text_display.render(display_surface, x_pos = 0, y_pos = 0)
+                if opts.capture_mode == "pipe":
+                    if opts.debug:
+                        print("Sending final frame to ffmpeg.")
+                    pipe = open_frame_pipe(opts, simulation)
+                    pipe.write(frame_bytes(display_surface))
+                    simulation.frame_pipe = None
+                    if pipe.close() != 0:
+                        raise Exception("ffmpeg failed to write the movie. "
+                                        "See " + os.path.join(DEBUG_DIRECTORY,
+                                        "ffmpeg_debug.dbg") + " for details.")
+                    if opts.debug:
+                        print("Finished ffmpeg call.")
+                    cleanup_and_exit(simulation, grid, time, current_state)
+
                 frame_filename = os.path.join(FRAME_DIRECTORY,
                             f"{opts.movie_title}_{simulation.frame_number}.png")
                 if opts.debug:
@@ -556,23 +610,6 @@ def simulate_surface_crn(manifest_filename, display_class = None,
                 pygame.image.save(display_surface, frame_filename)
 
                 # Use ffmpeg to convert images to movie.
-                if os.name == 'nt':
-                    ffmpeg_name = 'ffmpeg.exe'
-                elif os.name == 'posix':
-                    # ffmpeg_name = 'ffmpeg'
-                    name_found = False
-                    for possible_name in ['/usr/local/bin/ffmpeg',
-                                          '/usr/bin/ffmpeg']:
-                        if os.path.isfile(possible_name):
-                            ffmpeg_name = possible_name  # EW: not finding it?
-                            name_found = True
-                            break
-                    if not name_found:
-                        raise Exception("Could not find executable ffmpeg in"
-                                        " any of the expected locations!")
-                else:
-                    raise Exception("Unexpected OS name '" + os.name + "'")
-
                 signal(SIGPIPE, SIG_DFL)
                 # width = display_surface.get_width()
                 # height = display_surface.get_height()
@@ -617,16 +654,25 @@ def simulate_surface_crn(manifest_filename, display_class = None,
                 if opts.debug:
                     print("Finished ffmpeg call.")
 
-                cleanup_and_exit(simulation, current_state)
+                cleanup_and_exit(simulation, grid, time, current_state)
 
         # Live termination conditions
         if opts.debug:
             print("Checking for simulation completion...")
         if (event_history.at_end() and running and not running_backward and \
-           (simulation.done() or time > opts.max_duration)) \
+           (event_source.done() or time > opts.max_duration)) \
            or terminate:
             if opts.debug:
                 print("Done! Cleaning up now.")
+            if producer and running:
+                report_throughput(producer, fpsClock, real_time)
+            period = getattr(simulation, "period", None)
+            if period == 1:
+                print("Simulation reached a fixed point at T = " +
+                      str(simulation.cycle_start) + ".")
+            elif period is not None:
+                print("Simulation entered a cycle of period " + str(period) +
+                      " at T = " + str(simulation.cycle_start) + ".")
             last_frame = True
             running = False
             # Set the time to final time when done.
@@ -636,7 +682,8 @@ def simulate_surface_crn(manifest_filename, display_class = None,
                                 y_pos = 0)#opts_menu.display_height)
             if next_reaction:
                 display_next_event(next_reaction, grid_display)
-            update_display(opts, simulation, FRAME_DIRECTORY)
+            update_display(opts, simulation, FRAME_DIRECTORY,
+                           changed_rects(grid_display, time_display))
             if opts.debug:
                 print("Simulation state at final time " + \
                       str(opts.max_duration) + ":")
@@ -686,17 +733,56 @@ def display_next_event(next_reaction, grid_display):
 
     return next_reaction_time
 
-def cleanup_and_exit(simulation, current_state):
+def report_throughput(producer, fpsClock, real_time):
+    '''
+    Print how fast the simulator thread and the display are going.
+    '''
+    report = producer.report()
+    if real_time:
+        report += " Display: %.1f frames/s." % fpsClock.get_fps()
+    print(report)
+
+def cleanup_and_exit(simulation, grid, time, current_state):
+    '''
+    Prints the displayed surface (grid) at the displayed time, and exits.
+    With a background simulator, simulation's own surface and time may be
+    well ahead of what is on screen.
+    '''
+    # Let ffmpeg finish any movie that frames were being sent to.
+    pipe = getattr(simulation, "frame_pipe", None)
+    if pipe is not None:
+        pipe.close()
     pygame.quit()
     print("Program terminated before simulation comlete.")
-    print("Simulation state at termination (T = " + str(simulation.time) + "):")
-    print(str(simulation.surface))
+    print("Simulation state at termination (T = " + str(time) + "):")
+    print(str(grid))
     sys.exit(current_state)
 
-def update_display(opts, simulation, FRAME_DIRECTORY = None):
+def changed_rects(grid_display, time_display):
+    '''
+    Draws any pending node updates, and returns the list of rectangles of the
+    window that changed this frame, or None if the whole window should be
+    sent to the screen.
+    '''
+    rects = grid_display.flush()
+    if rects is None:
+        return None
+    return rects + [pygame.Rect(time_display.x_pos, time_display.y_pos,
+                                time_display.display_width,
+                                time_display.display_height)]
+
+def update_display(opts, simulation, FRAME_DIRECTORY = None,
+                   dirty_rects = None):
+    '''
+    Sends the window to the screen, or captures it as a movie frame if a
+    capture directory is set. If dirty_rects is given, only those rectangles
+    of the window are sent to the screen.
+    '''
     if opts.capture_directory is None:
-        pygame.display.update()
-        pygame.display.flip()
+        if dirty_rects is None:
+            pygame.display.update()
+        else:
+            pygame.display.update(dirty_rects)
     else:
         if FRAME_DIRECTORY is None:
             raise Exception("FRAME_DIRECTORY should be set if a capture" +
@@ -716,22 +802,57 @@ def update_display(opts, simulation, FRAME_DIRECTORY = None):
         if simulation.time >= capture_time:
             if opts.debug:
                 print("movie title is: " + str(opts.movie_title))
-            frame_filename = os.path.join(FRAME_DIRECTORY, opts.movie_title
-                                          + "_" + str(frame_number) +
-                                          ".png")
-            if opts.debug:
-                print("Saving frame at: " + frame_filename)
-            pygame.image.save(simulation.display_surface, frame_filename)
+            if opts.capture_mode == "pipe":
+                if opts.debug:
+                    print("Sending frame " + str(frame_number) + " to ffmpeg.")
+                pipe = open_frame_pipe(opts, simulation)
+                pipe.write(frame_bytes(simulation.display_surface))
+            else:
+                frame_filename = os.path.join(FRAME_DIRECTORY, opts.movie_title
+                                              + "_" + str(frame_number) +
+                                              ".png")
+                if opts.debug:
+                    print("Saving frame at: " + frame_filename)
+                pygame.image.save(simulation.display_surface, frame_filename)
+
+                # Add to space used.
+                try:
+                    simulation.pixels_saved += simulation.display_surface_size
+                except AttributeError:
+                    simulation.pixels_saved = simulation.display_surface_size
 
             # Determine next capture time
             simulation.capture_time = capture_time + 1./opts.capture_rate
             simulation.frame_number = frame_number + 1
 
-            # Add to space used.
-            try:
-                simulation.pixels_saved += simulation.display_surface_size
-            except AttributeError:
-                simulation.pixels_saved = simulation.display_surface_size
+def open_frame_pipe(opts, simulation):
+    '''
+    Returns the FramePipe that captured frames are sent to, starting ffmpeg
+    the first time it's called.
+    '''
+    pipe = getattr(simulation, "frame_pipe", None)
+    if pipe is None:
+        movie_filename = os.path.join(opts.capture_directory,
+                                      opts.movie_title + ".mp4")
+        log_filename = os.path.join(opts.capture_directory,
+                                    DEBUG_SUBDIRECTORY, "ffmpeg_debug.dbg")
+        width, height = simulation.display_surface.get_size()
+        if opts.debug:
+            print("Writing movie to file " + movie_filename)
+        # Frames are played at ffmpeg's default rate, as with saved PNGs.
+        pipe = FramePipe(find_ffmpeg(), movie_filename, width, height,
+                         fps = 25, log = open(log_filename, 'w'))
+        simulation.frame_pipe = pipe
+    return pipe
+
+def frame_bytes(display_surface):
+    '''
+    Returns the pixels of a surface as RGB bytes, row by row.
+    '''
+    try:
+        return pygame.image.tobytes(display_surface, "RGB")
+    except AttributeError: # pygame < 2.1.3
+        return pygame.image.tostring(display_surface, "RGB")
 
 if __name__ == '__main__':
     if PROFILE:
@@ -1,11 +1,42 @@
-from surface_crns.constants import COLOR_CLASSES
-from surface_crns.random_color import generate_new_color
-from surface_crns.base import *
-from surface_crns.models import *
-from surface_crns.profiling import *
-from surface_crns.readers import *
-from surface_crns.simulators import *
-from surface_crns.views import *
+'''
+Simulation of chemical reaction networks on a surface.
+
+Nothing is imported until it's first used (PEP 562): "import surface_crns"
+is cheap, and surface_crns.models, surface_crns.SurfaceCRNQueueSimulator,
+etc. are imported when first looked up. The modules of base, models,
+profiling, readers, simulators, and views can also be found directly as
+attributes of surface_crns (surface_crns.grids, say), as they could when this
+package imported all of them up front.
+'''
+import importlib
+from surface_crns.lazy_import import lazy_submodules
 __all__ = ['base', 'models', 'profiling', 'readers', 'simulators', 'views',
             'SurfaceCRNQueueSimulator']
-__version__ = "v1.2"
\ No newline at end of file
+__version__ = "v1.2"
+
+# Attributes defined in submodules, by the submodule defining them.
+_ATTRIBUTES = {"COLOR_CLASSES": "constants",
+               "generate_new_color": "random_color"}
+_FLATTENED_PACKAGES = ['base', 'models', 'profiling', 'readers', 'simulators',
+                       'views']
+_submodule = lazy_submodules(__name__)
+
+def __getattr__(name):
+    if name in _ATTRIBUTES:
+        module = importlib.import_module(__name__ + "." + _ATTRIBUTES[name])
+        value = getattr(module, name)
+    else:
+        try:
+            return _submodule(name)
+        except AttributeError:
+            pass
+        for package in _FLATTENED_PACKAGES:
+            if name in importlib.import_module(__name__ + "." + package).__all__:
+                value = importlib.import_module(__name__ + "." + package + "." +
+                                                name)
+                break
+        else:
+            raise AttributeError("module '" + __name__ + "' has no " +
+                                 "attribute '" + name + "'")
+    globals()[name] = value
+    return value
\ No newline at end of file
@@ -0,0 +1,199 @@
+'''
+Runs a surface CRN without a GUI, writing snapshots of the surface and counts
+of each species.
+
+Usage: surface-crn-run -m <manifest> [--until T] [--snapshot-every dt]
+                       [--out <directory>] [--counts-only]
+
+Reads the manifest, runs the simulator it describes up to time T (the
+manifest's max_duration by default), and writes, to the output directory:
+    * <name>_T=<t>.csv, the state of every node at each snapshot time t, in
+      the same format as init_state files (one row per row of the grid, states
+      separated by commas), so a snapshot can be used to start another run;
+    * <name>_counts.csv, the number of nodes in each state at each snapshot
+      time.
+Snapshots are taken every dt time units from time 0, and at time T. Nothing
+from surface_crns.views (and so neither pygame nor SDL) is imported.
+'''
+
+import os
+import sys
+import math
+import optparse
+from time import process_time
+import numpy as np
+
+from surface_crns.readers.manifest_readers import read_manifest
+from surface_crns.options.option_processor import SurfaceCRNOptionParser
+from surface_crns.simulators.simulator_factory import make_simulator
+
+def main():
+    available_options = optparse.OptionParser(
+            usage = "%prog -m <manifest> [options]",
+            description = "Run a surface CRN without a GUI, writing "
+                          "snapshots of its state and counts of its species.")
+    available_options.add_option("-m", "--manifest", action = "store",
+                                 type = "string", dest = "manifest_filename",
+                                 help = "points to a manifest file to simulate")
+    available_options.add_option("--until", action = "store", type = "float",
+                                 dest = "until", default = None,
+                                 help = "time to simulate to (default: the "
+                                        "manifest's max_duration)")
+    available_options.add_option("--snapshot-every", action = "store",
+                                 type = "float", dest = "snapshot_every",
+                                 default = None,
+                                 help = "time between snapshots (default: only "
+                                        "snapshot the final state)")
+    available_options.add_option("--out", action = "store", type = "string",
+                                 dest = "out", default = ".",
+                                 help = "directory to write snapshots and "
+                                        "counts to (default: the current "
+                                        "directory)")
+    available_options.add_option("--counts-only", action = "store_true",
+                                 dest = "counts_only", default = False,
+                                 help = "only write species counts, not "
+                                        "snapshots")
+    (command_line_options, args) = available_options.parse_args(sys.argv[1:])
+    manifest_filename = command_line_options.manifest_filename
+    if not manifest_filename:
+        raise Exception("Manifest file required (use the flag -m <filename>, " +
+                        "where <filename> is the name of your manifest file)")
+    run_batch(manifest_filename,
+              until = command_line_options.until,
+              snapshot_every = command_line_options.snapshot_every,
+              out_directory = command_line_options.out,
+              write_snapshots = not command_line_options.counts_only)
+
+def run_batch(manifest_filename, until = None, snapshot_every = None,
+              out_directory = ".", write_snapshots = True):
+    '''
+    Simulate the surface CRN described by a manifest file up to time until
+    (the manifest's max_duration if None), writing snapshots and species
+    counts every snapshot_every time units, and at time until, to
+    out_directory. Returns the number of events (for synchronous
+    simulations, ticks) computed.
+    '''
+    opts = SurfaceCRNOptionParser(read_manifest(manifest_filename))
+    if opts.grid is None:
+        raise Exception("Initial grid state required.")
+    if until is None:
+        until = opts.max_duration
+    snapshot_times = get_snapshot_times(until, snapshot_every)
+    if not os.path.isdir(out_directory):
+        os.makedirs(out_directory)
+    base_name = os.path.splitext(os.path.basename(manifest_filename))[0]
+    base_name = os.path.join(out_directory, base_name)
+    simulator = make_simulator(opts, duration = until)
+    counts = []
+    def take_snapshot(t, state):
+        if write_snapshots:
+            write_snapshot(base_name + "_T=" + format_time(t) + ".csv", state)
+        states, state_counts = np.unique(state, return_counts = True)
+        counts.append((t, dict(zip(states.tolist(), state_counts.tolist()))))
+
+    start_time = process_time()
+    if opts.simulation_type == "asynchronous":
+        n_events = run_asynchronous(simulator, snapshot_times, take_snapshot)
+        work = str(n_events) + " events"
+    else:
+        n_events = run_synchronous(simulator, snapshot_times, take_snapshot)
+        work = str(n_events) + " ticks computed"
+    write_counts(base_name + "_counts.csv", counts)
+    print("Simulated to T = " + format_time(until) + " (" + work + ") in " +
+          "%.2f" % (process_time() - start_time) + " seconds.")
+    return n_events
+
+def run_asynchronous(simulator, snapshot_times, take_snapshot):
+    '''
+    Run an asynchronous simulator, calling take_snapshot(t, state) with the
+    state of the surface at each time t in snapshot_times (in order). Returns
+    the number of events simulated.
+    '''
+    n_events = 0
+    t_idx = 0
+    while t_idx < len(snapshot_times) and not simulator.done():
+        event = simulator.process_next_reaction()
+        if event is None:
+            break
+        n_events += 1
+        if event.time <= snapshot_times[t_idx]:
+            continue
+        # The event happened after the next snapshot time, so the surface as
+        # it was before the event is the state at that time.
+        state = simulator.surface.get_global_state()
+        for node, state_before in zip(event.participants, event.rule.inputs):
+            state[node.position] = state_before
+        while t_idx < len(snapshot_times) and \
+              snapshot_times[t_idx] < event.time:
+            take_snapshot(snapshot_times[t_idx], state)
+            t_idx += 1
+    state = simulator.surface.get_global_state()
+    for t in snapshot_times[t_idx:]:
+        take_snapshot(t, state)
+    return n_events
+
+def run_synchronous(simulator, snapshot_times, take_snapshot):
+    '''
+    Run a synchronous simulator, calling take_snapshot(t, state) with the
+    state of the surface at each time t in snapshot_times (in order). The
+    state at time t is the state after floor(t) ticks. Returns the number of
+    ticks computed, which leaves out any the simulator skipped over once the
+    surface stopped changing or started repeating itself.
+    '''
+    start_ticks = simulator.ticks_computed
+    for t in snapshot_times:
+        ticks = int(math.floor(t)) - simulator.time
+        if ticks > 0 and hasattr(simulator, "advance"):
+            simulator.advance(ticks)
+        else:
+            while simulator.time <= t - 1 and not simulator.done():
+                simulator.process_next_reaction()
+        take_snapshot(t, simulator.surface.get_global_state())
+    return simulator.ticks_computed - start_ticks
+
+def get_snapshot_times(until, snapshot_every = None):
+    '''
+    Returns the times of snapshots: every snapshot_every time units from 0,
+    and until.
+    '''
+    if snapshot_every is None:
+        return [until]
+    if snapshot_every <= 0:
+        raise Exception("Time between snapshots must be positive, not " +
+                        str(snapshot_every) + ".")
+    times = [k * snapshot_every
+             for k in range(int(math.floor(until / snapshot_every)) + 1)]
+    if times[-1] < until:
+        times.append(until)
+    return times
+
+def format_time(t):
+    return "%g" % t
+
+def write_snapshot(filename, state):
+    '''
+    Write an (x_size, y_size) array of states to a file in init_state format.
+    '''
+    with open(filename, 'w') as outfile:
+        for y in range(state.shape[1]):
+            outfile.write(",".join(str(s) for s in state[:, y]) + "\n")
+
+def write_counts(filename, counts):
+    '''
+    Write a CSV of the number of nodes in each state at each time, from a list
+    of (time, {state: count}) pairs.
+    '''
+    species = []
+    for _, time_counts in counts:
+        for state in time_counts:
+            if state not in species:
+                species.append(state)
+    with open(filename, 'w') as outfile:
+        outfile.write(",".join(["time"] + [str(s) for s in species]) + "\n")
+        for t, time_counts in counts:
+            outfile.write(",".join([format_time(t)] +
+                                   [str(time_counts.get(s, 0))
+                                    for s in species]) + "\n")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+import importlib
+
+def lazy_submodules(package_name):
+    '''
+    Returns a module-level __getattr__ (see PEP 562) for the package named
+    package_name, which imports the package's submodules the first time they
+    are used as attributes of the package. Importing the package then imports
+    nothing else, so that, e.g., "import surface_crns.readers as readers"
+    followed by readers.manifest_readers works, but only pays for the readers
+    it uses.
+    '''
+    def __getattr__(name):
+        if not name.startswith("_"):
+            module_name = package_name + "." + name
+            try:
+                return importlib.import_module(module_name)
+            except ModuleNotFoundError as error:
+                if error.name != module_name:
+                    raise
+        raise AttributeError("module '" + package_name + "' has no " +
+                             "attribute '" + name + "'")
+    return __getattr__
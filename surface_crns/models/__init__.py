@@ -1 +1,3 @@
-__all__ = ["grids", "emulated_grid"]
\ No newline at end of file
+from surface_crns.lazy_import import lazy_submodules
+__all__ = ["grids", "emulated_grid", "compact_grids"]
+__getattr__ = lazy_submodules(__name__)
\ No newline at end of file
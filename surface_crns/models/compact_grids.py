@@ -0,0 +1,348 @@
+import numpy as np
+import warnings
+
+class SpeciesTable(object):
+    '''
+    Interns chemical species (state strings) as small integer codes.
+
+    Codes are handed out in order of first appearance and never change, so an
+    array of codes stays valid when new species are added later on.
+    '''
+    def __init__(self, species = None):
+        self.species = []
+        self.codes   = dict()
+        if species is not None:
+            for state in species:
+                self.intern(state)
+
+    def intern(self, state):
+        '''
+        Returns the code for state, assigning a new one if state has not been
+        seen before.
+        '''
+        try:
+            return self.codes[state]
+        except KeyError:
+            code = len(self.species)
+            self.species.append(str(state))
+            self.codes[state] = code
+            return code
+
+    def intern_array(self, states):
+        '''
+        Returns a numpy array of codes with the same shape as the array of
+        state strings states.
+        '''
+        states = np.asarray(states, dtype = object)
+        unique_states, inverse = np.unique(states, return_inverse = True)
+        unique_codes = np.array([self.intern(s) for s in unique_states],
+                                dtype = np.int64)
+        return unique_codes[inverse].reshape(states.shape)
+
+    def code_dtype(self):
+        '''
+        The smallest unsigned integer type that can hold every code.
+        '''
+        if len(self.species) <= np.iinfo(np.uint8).max + 1:
+            return np.dtype(np.uint8)
+        elif len(self.species) <= np.iinfo(np.uint16).max + 1:
+            return np.dtype(np.uint16)
+        return np.dtype(np.uint32)
+
+    def state_array(self):
+        '''
+        Object array mapping codes to state strings, for fancy-indexing.
+        '''
+        lookup = np.empty(len(self.species), dtype = object)
+        lookup[:] = self.species
+        return lookup
+
+    def __len__(self):
+        return len(self.species)
+
+    def __getitem__(self, code):
+        return self.species[code]
+
+    def __contains__(self, state):
+        return state in self.codes
+#end class SpeciesTable
+
+
+class CompactNode(object):
+    '''
+    Lightweight view of a single node of a compact grid. Behaves like a
+    surface_crns.base.node.Node (state, timestamp, neighbors, position), but
+    reads and writes straight through to the grid's arrays, so views can be
+    created and thrown away freely. Two views compare equal iff they refer to
+    the same node of the same grid.
+    '''
+    __slots__ = ('surface', 'index')
+
+    def __init__(self, surface, index):
+        self.surface = surface
+        self.index   = index
+
+    def get_state(self):
+        return self.surface.species.species[self.surface.states[self.index]]
+
+    def set_state(self, value):
+        self.surface.set_code(self.index, self.surface.species.intern(value))
+
+    state = property(get_state, set_state)
+
+    def get_timestamp(self):
+        return float(self.surface.timestamps[self.index])
+
+    def set_timestamp(self, value):
+        self.surface.timestamps[self.index] = value
+
+    timestamp = property(get_timestamp, set_timestamp)
+
+    @property
+    def neighbors(self):
+        surface = self.surface
+        return [(CompactNode(surface, int(j)), surface.offset_weights[k])
+                for k, j in enumerate(surface.neighbor_index[self.index])
+                if j >= 0]
+
+    @property
+    def position(self):
+        return divmod(self.index, self.surface.y_size)
+
+    def __eq__(self, other):
+        return isinstance(other, CompactNode) and \
+               self.index == other.index and self.surface is other.surface
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.index)
+
+    def __str__(self):
+        neighbors = self.neighbors
+        str_rep = "<State: " + self.state + " (updated at time " + \
+            str(self.timestamp) + ")"
+        if len(neighbors) > 0:
+            str_rep += "; neighbor states: "
+            str_rep += ", ".join(neighbor.state for neighbor, _ in neighbors)
+        else:
+            str_rep += "; No neighbors"
+        str_rep += "; Position: " + str(self.position)
+        str_rep += ">"
+        return str_rep
+
+    def __repr__(self):
+        return str(self)
+#end class CompactNode
+
+
+class CompactSquareGrid(object):
+    '''
+    Array-backed drop-in replacement for surface_crns.models.grids.SquareGrid.
+
+    Instead of one Node object per cell, states are interned to integer codes
+    (see SpeciesTable) and the grid keeps three contiguous arrays, indexed by
+    node number i = x * y_size + y:
+        states:         node state codes (uint8, widened automatically to
+                        uint16/uint32 when more species appear)
+        timestamps:     float64 time of each node's last update
+        neighbor_index: int32 array of shape (nodes, max degree) holding the
+                        node numbers of each node's neighbors, or -1 where a
+                        neighbor does not exist (e.g. on the edge of an
+                        unwrapped grid). Column k has weight offset_weights[k].
+
+    Iterating over the grid, getnode, and the "grid" attribute produce
+    CompactNode views, so simulators and displays written against SquareGrid
+    work unchanged.
+
+    Params:
+        x_size, y_size: The number of cells in the x and y dimensions,
+                        respectively.
+        wrap: Iff true, the grid will wrap top to bottom and left to right.
+                Default false.
+    '''
+    def __init__(self, x_size, y_size, wrap = False):
+        if not isinstance(x_size, int) or not isinstance(y_size, int):
+            raise TypeError("SimGrid dimensions must be integers")
+        self.x_size  = x_size
+        self.y_size  = y_size
+        self.wrap    = wrap
+        self.species = SpeciesTable()
+        self.populate_grid()
+
+    def neighbor_offsets(self, ys):
+        '''
+        Returns a list of (dx, dy, weight) neighbor offsets, in the same order
+        that SquareGrid adds neighbors. dx may be an array over the nodes with
+        y-coordinates ys, for geometries whose connectivity depends on the row.
+        '''
+        return [(-1, 0, 1), (1, 0, 1), (0, -1, 1), (0, 1, 1)]
+
+    def populate_grid(self):
+        '''
+        Set/reset all nodes to the empty state and rebuild the neighbor
+        arrays. Should only be used by initialization and set routines.
+        '''
+        self.species.intern("")
+        n_nodes = self.x_size * self.y_size
+        self.states     = np.zeros(n_nodes, dtype = self.species.code_dtype())
+        self.timestamps = np.zeros(n_nodes, dtype = np.float64)
+
+        xs, ys  = np.divmod(np.arange(n_nodes, dtype = np.int64), self.y_size)
+        offsets = self.neighbor_offsets(ys)
+        self.neighbor_index = np.full((n_nodes, len(offsets)), -1,
+                                      dtype = np.int32)
+        self.offset_weights = [weight for _, _, weight in offsets]
+        for k, (dx, dy, weight) in enumerate(offsets):
+            nx = xs + dx
+            ny = ys + dy
+            if self.wrap:
+                nx %= self.x_size
+                ny %= self.y_size
+                valid = np.ones(n_nodes, dtype = bool)
+            else:
+                valid = (nx >= 0) & (nx < self.x_size) & \
+                        (ny >= 0) & (ny < self.y_size)
+            self.neighbor_index[valid, k] = (nx * self.y_size + ny)[valid]
+
+    def set_code(self, index, code):
+        '''
+        Set the state code of node number index, widening the state array if
+        the code doesn't fit.
+        '''
+        if code > np.iinfo(self.states.dtype).max:
+            self.states = self.states.astype(self.species.code_dtype())
+        self.states[index] = code
+
+    def set_state_codes(self, codes):
+        '''
+        Set the states of all nodes from an array of codes (in node-number
+        order, or with shape (x_size, y_size)). Does not touch timestamps.
+        '''
+        dtype = self.species.code_dtype()
+        if dtype.itemsize > self.states.dtype.itemsize:
+            self.states = self.states.astype(dtype)
+        self.states[:] = np.asarray(codes).ravel()
+
+    def clear_timestamps(self):
+        '''
+        Set the timestamps of all nodes in the grid to 0.
+        '''
+        self.timestamps[:] = 0
+
+    def set_global_state(self, state_grid):
+        '''
+        Set the states of nodes using a 2D array or numpy array of state
+        strings. Also resets timestamps.
+        '''
+        if isinstance(state_grid, list):
+            state_grid = np.array(state_grid)
+        if state_grid.shape != (self.x_size, self.y_size):
+            warnings.warn(Warning("State grid set to state with different " +
+                         "size than previously set. Changing size."))
+            self.x_size = state_grid.shape[0]
+            self.y_size = state_grid.shape[1]
+            self.populate_grid()
+        self.set_state_codes(self.species.intern_array(state_grid))
+        self.clear_timestamps()
+
+    def get_global_state(self):
+        '''
+        Get the global state of nodes as a 2D numpy array of strings.
+        '''
+        return self.species.state_array()[self.states].reshape(
+                                                    (self.x_size, self.y_size))
+
+    def get_state_codes(self):
+        '''
+        Get the global state of nodes as a 2D (x_size, y_size) view of the
+        state code array.
+        '''
+        return self.states.reshape((self.x_size, self.y_size))
+
+    def node_index(self, x, y):
+        return x * self.y_size + y
+
+    def getnode(self, x, y):
+        return CompactNode(self, self.node_index(x, y))
+
+    @property
+    def grid(self):
+        '''
+        Object array of node views, for code written against SquareGrid.grid.
+        Builds one view per node, so avoid it on large grids.
+        '''
+        nodes = np.empty((self.x_size, self.y_size), np.dtype(object))
+        for x in range(self.x_size):
+            for y in range(self.y_size):
+                nodes[x, y] = self.getnode(x, y)
+        return nodes
+
+    def nbytes(self):
+        '''
+        Number of bytes used by the grid's per-node arrays.
+        '''
+        return self.states.nbytes + self.timestamps.nbytes + \
+               self.neighbor_index.nbytes
+
+    def __iter__(self):
+        # Same order as SquareGridIterator: x varies fastest.
+        for y in range(self.y_size):
+            for x in range(self.x_size):
+                yield CompactNode(self, x * self.y_size + y)
+
+    def iteration_order(self):
+        '''
+        Returns an array of node indices in the order the grid iterates over
+        its nodes.
+        '''
+        return np.arange(self.x_size * self.y_size).reshape(
+                                        (self.x_size, self.y_size)).T.ravel()
+
+    def __str__(self):
+        state_grid = self.get_global_state()
+        ret_str = str(self.x_size) + " x " + str(self.y_size) + \
+                    " simulation grid:"
+        for y in range(self.y_size):
+            ret_str += "\n[" + ", ".join(state_grid[:, y]) + "]"
+        return ret_str
+#end class CompactSquareGrid
+
+
+class CompactSquareGridWithCornerLeak(CompactSquareGrid):
+    '''
+    Compact version of surface_crns.models.grids.SquareGridWithCornerLeak: a
+    square grid where reactions can also happen along corners at some
+    (usually small) rate relative to the usual reaction rate.
+    '''
+    def __init__(self, x_size, y_size, corner_rate, wrap = False):
+        self.corner_rate = corner_rate
+        super(CompactSquareGridWithCornerLeak, self).__init__(x_size, y_size,
+                                                              wrap = wrap)
+
+    def neighbor_offsets(self, ys):
+        offsets = super(CompactSquareGridWithCornerLeak,
+                        self).neighbor_offsets(ys)
+        return offsets + [(dx, dy, self.corner_rate) for dx, dy in
+                          [(-1,-1), (1,-1), (1,1), (-1,1)]]
+#end class CompactSquareGridWithCornerLeak
+
+
+class CompactHexGrid(CompactSquareGrid):
+    '''
+    Compact version of surface_crns.models.grids.HexGrid: a hex grid aligned
+    with hex cell sides vertical, with odd-numbered rows offset to the left and
+    even-numbered rows offset to the right.
+    '''
+    def __init__(self, x_size, y_size, wrap = False):
+        if wrap and y_size%2 == 1:
+            raise ValueError("Can't make a wrapping hex grid with an odd " + \
+                            "number of rows. It just doesn't work out.")
+        super(CompactHexGrid, self).__init__(x_size, y_size, wrap = wrap)
+
+    def neighbor_offsets(self, ys):
+        diagonal_dx = np.where(ys % 2 == 1, 1, -1)
+        return [(0, -1, 1), (0, 1, 1), (-1, 0, 1), (1, 0, 1),
+                (diagonal_dx, -1, 1), (diagonal_dx, 1, 1)]
+#end class CompactHexGrid
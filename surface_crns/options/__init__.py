@@ -1 +1,3 @@
-__all__ = ["option_processor"]
\ No newline at end of file
+from surface_crns.lazy_import import lazy_submodules
+__all__ = ["option_processor"]
+__getattr__ = lazy_submodules(__name__)
\ No newline at end of file
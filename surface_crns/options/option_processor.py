@@ -1,6 +1,8 @@
 from surface_crns.constants import COLOR_CLASSES
 from surface_crns.models.grids import SquareGrid, HexGrid
+from surface_crns.models.compact_grids import CompactSquareGrid, CompactHexGrid
 from surface_crns import random_color as rcolor
+from surface_crns.simulators.simulator_factory import simulator_names
 import numpy as np
 import random
 
@@ -15,8 +17,11 @@ class SurfaceCRNOptionParser:
         self.speedup_factor = self.process_speedup_factor(options)
         self.debug = self.process_debug_flag(options)
         self.rng_seed = self.process_rng_seed(options)
+        self.legacy_rng = self.process_legacy_rng_flag(options)
         self.max_duration = self.process_max_duration(options)
         self.capture_rate = self.process_capture_rate(options)
+        self.keyframe_interval = self.process_keyframe_interval(options)
+        self.keyframe_time = self.process_keyframe_time(options)
         self.fps = self.process_fps(options)
         self.display_text = self.process_display_text_flag(options)
         self.COLORMAP = self.process_colormap(options)
@@ -25,7 +30,9 @@ class SurfaceCRNOptionParser:
             self.update_rule = self.process_update_rule(options)
         elif self.simulation_type == 'asynchronous':
             self.transition_rules = self.process_transition_rules(options)
+        self.simulator = self.process_simulator(options)
         self.surface_geometry = self.process_surface_geometry(options)
+        self.surface_model = self.process_surface_model(options)
         self.pixels_per_node = self.process_pixels_per_node(options)
         self.wrap_grid = self.process_wrap_grid(options)
         self.grid_type = self.process_grid_type(options)
@@ -39,6 +46,9 @@ class SurfaceCRNOptionParser:
            self.representative_cell_x = self.process_representative_cell_x(options)
            self.representative_cell_y = self.process_representative_cell_y(options)
         self.capture_directory = self.process_capture_directory(options)
+        self.capture_mode = self.process_capture_mode(options)
+        self.background_simulation = \
+                            self.process_background_simulation(options)
         self.init_state = self.process_init_state(options)
 
 
@@ -77,6 +87,19 @@ class SurfaceCRNOptionParser:
         else:
             return None
 
+    def process_legacy_rng_flag(self, options):
+        if 'legacy_rng' in options:
+            flag = options['legacy_rng'].lower()
+            if flag in ['true', 'on', 'yes']:
+                legacy_rng = True
+            elif flag in ['false', 'off', 'no']:
+                legacy_rng = False
+            else:
+                legacy_rng = bool(int(options['legacy_rng']))
+        else:
+            legacy_rng = False
+        return legacy_rng
+
     def process_max_duration(self, options):
         if 'max_duration' in options:
             SIMULATION_DURATION = float(options['max_duration'])
@@ -91,6 +114,20 @@ class SurfaceCRNOptionParser:
             capture_rate = 5
         return capture_rate
 
+    def process_keyframe_interval(self, options):
+        if 'keyframe_interval' in options:
+            keyframe_interval = int(options['keyframe_interval'])
+        else:
+            keyframe_interval = None
+        return keyframe_interval
+
+    def process_keyframe_time(self, options):
+        if 'keyframe_time' in options:
+            keyframe_time = float(options['keyframe_time'])
+        else:
+            keyframe_time = None
+        return keyframe_time
+
     def process_fps(self, options):
         if 'fps' in options:
             fps = int(options['fps'])
@@ -136,6 +173,43 @@ class SurfaceCRNOptionParser:
             raise Exception("Transition rules or totalistic update rule " +
                             "required.")
 
+    def process_simulator(self, options):
+        if 'simulator' in options:
+            opt_str = options['simulator'].lower().replace('-', '_')
+            if opt_str in ['gibson_bruck', 'nrm']:
+                opt_str = 'next_reaction'
+            elif opt_str in ['direct_method', 'gillespie', 'ssa']:
+                opt_str = 'direct'
+            elif opt_str in ['composition', 'cr', 'rejection']:
+                opt_str = 'composition_rejection'
+            elif opt_str in ['bit_packed', 'bitpacked', 'packed']:
+                opt_str = 'binary'
+            elif opt_str in ['hash_life', 'quadtree']:
+                opt_str = 'hashlife'
+            if not opt_str in simulator_names(self.simulation_type):
+                raise Exception("Unrecognized " + self.simulation_type +
+                                " simulator '%s'" % opt_str)
+            return opt_str
+        elif self.simulation_type == 'synchronous' and \
+             self.is_binary_rule(self.update_rule):
+            return 'binary'
+        else:
+            return None
+
+    def is_binary_rule(self, update_rule):
+        '''
+        True iff update_rule is a totalistic rule using only the states "0" and
+        "1".
+        '''
+        update_options = getattr(update_rule, 'update_options', None)
+        if not update_options:
+            return False
+        states = set()
+        for (_, state), new_state in update_options.items():
+            states.add(state)
+            states.add(new_state)
+        return states <= {'0', '1'}
+
     def process_update_rule(self, options):
         return options['totalistic_rule']
 
@@ -182,15 +256,20 @@ class SurfaceCRNOptionParser:
                 for line in init_state:
                     for node_state in line:
                         self.update_colormap(str(node_state))
+            if self.surface_model == "compact":
+                square_class, hex_class = CompactSquareGrid, CompactHexGrid
+            else:
+                square_class, hex_class = SquareGrid, HexGrid
             if self.surface_geometry == "square":
                 if self.debug:
                     print("init_state: " + str(init_state))
                     print("shape: " + str(init_state.shape))
-                self.grid = SquareGrid(init_state.shape[0], init_state.shape[1],
-                                       wrap = self.wrap_grid)
+                self.grid = square_class(init_state.shape[0],
+                                         init_state.shape[1],
+                                         wrap = self.wrap_grid)
             elif self.surface_geometry == "hex":
-                self.grid = HexGrid(init_state.shape[0], init_state.shape[1],
-                                    wrap = self.wrap_grid)
+                self.grid = hex_class(init_state.shape[0], init_state.shape[1],
+                                      wrap = self.wrap_grid)
             else:
                 raise Exception("Surface geometry must be set before " + \
                                 "processing initial state.")
@@ -284,6 +363,31 @@ class SurfaceCRNOptionParser:
             capture_directory = None
         return capture_directory
 
+    def process_capture_mode(self, options):
+        if 'capture_mode' in options:
+            opt_str = options['capture_mode'].lower()
+            if opt_str in ['pipe', 'stream', 'ffmpeg']:
+                mode = "pipe"
+            elif opt_str in ['png', 'frames', 'images']:
+                mode = "png"
+            else:
+                raise Exception("Unrecognized capture mode '%s'" % opt_str)
+        else:
+            mode = "pipe"
+        return mode
+
+    def process_background_simulation(self, options):
+        if 'background_simulation' not in options:
+            background_simulation = True
+        elif options['background_simulation'].lower() in ['true', 'yes', 'on']:
+            background_simulation = True
+        elif options['background_simulation'].lower() in ['false', 'no', 'off']:
+            background_simulation = False
+        else:
+            raise Exception("Unrecognized option for background_simulation '"
+                            + str(options['background_simulation']) + "'.")
+        return background_simulation
+
     def process_surface_geometry(self, options):
         if 'geometry' in options:
             opt_str = options['geometry'].lower()
@@ -297,6 +401,19 @@ class SurfaceCRNOptionParser:
             geom = "square"
         return geom
 
+    def process_surface_model(self, options):
+        if 'surface_model' in options:
+            opt_str = options['surface_model'].lower()
+            if opt_str in ['node', 'nodes', 'objects']:
+                model = "nodes"
+            elif opt_str in ['compact', 'array', 'arrays']:
+                model = "compact"
+            else:
+                raise Exception("Unrecognized surface model '%s'" % opt_str)
+        else:
+            model = "nodes"
+        return model
+
     def update_colormap(self, state):
         if not state in self.COLORMAP:
             # Cap number of unique autogenerated colors to 50
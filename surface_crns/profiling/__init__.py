@@ -1 +1,3 @@
-__all__ = ["timing", "grid_timing"]
\ No newline at end of file
+from surface_crns.lazy_import import lazy_submodules
+__all__ = ["timing", "grid_timing"]
+__getattr__ = lazy_submodules(__name__)
\ No newline at end of file
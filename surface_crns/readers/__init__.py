@@ -1,2 +1,4 @@
+from surface_crns.lazy_import import lazy_submodules
 __all__ = ["colormap_readers", "grid_state_readers", "manifest_readers",
-           "statements", "transition_readers"]
\ No newline at end of file
+           "statements", "transition_readers"]
+__getattr__ = lazy_submodules(__name__)
\ No newline at end of file
@@ -39,6 +39,9 @@ def parse_totalistic_rule_stream(rules_stream):
         neighbor_sum = sum(map(lambda s: int(s), neighbor_states))
         return update_options[(neighbor_sum, self_state)]
 
+    # Keep the table itself with the rule, for simulators that compile it
+    # (see surface_crns.simulators.totalistic_simulator).
+    update_rule.update_options = update_options
     return update_rule
 
 '''
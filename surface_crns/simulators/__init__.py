@@ -1 +1,8 @@
-__all__ = ["queue_simulator", "queue_simulator_eager"]
\ No newline at end of file
+from surface_crns.lazy_import import lazy_submodules
+__all__ = ["queue_simulator", "queue_simulator_eager",
+           "next_reaction_simulator", "direct_method_simulator",
+           "composition_rejection_simulator", "synchronous_simulator",
+           "totalistic_simulator", "binary_totalistic_simulator",
+           "hashlife_simulator", "state_hash", "trajectory",
+           "event_index", "event_producer", "simulator_factory"]
+__getattr__ = lazy_submodules(__name__)
\ No newline at end of file
@@ -0,0 +1,301 @@
+import math
+import numpy as np
+from surface_crns.simulators.totalistic_simulator import TotalisticSimulator, \
+                                                        _shifted
+from surface_crns.simulators.state_hash import CycleDetector, KEY_SEED
+
+WORD_BITS = 64
+# Bits of a word at odd (resp. even) positions. Since words hold a multiple
+# of two cells, these are also the cells in odd (resp. even) rows.
+ODD_BITS  = np.uint64(0xAAAAAAAAAAAAAAAA)
+EVEN_BITS = np.uint64(0x5555555555555555)
+
+class BinaryTotalisticSimulator(TotalisticSimulator):
+    '''
+    Simulator for synchronous totalistic cellular automata whose only states
+    are "0" and "1", such as the Game of Life.
+
+    The lattice is bit-packed: each column of cells x is stored as a row of
+    uint64 words, 64 cells (y-values) per word. A neighbor's state is the
+    whole packed array shifted by a bit (for neighbors in y) or by a row (for
+    neighbors in x), and the neighbor count is added up with bit-parallel
+    adders into a few bit planes, so each numpy operation updates 64 cells at
+    once. The rule is then applied as a boolean function of the bit planes and
+    the cell's own bit.
+
+    advance looks for cycles with a hash of the packed words rather than of
+    the cells, so that a tick's hash costs no more than the tick itself.
+
+    Works on the same surfaces as TotalisticSimulator. On surfaces other than
+    square, square-with-corner-leak, and hex grids, or if the rule or initial
+    state use any state other than "0" and "1", it falls back to
+    TotalisticSimulator's way of updating.
+    '''
+    def compile_rule(self, update_options):
+        '''
+        Build the lookup table, as TotalisticSimulator does, and, if the
+        automaton is binary, the boolean form of the rule.
+        '''
+        super(BinaryTotalisticSimulator, self).compile_rule(update_options)
+        self.packed = self.geometry != "general" and \
+                      set(self.states) <= {"0", "1"}
+        if not self.packed:
+            return
+        # State code of each bit value (-1 if a state never appears).
+        self.bit_codes = np.array([self.state_codes.get("0", -1),
+                                   self.state_codes.get("1", -1)],
+                                  dtype = np.int64)
+        # (neighbor count, own bit) pairs leading to 1, and pairs with no
+        # update option.
+        self.one_terms     = []
+        self.missing_terms = []
+        for count in range(self.degree + 1):
+            for bit in range(2):
+                key = (count, str(bit))
+                if key not in update_options:
+                    self.missing_terms.append((count, bit))
+                elif update_options[key] == "1":
+                    self.one_terms.append((count, bit))
+
+        x_size, y_size = self.shape
+        self.n_words = (y_size + WORD_BITS - 1) // WORD_BITS
+        # Bits of the last word that hold cells.
+        self.valid = np.full(self.n_words, ~np.uint64(0), dtype = np.uint64)
+        if y_size % WORD_BITS:
+            self.valid[-1] = np.uint64((1 << (y_size % WORD_BITS)) - 1)
+        # Key of each word, for the hash used by advance.
+        generator = np.random.default_rng(KEY_SEED)
+        self.word_keys = np.frombuffer(generator.bytes(8 * x_size *
+                                                       self.n_words),
+                                       dtype = np.uint64).reshape(
+                                                    (x_size, self.n_words))
+
+    def reset(self):
+        '''
+        Re-read the lattice from the surface.
+        '''
+        super(BinaryTotalisticSimulator, self).reset()
+        if self.packed:
+            self.bits = self.pack(self.values[self.current])
+
+    def pack(self, bits):
+        '''
+        Pack an (x_size, y_size) array of 0s and 1s into an (x_size, n_words)
+        array of uint64 words.
+        '''
+        x_size, y_size = self.shape
+        packed_bytes = np.zeros((x_size, self.n_words * 8), dtype = np.uint8)
+        packed_bytes[:, :(y_size + 7) // 8] = \
+                np.packbits(bits.astype(np.uint8), axis = 1,
+                            bitorder = "little")
+        return packed_bytes.view("<u8").astype(np.uint64)
+
+    def unpack(self, words):
+        '''
+        Inverse of pack.
+        '''
+        unpacked = np.unpackbits(words.astype("<u8").view(np.uint8), axis = 1,
+                                 bitorder = "little")
+        return unpacked[:, :self.shape[1]]
+
+    def shift_y(self, words, dy):
+        '''
+        Returns the packed states of each cell's neighbor at y + dy (dy = -1
+        or 1).
+        '''
+        one   = np.uint64(1)
+        top   = np.uint64(WORD_BITS - 1)
+        y_size = self.shape[1]
+        last_word = (y_size - 1) // WORD_BITS
+        last_bit  = np.uint64((y_size - 1) % WORD_BITS)
+        if dy == -1:
+            shifted = words << one
+            shifted[:, 1:] |= words[:, :-1] >> top
+            if self.surface.wrap:
+                shifted[:, 0] |= (words[:, last_word] >> last_bit) & one
+        else:
+            shifted = words >> one
+            shifted[:, :-1] |= words[:, 1:] << top
+            if self.surface.wrap:
+                shifted[:, last_word] |= (words[:, 0] & one) << last_bit
+        return shifted
+
+    def neighbor_count(self, words):
+        '''
+        Returns the number of live neighbors of every cell, as a list of bit
+        planes (least significant first).
+        '''
+        wrap = self.surface.wrap
+        below = self.shift_y(words, -1)
+        above = self.shift_y(words, 1)
+        neighbors = [below, above, _shifted(words, -1, 0, wrap),
+                     _shifted(words, 1, 0, wrap)]
+        if self.geometry == "hex":
+            # Odd rows are also connected diagonally to the right, even rows to
+            # the left.
+            for vertical in (below, above):
+                neighbors.append(
+                            (_shifted(vertical, 1, 0, wrap) & ODD_BITS) |
+                            (_shifted(vertical, -1, 0, wrap) & EVEN_BITS))
+        elif self.geometry == "moore":
+            for vertical in (below, above):
+                neighbors.append(_shifted(vertical, -1, 0, wrap))
+                neighbors.append(_shifted(vertical, 1, 0, wrap))
+
+        # Ripple-carry add each neighbor into the count, adding a plane
+        # whenever the count could need another bit.
+        planes = []
+        for n, carry in enumerate(neighbors, 1):
+            for i in range(len(planes)):
+                planes[i], carry = planes[i] ^ carry, planes[i] & carry
+            if n.bit_length() > len(planes):
+                planes.append(carry)
+        return planes
+
+    def cells_matching(self, planes, words, terms):
+        '''
+        Returns the packed set of cells whose (neighbor count, own bit) is one
+        of terms.
+        '''
+        result = np.zeros_like(words)
+        equal  = dict()
+        for count, bit in terms:
+            if count not in equal:
+                match = ~np.zeros_like(words)
+                for i, plane in enumerate(planes):
+                    if (count >> i) & 1:
+                        match &= plane
+                    else:
+                        match &= ~plane
+                equal[count] = match
+            result |= equal[count] & (words if bit else ~words)
+        return result & self.valid
+
+    def update(self):
+        '''
+        Advance the lattice one tick, without touching the surface.
+        '''
+        if not self.packed:
+            super(BinaryTotalisticSimulator, self).update()
+            return
+        words  = self.bits
+        planes = self.neighbor_count(words)
+        if self.missing_terms:
+            missing = self.cells_matching(planes, words, self.missing_terms)
+            if missing.any():
+                x, y = np.argwhere(self.unpack(missing))[0]
+                count = sum(int(self.unpack(plane)[x, y]) << i
+                            for i, plane in enumerate(planes))
+                raise Exception("No update option for neighbor total " +
+                                str(count) + " and state " +
+                                str(self.unpack(words)[x, y]) + ".")
+        self.previous_bits = words
+        self.bits = self.cells_matching(planes, words, self.one_terms)
+        self.ticks_computed += 1
+
+    def unchanged(self):
+        '''
+        True iff the last tick left every node as it was, by comparing the
+        lattices themselves rather than their hashes.
+        '''
+        if not self.packed:
+            return super(BinaryTotalisticSimulator, self).unchanged()
+        return np.array_equal(self.previous_bits, self.bits)
+
+    def hash_update(self):
+        '''
+        Update the hash for the tick just computed by update.
+        '''
+        if not self.packed:
+            super(BinaryTotalisticSimulator, self).hash_update()
+            return
+        # Only unpack the words where some cell flipped.
+        flipped = self.previous_bits ^ self.bits
+        xs, word_numbers = np.nonzero(flipped)
+        bits = np.unpackbits(flipped[xs, word_numbers].astype("<u8")
+                             .view(np.uint8).reshape(-1, 8),
+                             axis = 1, bitorder = "little")
+        rows, bit_numbers = np.nonzero(bits)
+        changed = xs[rows] * self.shape[1] + \
+                  word_numbers[rows] * WORD_BITS + bit_numbers
+        # A flip either way changes the hash by the same keys.
+        self.hash_changes(changed, self.bit_codes[0], self.bit_codes[1])
+
+    def step(self):
+        '''
+        Advance the lattice one tick, without touching the surface. Returns the
+        node numbers of the nodes that changed, in the order the surface
+        iterates over them, and their new state codes.
+        '''
+        if not self.packed:
+            return super(BinaryTotalisticSimulator, self).step()
+        words = self.bits
+        self.update()
+        self.hash_update()
+        new_words = self.bits
+        changed = self.changed_nodes(self.unpack(words ^ new_words))
+        y_size  = self.shape[1]
+        xs = changed // y_size
+        ys = changed % y_size
+        new_bits = (new_words[xs, ys // WORD_BITS] >>
+                    (ys % WORD_BITS).astype(np.uint64)) & np.uint64(1)
+        return changed, self.bit_codes[new_bits.astype(np.int64)]
+
+    def advance(self, ticks):
+        '''
+        Advance the simulation by up to ticks ticks (stopping at the end of
+        the simulation) without producing events, then write the result to
+        the surface.
+        '''
+        if not self.packed:
+            super(BinaryTotalisticSimulator, self).advance(ticks)
+            return
+        ticks = min(ticks, max(0, math.ceil(self.simulation_duration -
+                                            self.time)))
+        # The hash of the words is the XOR of a mix of each word with its key,
+        # and is updated from the words that changed.
+        cycles = CycleDetector(self.cycles.window)
+        value  = np.bitwise_xor.reduce(_mix(self.bits, self.word_keys),
+                                       axis = None)
+        cycles.record(value, self.time)
+        while ticks > 0:
+            self.update()
+            changed = np.nonzero(self.previous_bits != self.bits)
+            keys = self.word_keys[changed]
+            value ^= np.bitwise_xor.reduce(
+                                _mix(self.previous_bits[changed], keys) ^
+                                _mix(self.bits[changed], keys))
+            self.time += 1
+            ticks -= 1
+            period = cycles.record(value, self.time)
+            if period == 1 and len(changed[0]) > 0:
+                # A hash collision: some words did change this tick.
+                period = None
+            period = self.found_period(period)
+            if period is not None:
+                self.time += ticks - ticks % period
+                ticks %= period
+        self.write_surface()
+        # Ticks in between weren't hashed, so start looking for cycles afresh.
+        self.rehash()
+        self.cycles.clear()
+        self.cycles.record(self.zobrist.value, self.time)
+
+    def write_surface(self):
+        '''
+        Write the states of every node to the surface.
+        '''
+        if self.packed:
+            self.current = self.bit_codes[self.unpack(self.bits)]
+        super(BinaryTotalisticSimulator, self).write_surface()
+#end class BinaryTotalisticSimulator
+
+def _mix(words, keys):
+    '''
+    Scrambles each word with its key (the splitmix64 finalizer), so that
+    different words get unrelated hashes.
+    '''
+    z = words ^ keys
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
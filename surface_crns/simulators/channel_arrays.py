@@ -0,0 +1,201 @@
+import numpy as np
+import itertools
+import operator
+from surface_crns.simulators.reaction_channels import _CompactNodes
+
+class ChannelArrays(object):
+    '''
+    Array form of a surface's connectivity, for finding every reaction channel
+    on the surface at once with numpy instead of node by node.
+
+    Nodes are numbered as in ReactionChannels. The surface's structure is
+    captured once, when the object is built:
+        nodes:          node objects (or compact node views), by node number
+        neighbor_index: int array of shape (nodes, max degree), holding the
+                        node number of each neighbor, or -1 where there is
+                        none
+        weights:        float array of the same shape with the weight of each
+                        connection
+    so finding channels again later (e.g. when a simulator is reset) only
+    needs a pass over the nodes' current states.
+
+    Channels are listed node by node in the order the surface iterates over
+    its nodes, whatever their numbers, so that a seeded simulation draws the
+    same waiting time for the same channel on either surface model.
+    '''
+    def __init__(self, surface, rule_index):
+        self.surface    = surface
+        self.rule_index = rule_index
+        self.compact    = hasattr(surface, "neighbor_index")
+        if self.compact:
+            self.nodes = _CompactNodes(surface)
+            self.neighbor_index = surface.neighbor_index
+            self.weights = np.broadcast_to(
+                        np.asarray(surface.offset_weights, dtype = np.float64),
+                        surface.neighbor_index.shape)
+            # Compact node numbers run down columns, but the grid iterates
+            # along rows.
+            self.order = surface.iteration_order()
+        else:
+            self.nodes = list(surface)
+            self.order = None
+            node_numbers = {node: i for i, node in enumerate(self.nodes)}
+            neighbor_lists = [node.neighbors for node in self.nodes]
+            degrees = np.fromiter(map(len, neighbor_lists), dtype = np.int64,
+                                  count = len(self.nodes))
+            edges   = list(itertools.chain.from_iterable(neighbor_lists))
+            neighbor_numbers = np.fromiter(
+                        map(node_numbers.__getitem__,
+                            map(operator.itemgetter(0), edges)),
+                        dtype = np.int64, count = len(edges))
+            neighbor_weights = np.fromiter(map(operator.itemgetter(1), edges),
+                                           dtype = np.float64,
+                                           count = len(edges))
+            # Scatter the flat edge list into one row per node.
+            rows = np.repeat(np.arange(len(self.nodes)), degrees)
+            columns = np.arange(len(edges)) - \
+                      np.repeat(np.cumsum(degrees) - degrees, degrees)
+            degree = int(degrees.max()) if len(degrees) > 0 else 0
+            self.neighbor_index = np.full((len(self.nodes), degree), -1,
+                                          dtype = np.int64)
+            self.weights = np.zeros((len(self.nodes), degree),
+                                    dtype = np.float64)
+            self.neighbor_index[rows, columns] = neighbor_numbers
+            self.weights[rows, columns] = neighbor_weights
+
+        # Code every state that appears in a rule. Every other state gets the
+        # code n_states, and can't react.
+        self.state_codes = dict()
+        for rule in rule_index.rules:
+            for state in rule.inputs:
+                if state not in self.state_codes:
+                    self.state_codes[state] = len(self.state_codes)
+        self.n_states = len(self.state_codes)
+        n_codes = self.n_states + 1
+
+        # For each code (unimolecular) or pair of codes (bimolecular, first
+        # reactant's code * n_codes + second's), the rule numbers of the rules
+        # they can react by, flattened into one array. The rules for code c
+        # are rules[offsets[c]:offsets[c] + counts[c]].
+        self.rule_rates = np.array([rule.rate for rule in rule_index.rules],
+                                   dtype = np.float64)
+        unimolecular = [[] for _ in range(n_codes)]
+        for state, channels in rule_index.unimolecular.items():
+            for _, rule, _, _ in channels:
+                unimolecular[self.state_codes[state]].append(
+                                                rule_index.rule_number(rule))
+        self.unimolecular = self._flatten(unimolecular)
+        bimolecular = [[] for _ in range(n_codes * n_codes)]
+        for state, partners in rule_index.first_bimolecular.items():
+            for partner, channels in partners.items():
+                pair = self.state_codes[state] * n_codes + \
+                       self.state_codes[partner]
+                for _, rule, _, _ in channels:
+                    bimolecular[pair].append(rule_index.rule_number(rule))
+        self.bimolecular = self._flatten(bimolecular)
+
+    def _flatten(self, rule_lists):
+        counts  = np.array([len(rules) for rules in rule_lists],
+                           dtype = np.int64)
+        offsets = np.zeros(len(rule_lists), dtype = np.int64)
+        np.cumsum(counts[:-1], out = offsets[1:])
+        rules = np.array([number for rules in rule_lists for number in rules],
+                         dtype = np.int64)
+        return counts, offsets, rules
+
+    def set_timestamps(self, time):
+        '''
+        Set the timestamp of every node to time.
+        '''
+        if self.compact:
+            self.surface.timestamps[:] = time
+        else:
+            for node in self.nodes:
+                node.timestamp = time
+
+    def codes(self):
+        '''
+        Returns an array of the current state code of every node.
+        '''
+        if self.compact:
+            lookup = np.array([self.state_codes.get(state, self.n_states)
+                               for state in self.surface.species.species],
+                              dtype = np.int64)
+            return lookup[self.surface.states]
+        get = self.state_codes.get
+        n_states = self.n_states
+        return np.fromiter((get(node.state, n_states) for node in self.nodes),
+                           dtype = np.int64, count = len(self.nodes))
+
+    def first_reactant_channels(self):
+        '''
+        Finds every live channel on the surface, counting each bimolecular
+        channel once (with the node its first reactant). Returns arrays
+
+            (rule numbers, first nodes, second nodes, rates)
+
+        with one entry per channel; second nodes are -1 for unimolecular
+        channels. Unimolecular channels come first.
+        '''
+        codes   = self.codes()
+        n_codes = self.n_states + 1
+
+        first_nodes  = []
+        second_nodes = []
+        rule_numbers = []
+        rates        = []
+
+        if self.order is None:
+            nodes = np.flatnonzero(self.unimolecular[0][codes])
+        else:
+            nodes = self.order[np.flatnonzero(
+                                    self.unimolecular[0][codes[self.order]])]
+        self._expand(nodes, codes[nodes], None, self.unimolecular,
+                     first_nodes, second_nodes, rule_numbers, rates)
+
+        has_neighbor = self.neighbor_index >= 0
+        neighbor_codes = np.where(has_neighbor,
+                                  codes[np.maximum(self.neighbor_index, 0)],
+                                  self.n_states)
+        pairs = codes[:, None] * n_codes + neighbor_codes
+        if self.order is None:
+            nodes, slots = np.nonzero(self.bimolecular[0][pairs])
+        else:
+            ranks, slots = np.nonzero(self.bimolecular[0][pairs[self.order]])
+            nodes = self.order[ranks]
+        self._expand(nodes, pairs[nodes, slots], slots, self.bimolecular,
+                     first_nodes, second_nodes, rule_numbers, rates)
+
+        rule_numbers = np.concatenate(rule_numbers)
+        first_nodes  = np.concatenate(first_nodes)
+        second_nodes = np.concatenate(second_nodes)
+        rates        = np.concatenate(rates)
+        live = rates > 0
+        return rule_numbers[live], first_nodes[live], second_nodes[live], \
+               rates[live]
+
+    def _expand(self, nodes, keys, slots, table, first_nodes, second_nodes,
+                rule_numbers, rates):
+        '''
+        Add one channel for every rule listed under each node's key.
+        '''
+        counts, offsets, rules = table
+        repeats = counts[keys]
+        total   = int(repeats.sum())
+        # Position of each channel within its node's list of rules.
+        starts  = np.repeat(np.cumsum(repeats) - repeats, repeats)
+        within  = np.arange(total, dtype = np.int64) - starts
+        numbers = rules[np.repeat(offsets[keys], repeats) + within]
+        first   = np.repeat(nodes, repeats)
+        if slots is None:
+            second = np.full(total, -1, dtype = np.int64)
+            rate   = self.rule_rates[numbers]
+        else:
+            slot   = np.repeat(slots, repeats)
+            second = self.neighbor_index[first, slot].astype(np.int64)
+            rate   = self.rule_rates[numbers] * self.weights[first, slot]
+        first_nodes.append(first)
+        second_nodes.append(second)
+        rule_numbers.append(numbers)
+        rates.append(rate)
+#end class ChannelArrays
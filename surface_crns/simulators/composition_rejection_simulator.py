@@ -0,0 +1,77 @@
+from surface_crns.simulators.event import Event
+from surface_crns.simulators.reaction_channels import ChannelSimulator
+from surface_crns.simulators.rate_buckets import RateBuckets
+
+class CompositionRejectionSimulator(ChannelSimulator):
+    '''
+    Surface CRN simulator using the composition-rejection variant of
+    Gillespie's direct method.
+
+    Live reaction channels (see ReactionChannels) are grouped into buckets by
+    rate (see RateBuckets). Each step draws the time to the next event from
+    the total propensity, picks a bucket in proportion to its share of the
+    total, and picks a channel inside the bucket by rejection sampling. Adding
+    and removing channels is O(1), and picking one costs O(number of buckets),
+    so the cost of an event doesn't grow with the size of the surface.
+
+    Most manifests only use a few distinct rates, in which case channels are
+    grouped by exact rate and no sample is ever rejected. Otherwise they are
+    grouped by power of two. Pass exact_rates = True or False to choose
+    explicitly.
+
+    self.event_queue holds the rate buckets (so that len() gives the number of
+    live channels); iterating over it yields (rule, participant numbers) for
+    each live channel.
+
+    Drop-in replacement for QueueSimulator. Uses unimolecular and bimolecular
+    reactions only.
+    '''
+    # Group by exact rate if there are at most this many possible rates.
+    MAX_EXACT_RATES = 16
+
+    def __init__(self, surface = None, transition_rules = None, seed = None,
+                 simulation_duration = 100, debug = False,
+                 legacy_rng = False, exact_rates = None):
+        # If None, decided from the channels' possible rates by
+        # make_event_queue, the first time it's called.
+        self.exact_rates = exact_rates
+        super().__init__(surface = surface,
+                         transition_rules = transition_rules, seed = seed,
+                         simulation_duration = simulation_duration,
+                         debug = debug, legacy_rng = legacy_rng)
+
+    def make_event_queue(self):
+        if self.exact_rates is None:
+            self.exact_rates = len(self.channels.possible_rates()) <= \
+                               self.MAX_EXACT_RATES
+        return RateBuckets(exact_rates = self.exact_rates)
+
+    def add_channel(self, key, rule, participants, rate):
+        self.event_queue.add(key, rate, (rule, participants))
+        self.track_channel(key, participants)
+
+    def remove_channel(self, key):
+        _, participants = self.event_queue.remove(key)
+        self.untrack_channel(key, participants)
+
+    def select_channel(self):
+        '''
+        Draw the time of the next event from the total propensity, and the
+        channel that fires from the rate buckets.
+        '''
+        total = self.event_queue.total
+        if len(self.event_queue) == 0 or total <= 0:
+            return None
+        event_time = self.time + self.rng.exponential() / total
+        if event_time > self.simulation_duration:
+            return None
+        key, _, (rule, participants) = \
+                    self.event_queue.sample(self.rng.uniform() * total,
+                                            self.rng.uniform)
+        nodes = self.channels.nodes
+        next_reaction = Event(time = event_time,
+                              rule = rule,
+                              participants = [nodes[i] for i in participants],
+                              time_issued = self.time)
+        return key, participants, next_reaction
+#end class CompositionRejectionSimulator
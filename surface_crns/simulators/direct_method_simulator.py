@@ -0,0 +1,55 @@
+from surface_crns.simulators.event import Event
+from surface_crns.simulators.reaction_channels import ChannelSimulator
+from surface_crns.simulators.propensity_tree import PropensityTree
+
+class DirectMethodSimulator(ChannelSimulator):
+    '''
+    Surface CRN simulator using Gillespie's direct method.
+
+    The propensity of every live reaction channel (see ReactionChannels) is
+    kept in a PropensityTree. Each step draws the time to the next event from
+    the total propensity and picks the channel that fires by sampling the tree,
+    both in O(log N). After the event, only the channels involving nodes whose
+    state changed are added to or removed from the tree. No events are ever
+    scheduled ahead of time, so nothing goes stale, which makes this a good fit
+    for dense, highly active surfaces where most events QueueSimulator
+    schedules are invalidated before they fire.
+
+    self.event_queue holds the propensity tree (so that len() gives the number
+    of live channels); iterating over it yields (rule, participant numbers)
+    for each live channel.
+
+    Drop-in replacement for QueueSimulator. Uses unimolecular and bimolecular
+    reactions only.
+    '''
+    def make_event_queue(self):
+        return PropensityTree()
+
+    def add_channel(self, key, rule, participants, rate):
+        self.event_queue.add(key, rate, (rule, participants))
+        self.track_channel(key, participants)
+
+    def remove_channel(self, key):
+        _, participants = self.event_queue.remove(key)
+        self.untrack_channel(key, participants)
+
+    def select_channel(self):
+        '''
+        Draw the time of the next event from the total propensity, and the
+        channel that fires from the propensity tree.
+        '''
+        total = self.event_queue.total
+        if len(self.event_queue) == 0 or total <= 0:
+            return None
+        event_time = self.time + self.rng.exponential() / total
+        if event_time > self.simulation_duration:
+            return None
+        key, _, (rule, participants) = \
+                    self.event_queue.sample(self.rng.uniform() * total)
+        nodes = self.channels.nodes
+        next_reaction = Event(time = event_time,
+                              rule = rule,
+                              participants = [nodes[i] for i in participants],
+                              time_issued = self.time)
+        return key, participants, next_reaction
+#end class DirectMethodSimulator
@@ -1,3 +1,11 @@
+import bisect
+import numpy as np
+from surface_crns.base.transition_rule import TransitionRule
+from surface_crns.models.compact_grids import SpeciesTable
+from surface_crns.simulators.event import Event
+from surface_crns.simulators.event_index import NodeEventIndex
+from surface_crns.simulators.reaction_channels import _CompactNodes
+
 class EventHistory(object):
     '''
     Holds a time-course of surface CRN reaction events. Iterating through an
@@ -80,3 +88,473 @@ class EventHistory(object):
             del self.history[self.idx+1:]
 
 
+
+
+class CompactEventHistory(EventHistory):
+    '''
+    EventHistory that stores events in typed arrays instead of keeping every
+    Event object, so that long runs take little memory.
+
+    Most events are reactions with one or two participants, stored as their
+    time (float64), the number of their rule (int32, into a list of the
+    distinct rules seen), and the node numbers of their participants (two
+    int32s, the second -1 for unimolecular reactions): 20 bytes per event.
+    Other events, such as a synchronous simulator's ticks, which change any
+    number of nodes, are stored as the node number and the state codes
+    before and after for each node they change. Event objects are only made
+    when an event is asked for, and are equivalent to the ones added, except
+    that time_issued is the event's time and a tick's rule lists each
+    changed node's actual states rather than placeholders.
+
+    Nodes are numbered by their index on compact grids and in the order the
+    surface iterates over them otherwise. The history keeps the state code of
+    every node as of its last event, read from the surface when the history is
+    made, so it must be made while the surface is in its initial state.
+
+    Every keyframe_interval events (by default, the larger of 10000 and the
+    number of nodes, which keeps keyframes to about a byte per event), and
+    every keyframe_time time units if keyframe_time is given, the history
+    also stores a keyframe: the state code of every node. seek can then bring
+    the surface to any point of the history by restoring the last keyframe
+    before it and replaying the events in between, so moving around the
+    history never takes more than a keyframe interval's worth of events.
+    Shorter intervals make seeking faster and take more memory.
+    '''
+    def __init__(self, surface, keyframe_interval = None,
+                 keyframe_time = None):
+        self.surface = surface
+        self.compact = hasattr(surface, "neighbor_index")
+        if self.compact:
+            self.nodes   = _CompactNodes(surface)
+            self.species = surface.species
+            self.codes   = surface.states.astype(np.int32)
+        else:
+            self.nodes   = list(surface)
+            self.node_numbers = {node: i for i, node in enumerate(self.nodes)}
+            self.species = SpeciesTable()
+            self.codes   = np.array([self.species.intern(node.state)
+                                     for node in self.nodes], dtype = np.int32)
+        self.idx = -1
+
+        self.times   = _Column(np.float64)
+        # Rule number, or -1 - (wide event number) for events stored node by
+        # node.
+        self.rule_numbers = _Column(np.int32)
+        self.first   = _Column(np.int32)
+        self.second  = _Column(np.int32)
+        self.rules   = []
+        self.rule_ids   = dict() # id(rule) -> rule number
+        self.rule_codes = []     # rule number -> (input codes, output codes)
+        # Events stored node by node: wide event w changed nodes
+        # wide_nodes[wide_starts[w]:wide_starts[w + 1]].
+        self.wide_starts = _Column(np.int64)
+        self.wide_starts.append(0)
+        self.wide_nodes  = _Column(np.int32)
+        self.wide_old    = _Column(np.int32)
+        self.wide_new    = _Column(np.int32)
+
+        if keyframe_interval is None:
+            keyframe_interval = max(10000, len(self.nodes))
+        self.keyframe_interval = keyframe_interval
+        self.keyframe_time     = keyframe_time
+        # Keyframe k is the state codes after the first keyframe_counts[k]
+        # events, the last of which happened at keyframe_times[k].
+        self.keyframes       = []
+        self.keyframe_counts = []
+        self.keyframe_times  = []
+        self.add_keyframe(0)
+
+    def __len__(self):
+        return len(self.times)
+
+    def at_end(self):
+        '''
+        Returns True iff the index is at the end of the event history.
+        '''
+        return self.idx + 1 == len(self.times)
+
+    def node_number(self, node):
+        if self.compact:
+            return node.index
+        return self.node_numbers[node]
+
+    def add_event(self, event):
+        '''
+        Appends a new event to the end of the event history. Must be called
+        right after the event has happened, while its participants are still
+        in the states it left them in.
+        '''
+        participants = event.participants
+        rule = event.rule
+        if 1 <= len(participants) <= 2 and \
+           len(rule.outputs) == len(participants) \
+           and all(node.state == output
+                   for node, output in zip(participants, rule.outputs)):
+            rule_number = self.rule_number(rule)
+            _, output_codes = self.rule_codes[rule_number]
+            numbers = [self.node_number(node) for node in participants]
+            for i, code in zip(numbers, output_codes):
+                self.codes[i] = code
+            self.times.append(event.time)
+            self.rule_numbers.append(rule_number)
+            self.first.append(numbers[0] if numbers else -1)
+            self.second.append(numbers[1] if len(numbers) > 1 else -1)
+            self.check_keyframe(event.time)
+            return
+
+        if self.compact and hasattr(participants, "numbers"):
+            # A totalistic simulator's tick, with its node numbers at hand.
+            numbers   = np.asarray(participants.numbers, dtype = np.int32)
+            new_codes = self.surface.states[numbers].astype(np.int32)
+        else:
+            numbers   = np.array([self.node_number(node)
+                                  for node in participants], dtype = np.int32)
+            new_codes = np.array([self.species.intern(node.state)
+                                  for node in participants], dtype = np.int32)
+        wide_number = len(self.wide_starts) - 1
+        self.wide_nodes.extend(numbers)
+        self.wide_old.extend(self.codes[numbers])
+        self.wide_new.extend(new_codes)
+        self.wide_starts.append(len(self.wide_nodes))
+        self.codes[numbers] = new_codes
+        self.times.append(event.time)
+        self.rule_numbers.append(-1 - wide_number)
+        self.first.append(-1)
+        self.second.append(-1)
+        self.check_keyframe(event.time)
+
+    def check_keyframe(self, time):
+        '''
+        Store a keyframe if one is due after the event just added.
+        '''
+        if (self.keyframe_interval and len(self.times) -
+                    self.keyframe_counts[-1] >= self.keyframe_interval) or \
+           (self.keyframe_time and
+                    time - self.keyframe_times[-1] >= self.keyframe_time):
+            self.add_keyframe(time)
+
+    def add_keyframe(self, time):
+        '''
+        Store the current state codes as a keyframe, as compactly as the
+        number of states allows.
+        '''
+        self.keyframes.append(self.codes.astype(self.species.code_dtype()))
+        self.keyframe_counts.append(len(self.times))
+        self.keyframe_times.append(time)
+
+    def rule_number(self, rule):
+        '''
+        Returns the number of a rule, adding it to the list of rules if it
+        isn't there yet.
+        '''
+        number = self.rule_ids.get(id(rule))
+        if number is None:
+            number = len(self.rules)
+            self.rules.append(rule)
+            self.rule_ids[id(rule)] = number
+            intern = self.species.intern
+            self.rule_codes.append(([intern(state) for state in rule.inputs],
+                                    [intern(state) for state in rule.outputs]))
+        return number
+
+    def event(self, i):
+        '''
+        Returns an Event for the event at position i.
+        '''
+        time = float(self.times[i])
+        rule_number = int(self.rule_numbers[i])
+        nodes = self.nodes
+        if rule_number >= 0:
+            participants = [nodes[int(self.first[i])]]
+            if self.second[i] >= 0:
+                participants.append(nodes[int(self.second[i])])
+            rule = self.rules[rule_number]
+        else:
+            start, end = self.wide_range(-1 - rule_number)
+            participants = [nodes[j] for j in
+                            self.wide_nodes.values[start:end].tolist()]
+            species = self.species
+            rule = TransitionRule(
+                    inputs  = [species[code] for code in
+                               self.wide_old.values[start:end].tolist()],
+                    outputs = [species[code] for code in
+                               self.wide_new.values[start:end].tolist()])
+        return Event(time = time, rule = rule, participants = participants,
+                     time_issued = time)
+
+    def wide_range(self, wide_number):
+        return int(self.wide_starts[wide_number]), \
+               int(self.wide_starts[wide_number + 1])
+
+    def increment_event(self, distance):
+        '''
+        Moves the current pointer distance away from the current pointer, then
+        returns the event at that pointer.
+
+        Positive values of distance move the pointer forward; negative values
+        move the pointer backward.
+
+        Raises an exception if the jump would take the pointer outside the
+        eventHistory's history.
+        '''
+        new_idx = self.idx + distance
+        if new_idx < -1 or new_idx >= len(self.times):
+            raise IndexError(("eventHistory with %d events at index %d " + \
+                              "attempted to jump by %d positions.") % \
+                             (len(self.times), self.idx, distance))
+        self.idx = new_idx
+        return self.event(self.idx)
+
+    def next_event(self):
+        '''
+        Returns the event after the current pointer.
+
+        Returns None if at the end of the event history.
+        '''
+        if self.at_end():
+            return None
+        return self.event(self.idx + 1)
+
+    def previous_event(self):
+        '''
+        Returns the event before the current pointer.
+
+        Returns None if at the beginning of the event history.
+        '''
+        if self.at_beginning():
+            return None
+        return self.event(self.idx)
+
+    def clip(self):
+        '''
+        Deletes all events after the current event, making the current event the
+        last event.
+
+        Intended to be used to "unfreeze" a simulation, allowing it to run with
+        new random reactions.
+        '''
+        # Undo the deleted events' changes to the state codes, last first.
+        for i in range(len(self.times) - 1, self.idx, -1):
+            rule_number = int(self.rule_numbers[i])
+            if rule_number >= 0:
+                input_codes, _ = self.rule_codes[rule_number]
+                self.codes[self.first[i]] = input_codes[0]
+                if self.second[i] >= 0:
+                    self.codes[self.second[i]] = input_codes[1]
+            else:
+                start, end = self.wide_range(-1 - rule_number)
+                self.codes[self.wide_nodes.values[start:end]] = \
+                                            self.wide_old.values[start:end]
+                self.wide_starts.truncate(-rule_number)
+                self.wide_nodes.truncate(start)
+                self.wide_old.truncate(start)
+                self.wide_new.truncate(start)
+        size = self.idx + 1
+        for column in (self.times, self.rule_numbers, self.first,
+                       self.second):
+            column.truncate(size)
+        k = bisect.bisect_right(self.keyframe_counts, size)
+        del self.keyframes[k:]
+        del self.keyframe_counts[k:]
+        del self.keyframe_times[k:]
+
+    def index_at(self, time):
+        '''
+        Returns the position of the last event at or before time (-1 if
+        there is none).
+        '''
+        return int(np.searchsorted(self.times.values, time,
+                                   side = "right")) - 1
+
+    def seek(self, time):
+        '''
+        Move the pointer to the last event at or before time, and bring the
+        surface, which must be in the state as of the current pointer, to the
+        state it was in then. Returns the nodes whose state may have changed.
+        '''
+        return self.move_to(self.index_at(time))
+
+    def move_to(self, idx):
+        '''
+        Move the pointer to position idx (-1 for the beginning), and bring the
+        surface, which must be in the state as of the current pointer, to the
+        state as of that position: either by stepping through the events from
+        the current pointer or by restoring the last keyframe at or before idx
+        and replaying the events after it, whichever is fewer events. Returns
+        the nodes whose state may have changed.
+        '''
+        if idx < -1 or idx >= len(self.times):
+            raise IndexError(("eventHistory with %d events asked to move " + \
+                              "to index %d.") % (len(self.times), idx))
+        k = bisect.bisect_right(self.keyframe_counts, idx + 1) - 1
+        replay = idx + 1 - self.keyframe_counts[k]
+        changed = set()
+        if idx < self.idx and self.idx - idx <= replay:
+            for i in range(self.idx, idx, -1):
+                self.apply(i, changed, backward = True)
+        else:
+            start = self.idx + 1
+            if idx < self.idx or idx - self.idx > replay:
+                self.restore(self.keyframes[k], changed)
+                start = self.keyframe_counts[k]
+            for i in range(start, idx + 1):
+                self.apply(i, changed)
+        self.idx = idx
+        nodes = self.nodes
+        return [nodes[i] for i in sorted(changed)]
+
+    def apply(self, i, changed, backward = False):
+        '''
+        Make the changes of the event at position i to the surface (or undo
+        them, if backward is True), adding the numbers of the nodes it
+        changes to the set changed.
+        '''
+        rule_number = int(self.rule_numbers[i])
+        if rule_number >= 0:
+            numbers = [int(self.first[i])]
+            if self.second[i] >= 0:
+                numbers.append(int(self.second[i]))
+            input_codes, output_codes = self.rule_codes[rule_number]
+            codes = input_codes if backward else output_codes
+        else:
+            start, end = self.wide_range(-1 - rule_number)
+            numbers = self.wide_nodes.values[start:end]
+            codes = (self.wide_old if backward else self.wide_new) \
+                                                    .values[start:end]
+            if self.compact:
+                self.surface.states[numbers] = codes
+                changed.update(numbers.tolist())
+                return
+            numbers = numbers.tolist()
+            codes   = codes.tolist()
+        for j, code in zip(numbers, codes):
+            if self.compact:
+                self.surface.set_code(j, code)
+            else:
+                self.nodes[j].state = self.species[code]
+        changed.update(numbers)
+
+    def restore(self, keyframe, changed):
+        '''
+        Set the surface's states from a keyframe, adding the numbers of the
+        nodes that change to the set changed.
+        '''
+        if self.compact:
+            changed.update(np.flatnonzero(self.surface.states != keyframe)
+                           .tolist())
+            self.surface.set_state_codes(keyframe)
+            return
+        species = self.species
+        for i, (node, code) in enumerate(zip(self.nodes, keyframe.tolist())):
+            state = species[code]
+            if node.state != state:
+                node.state = state
+                changed.add(i)
+
+    def event_entries(self):
+        '''
+        Returns every change the history makes to a node, in the order they
+        happen, as three arrays: the position of the event, the number of the
+        node it touches, and the state code it leaves the node in.
+        '''
+        rule_numbers = self.rule_numbers.values.astype(np.int64)
+        first  = self.first.values.astype(np.int64)
+        second = self.second.values.astype(np.int64)
+        positions = np.arange(len(rule_numbers), dtype = np.int64)
+        narrow = rule_numbers >= 0
+        bimolecular = second >= 0
+        # Output code of each rule's first and second participant.
+        outputs = np.full((max(1, len(self.rules)), 2), -1, dtype = np.int64)
+        for number, (_, output_codes) in enumerate(self.rule_codes):
+            outputs[number, :len(output_codes)] = output_codes[:2]
+        rules = np.where(narrow, rule_numbers, 0)
+        # Wide events, in order, and the node entries of each.
+        wide_positions = positions[~narrow]
+        wide_lengths   = np.diff(self.wide_starts.values[:len(wide_positions)
+                                                        + 1])
+        n_wide = int(self.wide_starts[len(wide_positions)])
+
+        events = np.concatenate([positions[narrow], positions[bimolecular],
+                                 np.repeat(wide_positions, wide_lengths)])
+        nodes  = np.concatenate([first[narrow], second[bimolecular],
+                                 self.wide_nodes.values[:n_wide]])
+        codes  = np.concatenate([outputs[rules[narrow], 0],
+                                 outputs[rules[bimolecular], 1],
+                                 self.wide_new.values[:n_wide]])
+        order  = np.argsort(events, kind = "stable")
+        return events[order], nodes[order], codes[order]
+
+    def node_grid(self):
+        '''
+        Returns the array of the node number at each (x, y) position, or None
+        if the surface isn't a grid.
+        '''
+        if self.compact:
+            return np.arange(len(self.nodes)).reshape(
+                                    (self.surface.x_size, self.surface.y_size))
+        elif hasattr(self.surface, "x_size") and \
+             hasattr(self.surface, "y_size"):
+            node_grid = np.full((self.surface.x_size, self.surface.y_size), -1,
+                                dtype = np.int64)
+            for i, node in enumerate(self.nodes):
+                node_grid[node.position] = i
+            return node_grid
+        return None
+
+    def event_index(self):
+        '''
+        Returns a NodeEventIndex of the events in the history, for looking up
+        the events that touched a node or region.
+        '''
+        events, nodes, codes = self.event_entries()
+        return NodeEventIndex(times     = self.times.values,
+                              nodes     = nodes,
+                              events    = events,
+                              new_codes = codes,
+                              initial_codes = self.keyframes[0],
+                              species   = self.species.species,
+                              node_grid = self.node_grid())
+#end class CompactEventHistory
+
+
+class _Column(object):
+    '''
+    Growable one-dimensional numpy array.
+    '''
+    def __init__(self, dtype, capacity = 1024):
+        self.data = np.empty(capacity, dtype = dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.size
+        return self.data[i]
+
+    @property
+    def values(self):
+        return self.data[:self.size]
+
+    def reserve(self, size):
+        if size > len(self.data):
+            capacity = max(size, 2 * len(self.data))
+            data = np.empty(capacity, dtype = self.data.dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+
+    def append(self, value):
+        if self.size == len(self.data):
+            self.reserve(self.size + 1)
+        self.data[self.size] = value
+        self.size += 1
+
+    def extend(self, values):
+        self.reserve(self.size + len(values))
+        self.data[self.size:self.size + len(values)] = values
+        self.size += len(values)
+
+    def truncate(self, size):
+        self.size = min(self.size, size)
+#end class _Column
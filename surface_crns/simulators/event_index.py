@@ -0,0 +1,116 @@
+import numpy as np
+
+class NodeEventIndex(object):
+    '''
+    Index from each node to the events that touched it, for looking up the
+    history of one node, or of a region, without scanning every event.
+
+    The index is stored CSR-style: the events touching node n are
+    events[starts[n]:starts[n + 1]], in the order they happened, alongside
+    their times and the state code each left node n in. It is built in one
+    pass of array operations from one entry per (event, node it touched);
+    make one with TrajectoryReader.event_index or
+    CompactEventHistory.event_index rather than directly.
+
+    Events are numbered by their position in the trajectory or history.
+    node_grid maps (x, y) positions to node numbers on grids, and is None on
+    other surfaces, whose nodes can only be looked up by number.
+    '''
+    def __init__(self, times, nodes, events, new_codes, initial_codes,
+                 species, node_grid = None):
+        self.n_nodes = len(initial_codes)
+        self.times   = np.asarray(times)
+        self.initial_codes = np.asarray(initial_codes)
+        self.species = list(species)
+        self.node_grid = node_grid
+
+        nodes  = np.asarray(nodes, dtype = np.int64)
+        events = np.asarray(events, dtype = np.int64)
+        order  = np.lexsort((events, nodes))
+        self.events    = events[order]
+        self.new_codes = np.asarray(new_codes)[order]
+        self.event_times = self.times[self.events]
+        counts = np.bincount(nodes, minlength = self.n_nodes)
+        self.starts = np.zeros(self.n_nodes + 1, dtype = np.int64)
+        np.cumsum(counts, out = self.starts[1:])
+
+    def node_number(self, x, y):
+        if self.node_grid is None:
+            raise Exception("Nodes can only be found by position on grids.")
+        return int(self.node_grid[x, y])
+
+    def entry_range(self, node, t0 = None, t1 = None):
+        '''
+        Returns the range of entries for the events touching node number node
+        with t0 <= time <= t1 (either bound may be None).
+        '''
+        start = int(self.starts[node])
+        end   = int(self.starts[node + 1])
+        times = self.event_times[start:end]
+        if t0 is not None:
+            start += int(np.searchsorted(times, t0, side = "left"))
+            times  = self.event_times[start:end]
+        if t1 is not None:
+            end = start + int(np.searchsorted(times, t1, side = "right"))
+        return start, max(start, end)
+
+    def node_events(self, node, t0 = None, t1 = None):
+        '''
+        Returns the numbers of the events touching node number node with
+        t0 <= time <= t1 (either bound may be None).
+        '''
+        start, end = self.entry_range(node, t0, t1)
+        return self.events[start:end]
+
+    def node_history(self, x, y, t0 = 0, t1 = None):
+        '''
+        Returns the state history of the node at (x, y) from time t0 to time
+        t1 (the end, if None), as an array of times and an array of the states
+        the node was in from each of those times on: its state at t0, then its
+        state after each event that touched it after t0 and no later than t1.
+        '''
+        node  = self.node_number(x, y)
+        start = int(self.starts[node])
+        end   = int(self.starts[node + 1])
+        times = self.event_times[start:end]
+        # Events at exactly t0 are part of the state at t0.
+        before = start + int(np.searchsorted(times, t0, side = "right"))
+        if t1 is not None:
+            end = max(before, start + int(np.searchsorted(times, t1,
+                                                          side = "right")))
+        if before > start:
+            code = self.new_codes[before - 1]
+        else:
+            code = self.initial_codes[node]
+        times = np.concatenate([[t0], self.event_times[before:end]])
+        codes = np.concatenate([[code], self.new_codes[before:end]])
+        lookup = np.empty(len(self.species), dtype = object)
+        lookup[:] = self.species
+        return times, lookup[codes.astype(np.int64)]
+
+    def region_events(self, x0, y0, x1, y1, t0 = None, t1 = None):
+        '''
+        Returns the numbers of the events, in order, that touched any node
+        with x0 <= x < x1 and y0 <= y < y1, with t0 <= time <= t1 (either bound
+        may be None).
+        '''
+        if self.node_grid is None:
+            raise Exception("Regions can only be found on grids.")
+        # Parts of the rectangle off the grid are ignored.
+        nodes = self.node_grid[max(x0, 0):max(x1, 0),
+                               max(y0, 0):max(y1, 0)].ravel().tolist()
+        if not nodes:
+            return np.zeros(0, dtype = np.int64)
+        if t0 is None and t1 is None:
+            starts = self.starts[nodes]
+            ends   = self.starts[np.asarray(nodes) + 1]
+        else:
+            ranges = np.array([self.entry_range(node, t0, t1)
+                               for node in nodes], dtype = np.int64)
+            starts, ends = ranges[:, 0], ranges[:, 1]
+        # Gather every range at once: entry starts[i] + k for k < length i.
+        lengths = ends - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        entries = offsets + np.arange(int(lengths.sum()))
+        return np.unique(self.events[entries])
+#end class NodeEventIndex
@@ -0,0 +1,211 @@
+import threading
+import queue
+import time as wall_clock
+from surface_crns.models.compact_grids import CompactNode
+from surface_crns.simulators.event import Event
+
+class EventProducer(object):
+    '''
+    Runs an asynchronous simulator in a background thread, ahead of whatever
+    is consuming its events, so that the two don't take turns.
+
+    The simulator must have its own copy of the surface (see copy_surface);
+    the consumer's surface is only changed when an event is taken from the
+    producer. Events are passed from the thread in batches of batch_size,
+    through a buffer holding at most buffer_batches of them; the simulator
+    waits whenever the buffer is full, so it never runs more than about
+    batch_size * buffer_batches events ahead.
+
+    EventProducer can stand in for the simulator: process_next_reaction
+    returns the next event, with its participants on the consumer's surface,
+    after applying it to that surface, and done is True once every event has
+    been taken. It waits for the simulator if the buffer is empty.
+    '''
+    def __init__(self, simulator, surface, batch_size = 256,
+                 buffer_batches = 64):
+        '''
+        Params:
+            simulator: An asynchronous simulator, on a copy of surface.
+            surface: The surface the consumer sees.
+            batch_size: Number of events passed from the thread at once.
+            buffer_batches: Number of batches the buffer holds.
+        '''
+        self.simulator = simulator
+        self.surface   = surface
+        self.batch_size = batch_size
+        self.buffer_batches = buffer_batches
+        self.compact = hasattr(surface, "neighbor_index")
+        if not self.compact:
+            self.node_map = {node: consumer_node for node, consumer_node in
+                             zip(simulator.surface, surface)}
+
+        # Throughput counters.
+        self.events_produced = 0
+        self.events_consumed = 0
+        self.simulation_time = 0 # Wall-clock seconds spent simulating.
+        self.start_time      = wall_clock.time()
+        self.occupancy_total = 0 # Sum of buffer sizes seen by the consumer.
+        self.batches_taken   = 0
+        self.start()
+
+    def start(self):
+        '''
+        Start the simulator thread, with an empty buffer.
+        '''
+        self.buffer   = queue.Queue(maxsize = self.buffer_batches)
+        self.batch    = []
+        self.position = 0
+        self.finished = False # Set once the thread's last batch is taken.
+        self.stopping = False
+        self.error    = None
+        self.thread   = threading.Thread(target = self.produce, daemon = True)
+        self.thread.start()
+
+    def produce(self):
+        '''
+        Body of the simulator thread: simulate, and buffer the events, until
+        the simulator is done or stop is called. The last batch is followed by
+        None.
+        '''
+        simulator = self.simulator
+        try:
+            while not self.stopping and not simulator.done():
+                start = wall_clock.time()
+                batch = []
+                event = None
+                while len(batch) < self.batch_size and not simulator.done():
+                    event = simulator.process_next_reaction()
+                    if event is None:
+                        break
+                    batch.append(Event(time = event.time,
+                                       rule = event.rule,
+                                       participants = [
+                                            self.consumer_node(node)
+                                            for node in event.participants],
+                                       time_issued = event.time_issued))
+                self.simulation_time += wall_clock.time() - start
+                self.events_produced += len(batch)
+                if batch:
+                    self.put(batch)
+                if event is None:
+                    break
+        except Exception as error:
+            self.error = error
+        self.put(None)
+
+    def put(self, batch):
+        # Check now and then for stop, rather than waiting forever for a
+        # consumer that's no longer taking events.
+        while not self.stopping:
+            try:
+                self.buffer.put(batch, timeout = 0.1)
+                return
+            except queue.Full:
+                pass
+
+    def consumer_node(self, node):
+        '''
+        Returns the node of the consumer's surface at the same place as a node
+        of the simulator's surface.
+        '''
+        if self.compact:
+            return CompactNode(self.surface, node.index)
+        return self.node_map[node]
+
+    def process_next_reaction(self):
+        '''
+        Returns the next event, after applying it to the consumer's surface,
+        or None if there are no more.
+        '''
+        if self.position >= len(self.batch):
+            if self.finished:
+                return None
+            self.occupancy_total += self.buffer.qsize()
+            self.batches_taken   += 1
+            batch = self.buffer.get()
+            if batch is None:
+                self.finished = True
+                if self.error is not None:
+                    raise self.error
+                return None
+            self.batch    = batch
+            self.position = 0
+        event = self.batch[self.position]
+        self.position += 1
+        for node, state in zip(event.participants, event.rule.outputs):
+            node.state = state
+        self.events_consumed += 1
+        return event
+
+    def done(self):
+        '''
+        True iff every event the simulator will produce has been taken.
+        '''
+        if self.position < len(self.batch):
+            return False
+        if self.finished:
+            return True
+        # Look for the end marker without waiting.
+        try:
+            batch = self.buffer.get_nowait()
+        except queue.Empty:
+            return False
+        if batch is None:
+            self.finished = True
+            if self.error is not None:
+                raise self.error
+            return True
+        self.batch    = batch
+        self.position = 0
+        return False
+
+    def stop(self):
+        '''
+        Stop the simulator thread, dropping any events not yet taken.
+        '''
+        self.stopping = True
+        self.thread.join()
+
+    def restart(self, time):
+        '''
+        Drop any events not yet taken, and restart the simulator from the
+        consumer's surface as it is now, at the given time.
+        '''
+        self.stop()
+        self.simulator.surface.set_global_state(
+                                            self.surface.get_global_state())
+        self.simulator.time = time
+        self.simulator.reset()
+        self.start()
+
+    def report(self):
+        '''
+        Returns a line of text on throughput: events simulated per second of
+        simulating, events taken per second overall, and how full the buffer
+        has been, on average, when the consumer took a batch.
+        '''
+        elapsed = max(wall_clock.time() - self.start_time, 1e-9)
+        simulated = self.events_produced / max(self.simulation_time, 1e-9)
+        occupancy = self.occupancy_total / max(self.batches_taken, 1)
+        return ("Simulator: %d events (%.0f events/s); display: %d events "
+                "(%.0f events/s); buffer: %d/%d batches now, %.1f on average."
+                % (self.events_produced, simulated, self.events_consumed,
+                   self.events_consumed / elapsed, self.buffer.qsize(),
+                   self.buffer_batches, occupancy))
+#end class EventProducer
+
+
+def copy_surface(surface):
+    '''
+    Returns a new grid of the same kind, size, and state as surface, for a
+    simulator to run on while surface is displayed. Raises an Exception for
+    surfaces that aren't grids.
+    '''
+    try:
+        copy = type(surface)(surface.x_size, surface.y_size,
+                             wrap = surface.wrap)
+    except (AttributeError, TypeError):
+        raise Exception("Can't copy a surface of type " +
+                        type(surface).__name__ + ".")
+    copy.set_global_state(surface.get_global_state())
+    return copy
@@ -0,0 +1,296 @@
+import math
+import numpy as np
+from surface_crns.simulators.totalistic_simulator import TotalisticSimulator
+
+class HashLifeSimulator(TotalisticSimulator):
+    '''
+    Simulator for synchronous totalistic cellular automata that can jump far
+    ahead in time, using Gosper's HashLife algorithm.
+
+    Ticks taken one at a time with process_next_reaction are computed exactly
+    as in TotalisticSimulator. advance(ticks), though, stores the lattice as a
+    quadtree of hash-consed nodes (identical blocks anywhere on the lattice,
+    at any time, are the same node) and memoizes, for every node, the state of
+    its central half 2^j ticks later. Advancing by 2^j ticks then takes work
+    proportional to the number of distinct blocks the pattern goes through
+    rather than to the area times the number of ticks, so patterns with a lot
+    of repetition in space and time (still lifes, oscillators, regular
+    circuitry, linear rules) can be run for millions of ticks. The memoized
+    results are kept between calls to advance, so later jumps get faster.
+
+    The lattice is surrounded by "wall" cells, which count as 0 toward their
+    neighbors' sums and never change, which is exactly how the edge of an
+    unwrapped grid behaves. HashLife is used on unwrapped square and
+    square-with-corner-leak grids; on other surfaces, advance falls back to
+    TotalisticSimulator's tick-by-tick update.
+    '''
+    # Once this many nodes have been made, the node table and memoized results
+    # are thrown away after the current call to advance.
+    max_nodes = 1 << 22
+
+    def compile_rule(self, update_options):
+        '''
+        Build the lookup table, as TotalisticSimulator does, and the tables
+        used by the quadtree.
+        '''
+        super(HashLifeSimulator, self).compile_rule(update_options)
+        self.hashed = self.geometry in ("square", "moore") and \
+                      not self.surface.wrap
+        if not self.hashed:
+            return
+        n_states = len(self.states)
+        # Code n_states is the wall, with value 0, which stays a wall.
+        self.wall = n_states
+        self.cell_values = self.values.tolist() + [0]
+        self.rule_table = [self.table[i * n_states:(i + 1) * n_states].tolist()
+                           for i in range(len(self.table) // n_states)]
+        if self.geometry == "square":
+            self.neighbor_offsets = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+        else:
+            self.neighbor_offsets = [(-1, 0), (1, 0), (0, -1), (0, 1),
+                                     (-1, -1), (1, -1), (1, 1), (-1, 1)]
+        self.clear_cache()
+
+    def clear_cache(self):
+        '''
+        Forget every quadtree node and memoized result.
+        '''
+        self.quads    = dict() # (nw, ne, sw, se) -> _QuadNode
+        self.uniform  = dict() # (level, code) -> node with every cell code
+        self.results  = dict() # (node, j) -> node's center 2^j ticks later
+
+    def join(self, nw, ne, sw, se):
+        '''
+        Returns the node with the given quadrants (nodes one level down, or
+        cell codes for a level 1 node).
+        '''
+        key  = (nw, ne, sw, se)
+        node = self.quads.get(key)
+        if node is None:
+            if isinstance(nw, _QuadNode):
+                level = nw.level + 1
+            else:
+                level = 1
+            node = _QuadNode(level, nw, ne, sw, se)
+            self.quads[key] = node
+        return node
+
+    def uniform_node(self, level, code):
+        '''
+        Returns the level node with every cell set to code.
+        '''
+        node = self.uniform.get((level, code))
+        if node is None:
+            if level == 0:
+                return code
+            child = self.uniform_node(level - 1, code)
+            node = self.join(child, child, child, child)
+            self.uniform[(level, code)] = node
+        return node
+
+    def build(self, codes):
+        '''
+        Returns the node for a square array of cell codes with sides a power
+        of two.
+        '''
+        size = codes.shape[0]
+        if size == 1:
+            return int(codes[0, 0])
+        first = codes[0, 0]
+        if (codes == first).all():
+            return self.uniform_node(size.bit_length() - 1, int(first))
+        half = size // 2
+        return self.join(self.build(codes[:half, :half]),
+                         self.build(codes[:half, half:]),
+                         self.build(codes[half:, :half]),
+                         self.build(codes[half:, half:]))
+
+    def expand(self, node, out, x0, y0):
+        '''
+        Write the cells of node, whose corner is at (x0, y0), into the parts
+        of the array out that it covers.
+        '''
+        if not isinstance(node, _QuadNode):
+            if 0 <= x0 < out.shape[0] and 0 <= y0 < out.shape[1]:
+                out[x0, y0] = node
+            return
+        size = 1 << node.level
+        if x0 >= out.shape[0] or y0 >= out.shape[1] or \
+           x0 + size <= 0 or y0 + size <= 0:
+            return
+        if node.code is not None:
+            out[max(x0, 0):x0 + size, max(y0, 0):y0 + size] = node.code
+            return
+        half = size // 2
+        self.expand(node.nw, out, x0,        y0)
+        self.expand(node.ne, out, x0,        y0 + half)
+        self.expand(node.sw, out, x0 + half, y0)
+        self.expand(node.se, out, x0 + half, y0 + half)
+
+    def pad(self, node):
+        '''
+        Returns the node one level up with node in its center, surrounded by
+        walls.
+        '''
+        wall = self.uniform_node(node.level - 1, self.wall)
+        return self.join(self.join(wall, wall, wall, node.nw),
+                         self.join(wall, wall, node.ne, wall),
+                         self.join(wall, node.sw, wall, wall),
+                         self.join(node.se, wall, wall, wall))
+
+    def base_step(self, node):
+        '''
+        Returns the level 1 node for the center of a level 2 node, one tick
+        later.
+        '''
+        nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+        cells = [[nw.nw, nw.ne, ne.nw, ne.ne],
+                 [nw.sw, nw.se, ne.sw, ne.se],
+                 [sw.nw, sw.ne, se.nw, se.ne],
+                 [sw.sw, sw.se, se.sw, se.se]]
+        values = self.cell_values
+        new_codes = []
+        for x, y in ((1, 1), (1, 2), (2, 1), (2, 2)):
+            code = cells[x][y]
+            if code == self.wall:
+                new_codes.append(code)
+                continue
+            neighbor_sum = sum(values[cells[x + dx][y + dy]]
+                               for dx, dy in self.neighbor_offsets)
+            new_code = self.rule_table[neighbor_sum - self.min_sum][code]
+            if new_code < 0:
+                raise Exception("No update option for neighbor total " +
+                                str(neighbor_sum) + " and state " +
+                                self.states[code] + ".")
+            new_codes.append(new_code)
+        return self.join(*new_codes)
+
+    def center(self, node):
+        '''
+        Returns the node one level down at the center of node.
+        '''
+        return self.join(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+    def successor(self, node, j):
+        '''
+        Returns the node for the center half of node, 2^j ticks later
+        (j <= node.level - 2).
+        '''
+        key = (node, j)
+        result = self.results.get(key)
+        if result is not None:
+            return result
+        if node.code is not None:
+            # Uniform walls stay walls; other uniform blocks are computed.
+            if node.code == self.wall:
+                result = self.uniform_node(node.level - 1, self.wall)
+                self.results[key] = result
+                return result
+        if node.level == 2:
+            result = self.base_step(node)
+        else:
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            # Nine overlapping nodes one level down, covering node.
+            n00 = nw
+            n01 = self.join(nw.ne, ne.nw, nw.se, ne.sw)
+            n02 = ne
+            n10 = self.join(nw.sw, nw.se, sw.nw, sw.ne)
+            n11 = self.join(nw.se, ne.sw, sw.ne, se.nw)
+            n12 = self.join(ne.sw, ne.se, se.nw, se.ne)
+            n20 = sw
+            n21 = self.join(sw.ne, se.nw, sw.se, se.sw)
+            n22 = se
+            if j == node.level - 2:
+                # Full speed: two jumps of 2^(j-1) ticks each.
+                r = [self.successor(n, j - 1) for n in
+                     (n00, n01, n02, n10, n11, n12, n20, n21, n22)]
+                result = self.join(
+                    self.successor(self.join(r[0], r[1], r[3], r[4]), j - 1),
+                    self.successor(self.join(r[1], r[2], r[4], r[5]), j - 1),
+                    self.successor(self.join(r[3], r[4], r[6], r[7]), j - 1),
+                    self.successor(self.join(r[4], r[5], r[7], r[8]), j - 1))
+            else:
+                # Slower: one jump of 2^j ticks, on the nine nodes' centers.
+                c = [self.center(n) for n in
+                     (n00, n01, n02, n10, n11, n12, n20, n21, n22)]
+                result = self.join(
+                    self.successor(self.join(c[0], c[1], c[3], c[4]), j),
+                    self.successor(self.join(c[1], c[2], c[4], c[5]), j),
+                    self.successor(self.join(c[3], c[4], c[6], c[7]), j),
+                    self.successor(self.join(c[4], c[5], c[7], c[8]), j))
+        self.results[key] = result
+        return result
+
+    def advance(self, ticks):
+        '''
+        Advance the simulation by up to ticks ticks (stopping at the end of
+        the simulation) without producing events, then write the result to
+        the surface.
+        '''
+        ticks = min(ticks, max(0, math.ceil(self.simulation_duration -
+                                            self.time)))
+        if not self.hashed or ticks <= 0:
+            super(HashLifeSimulator, self).advance(ticks)
+            return
+
+        # Put the lattice in the corner of the smallest power-of-two square
+        # holding it, filled out with walls. offset is the position of the
+        # lattice's corner in the universe.
+        x_size, y_size = self.shape
+        size  = max(x_size, y_size)
+        level = max(1, (size - 1).bit_length())
+        codes = np.full((1 << level, 1 << level), self.wall, dtype = np.int64)
+        codes[:x_size, :y_size] = self.current
+        universe = self.build(codes)
+        offset   = 0
+
+        # One jump per set bit of ticks. Before each jump, the universe is
+        # padded with walls until it is big enough for the jump and the
+        # lattice is inside its center half, which is what the jump returns.
+        for j in range(ticks.bit_length()):
+            if not (ticks >> j) & 1:
+                continue
+            while universe.level < j + 2 or \
+                  offset < 1 << (universe.level - 2) or \
+                  offset + size > 3 << (universe.level - 2):
+                offset  += 1 << (universe.level - 1)
+                universe = self.pad(universe)
+            offset  -= 1 << (universe.level - 2)
+            universe = self.successor(universe, j)
+
+        self.expand(universe, self.current, -offset, -offset)
+        self.time += ticks
+        self.ticks_computed += ticks
+        self.write_surface()
+        # Ticks in between weren't hashed, so start looking for cycles afresh.
+        self.rehash()
+        self.cycles.clear()
+        self.cycles.record(self.zobrist.value, self.time)
+        if len(self.quads) > self.max_nodes:
+            self.clear_cache()
+#end class HashLifeSimulator
+
+
+class _QuadNode(object):
+    '''
+    A square block of 2^level x 2^level cells, made of four quadrants.
+    Nodes are unique (see HashLifeSimulator.join), so they compare and hash by
+    identity. code is the code of every cell if they are all the same, or
+    None.
+    '''
+    __slots__ = ('level', 'nw', 'ne', 'sw', 'se', 'code')
+
+    def __init__(self, level, nw, ne, sw, se):
+        self.level = level
+        self.nw = nw
+        self.ne = ne
+        self.sw = sw
+        self.se = se
+        if level == 1:
+            uniform = nw == ne == sw == se
+            self.code = nw if uniform else None
+        else:
+            uniform = nw.code is not None and \
+                      nw.code == ne.code == sw.code == se.code
+            self.code = nw.code if uniform else None
+#end class _QuadNode
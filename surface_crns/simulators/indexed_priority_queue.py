@@ -0,0 +1,136 @@
+class IndexedPriorityQueue(object):
+    '''
+    Binary min-heap of items addressed by a hashable key. Unlike heapq, an
+    item's priority can be changed, and an item can be removed, in O(log N)
+    without leaving stale entries behind, so the heap only ever holds live
+    items.
+
+    Iterating over the queue yields the stored items in heap (not sorted)
+    order.
+    '''
+    def __init__(self):
+        self.heap     = []     # Entries [priority, key, item]
+        self.position = dict() # key -> index of its entry in self.heap
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, key):
+        return key in self.position
+
+    def __iter__(self):
+        return (entry[2] for entry in self.heap)
+
+    def push(self, key, priority, item = None):
+        '''
+        Add an item with the given key and priority, or, if the key is already
+        in the queue, replace its priority and item.
+        '''
+        if key in self.position:
+            self.update(key, priority, item)
+            return
+        self.heap.append([priority, key, item])
+        self.position[key] = len(self.heap) - 1
+        self._sift_up(len(self.heap) - 1)
+
+    def update(self, key, priority, item = None):
+        '''
+        Change the priority (and, if given, the item) of the entry with key.
+        '''
+        idx   = self.position[key]
+        entry = self.heap[idx]
+        old_priority = entry[0]
+        entry[0] = priority
+        if item is not None:
+            entry[2] = item
+        if priority < old_priority:
+            self._sift_up(idx)
+        else:
+            self._sift_down(idx)
+
+    def remove(self, key):
+        '''
+        Remove the entry with key and return its item.
+        '''
+        idx   = self.position.pop(key)
+        entry = self.heap[idx]
+        last  = self.heap.pop()
+        if idx < len(self.heap):
+            self.heap[idx] = last
+            self.position[last[1]] = idx
+            self._sift_up(idx)
+            self._sift_down(self.position[last[1]])
+        return entry[2]
+
+    def discard(self, key):
+        '''
+        Remove the entry with key, if there is one.
+        '''
+        if key in self.position:
+            self.remove(key)
+
+    def peek(self):
+        '''
+        Returns (key, priority, item) for the entry with the lowest priority,
+        without removing it.
+        '''
+        priority, key, item = self.heap[0]
+        return key, priority, item
+
+    def pop(self):
+        '''
+        Remove the entry with the lowest priority and return
+        (key, priority, item).
+        '''
+        priority, key, item = self.heap[0]
+        self.remove(key)
+        return key, priority, item
+
+    def priority(self, key):
+        return self.heap[self.position[key]][0]
+
+    def item(self, key):
+        return self.heap[self.position[key]][2]
+
+    def clear(self):
+        self.heap     = []
+        self.position = dict()
+
+    def _sift_up(self, idx):
+        heap     = self.heap
+        position = self.position
+        entry    = heap[idx]
+        while idx > 0:
+            parent_idx = (idx - 1) >> 1
+            parent     = heap[parent_idx]
+            if entry[0] < parent[0]:
+                heap[idx] = parent
+                position[parent[1]] = idx
+                idx = parent_idx
+            else:
+                break
+        heap[idx] = entry
+        position[entry[1]] = idx
+
+    def _sift_down(self, idx):
+        heap     = self.heap
+        position = self.position
+        size     = len(heap)
+        entry    = heap[idx]
+        while True:
+            child_idx = 2 * idx + 1
+            if child_idx >= size:
+                break
+            right_idx = child_idx + 1
+            if right_idx < size and heap[right_idx][0] < heap[child_idx][0]:
+                child_idx = right_idx
+            child = heap[child_idx]
+            if child[0] < entry[0]:
+                heap[idx] = child
+                position[child[1]] = idx
+                idx = child_idx
+            else:
+                break
+        heap[idx] = entry
+        position[entry[1]] = idx
+#end class IndexedPriorityQueue
@@ -0,0 +1,80 @@
+import math
+from surface_crns.simulators.event import Event
+from surface_crns.simulators.reaction_channels import ChannelSimulator
+from surface_crns.simulators.indexed_priority_queue import IndexedPriorityQueue
+
+class NextReactionSimulator(ChannelSimulator):
+    '''
+    Surface CRN simulator using the Gibson-Bruck next-reaction method.
+
+    Every live reaction channel (a rule together with the node or pair of
+    neighboring nodes it could fire on, see ReactionChannels) has exactly one
+    entry in an indexed priority queue, holding the putative time at which
+    that channel fires next. When an event fires, only the channels involving
+    nodes whose state changed are revisited: channels that died are removed
+    from the queue, channels that came alive are scheduled, and channels that
+    are still live keep their putative times (a channel's rate depends only on
+    its rule and edge weight, so the time already drawn for it is still
+    valid). Only the channel that fired draws a fresh time.
+
+    Unlike QueueSimulator, no out-of-date events are ever stored, so the queue
+    never holds more entries than there are live channels and every pop is a
+    real reaction.
+
+    Drop-in replacement for QueueSimulator. Uses unimolecular and bimolecular
+    reactions only.
+    '''
+    def make_event_queue(self):
+        return IndexedPriorityQueue()
+
+    def add_channel(self, key, rule, participants, rate):
+        '''
+        Draw a fresh firing time for a channel and put it in the queue,
+        replacing any time already scheduled for it.
+        '''
+        time_to_reaction = self.rng.waiting_time(rate)
+        if math.isinf(time_to_reaction):
+            self.remove_channel(key)
+            return
+        nodes = self.channels.nodes
+        new_event = Event(time = self.time + time_to_reaction,
+                          rule = rule,
+                          participants = [nodes[i] for i in participants],
+                          time_issued = self.time)
+        self.event_queue.push(key, new_event.time, new_event)
+        self.track_channel(key, participants)
+
+    def remove_channel(self, key):
+        '''
+        Remove a channel from the queue, if it is scheduled.
+        '''
+        if key not in self.event_queue:
+            return
+        self.untrack_channel(key, self.channels.participants(key))
+        self.event_queue.remove(key)
+
+    def select_channel(self):
+        '''
+        The channel that fires next is the one scheduled soonest.
+        '''
+        if len(self.event_queue) == 0:
+            return None
+        key, event_time, next_reaction = self.event_queue.peek()
+        if event_time > self.simulation_duration:
+            return None
+        return key, self.channels.participants(key), next_reaction
+
+    def channel_fired(self, key, participants, event):
+        '''
+        The channel that fired needs a new time if it can fire again.
+        '''
+        if key not in self.event_queue:
+            return
+        _, first_node, slot = key
+        rule = event.rule
+        if slot < 0:
+            rate = rule.rate
+        else:
+            rate = rule.rate * self.channels.neighbors[first_node][slot][1]
+        self.add_channel(key, rule, participants, rate)
+#end class NextReactionSimulator
@@ -0,0 +1,136 @@
+class PropensityTree(object):
+    '''
+    Binary sum tree over the propensities of a changing set of reaction
+    channels, addressed by a hashable key. Supports adding, removing, and
+    reweighting a channel and sampling a channel with probability proportional
+    to its propensity, all in O(log N).
+
+    The tree is stored in a flat list: leaves live at positions
+    capacity..2*capacity-1 and the node at position p holds the sum of
+    positions 2p and 2p+1, so self.tree[1] is the total propensity. Internal
+    sums are recomputed from their children on every update rather than
+    adjusted by differences, so rounding error does not accumulate over long
+    runs. Leaves freed by removed channels are reused, and the capacity doubles
+    when it runs out.
+
+    Iterating over the tree yields the stored items, in no particular order.
+    '''
+    def __init__(self, capacity = 16):
+        self.capacity = 1
+        while self.capacity < capacity:
+            self.capacity *= 2
+        self.tree   = [0.0] * (2 * self.capacity)
+        self.items  = [None] * self.capacity
+        self.keys   = [None] * self.capacity
+        self.slots  = dict() # key -> leaf slot
+        self.free_slots = list(range(self.capacity - 1, -1, -1))
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, key):
+        return key in self.slots
+
+    def __iter__(self):
+        return (self.items[slot] for slot in self.slots.values())
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def add(self, key, propensity, item = None):
+        '''
+        Add a channel with the given key, propensity, and item, or, if the key
+        is already present, replace its propensity and item.
+        '''
+        if key in self.slots:
+            slot = self.slots[key]
+        else:
+            if not self.free_slots:
+                self._grow()
+            slot = self.free_slots.pop()
+            self.slots[key] = slot
+            self.keys[slot] = key
+        self.items[slot] = item
+        self._set(slot, propensity)
+
+    def update(self, key, propensity):
+        '''
+        Change the propensity of the channel with key.
+        '''
+        self._set(self.slots[key], propensity)
+
+    def remove(self, key):
+        '''
+        Remove the channel with key and return its item.
+        '''
+        slot = self.slots.pop(key)
+        item = self.items[slot]
+        self.items[slot] = None
+        self.keys[slot]  = None
+        self._set(slot, 0.0)
+        self.free_slots.append(slot)
+        return item
+
+    def discard(self, key):
+        '''
+        Remove the channel with key, if there is one.
+        '''
+        if key in self.slots:
+            self.remove(key)
+
+    def propensity(self, key):
+        return self.tree[self.capacity + self.slots[key]]
+
+    def item(self, key):
+        return self.items[self.slots[key]]
+
+    def sample(self, u):
+        '''
+        Returns (key, propensity, item) for the channel whose share of the
+        cumulative propensity contains u, where 0 <= u < self.total. Drawing u
+        uniformly picks each channel with probability proportional to its
+        propensity.
+        '''
+        tree     = self.tree
+        capacity = self.capacity
+        p = 1
+        while p < capacity:
+            left = tree[2 * p]
+            # Rounding can leave u just past the last nonzero leaf; never
+            # descend into an empty subtree.
+            if u < left or tree[2 * p + 1] <= 0:
+                p = 2 * p
+            else:
+                u -= left
+                p = 2 * p + 1
+        slot = p - capacity
+        return self.keys[slot], tree[p], self.items[slot]
+
+    def clear(self):
+        self.__init__(self.capacity)
+
+    def _set(self, slot, propensity):
+        tree = self.tree
+        p = self.capacity + slot
+        tree[p] = propensity
+        p >>= 1
+        while p:
+            tree[p] = tree[2 * p] + tree[2 * p + 1]
+            p >>= 1
+
+    def _grow(self):
+        '''
+        Double the capacity, keeping every channel in its slot.
+        '''
+        old_capacity = self.capacity
+        old_leaves   = self.tree[old_capacity:]
+        self.capacity = 2 * old_capacity
+        self.tree  = [0.0] * self.capacity + old_leaves + \
+                     [0.0] * old_capacity
+        for p in range(self.capacity - 1, 0, -1):
+            self.tree[p] = self.tree[2 * p] + self.tree[2 * p + 1]
+        self.items.extend([None] * old_capacity)
+        self.keys.extend([None] * old_capacity)
+        self.free_slots.extend(range(self.capacity - 1, old_capacity - 1, -1))
+#end class PropensityTree
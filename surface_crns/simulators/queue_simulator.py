@@ -1,5 +1,3 @@
-import numpy as np
-import random
 import math
 
 # Different queue timings:
@@ -13,8 +11,12 @@ import math
 # from queue import *
 import _heapq as heapq
 from surface_crns.simulators.event import Event
+from surface_crns.simulators.random_stream import RandomStream
+from surface_crns.simulators.state_hash import HashedStateMixin
+from surface_crns.simulators.rule_index import RuleIndex
+from surface_crns.simulators.channel_arrays import ChannelArrays
 
-class QueueSimulator:
+class QueueSimulator(HashedStateMixin):
     '''
     Surface CRN simulator based on Gillespie-like next-reaction determination
     at each node. Upcoming reactions are stored in a priority queue, sorted
@@ -26,7 +28,8 @@ class QueueSimulator:
     Uses unimolecular and bimolecular reactions only.
     '''
     def __init__(self, surface = None, transition_rules = None, seed = None,
-                 simulation_duration = 100, debug = False):
+                 simulation_duration = 100, debug = False,
+                 legacy_rng = False):
         self.debug = debug
         if transition_rules is None:
             self.rule_set = []
@@ -38,20 +41,18 @@ class QueueSimulator:
         else:
             import time
             self.seed = int(time.time()) # use fractional seconds
-        random.seed(self.seed)
+        self.rng = RandomStream(self.seed, legacy = legacy_rng)
         self.simulation_duration = simulation_duration
         self.surface = surface
         self.init_state = surface.get_global_state()
 
-        # Build a mapping of states to the possible transitions they could
-        # undergo.
-        self.rules_by_state = dict()
-        for rule in self.rule_set:
-            for input_state in rule.inputs:
-                if not input_state in self.rules_by_state:
-                    self.rules_by_state[input_state] = []
-                if not rule in self.rules_by_state[input_state]:
-                    self.rules_by_state[input_state].append(rule)
+        # Compile the rules into a lookup table from (state, neighbor state)
+        # to the reactions nodes with those states could undergo.
+        self.rule_index = RuleIndex(self.rule_set)
+        self.rules_by_state = self.rule_index.rules_by_state
+        # Array form of the surface, used to find the initial reactions in
+        # bulk. Built on the first reset.
+        self.channel_arrays = None
 
         self.time = 0
         self.surface.set_global_state(self.init_state)
@@ -68,16 +69,47 @@ class QueueSimulator:
         '''
         self.event_queue = []
         self.initialize_reactions()
+        self.rehash_state()
 
     def initialize_reactions(self):
         '''
         Populate the reaction queue with initial reactions.
+
+        Every initial reaction is found at once with array operations (see
+        ChannelArrays), all of their waiting times are drawn in one call, and
+        the queue is built with a single heapify. With legacy_rng, nodes are
+        instead visited one at a time, so that random numbers are used in the
+        same order as in older versions.
         '''
-        for node in self.surface:
-            node.timestamp = self.time
-            self.add_next_reactions_with_node(node=node,
-                                              first_reactant_only=True,
-                                              exclusion_list = [])
+        if self.rng.legacy:
+            for node in self.surface:
+                node.timestamp = self.time
+                self.add_next_reactions_with_node(node=node,
+                                                  first_reactant_only=True,
+                                                  exclusion_list = [])
+            return
+
+        if self.channel_arrays is None:
+            self.channel_arrays = ChannelArrays(self.surface, self.rule_index)
+        arrays = self.channel_arrays
+        arrays.set_timestamps(self.time)
+        rule_numbers, first_nodes, second_nodes, rates = \
+                                            arrays.first_reactant_channels()
+        event_times = self.time + \
+                      self.rng.exponential_array(len(rates)) / rates
+        nodes = arrays.nodes
+        rules = self.rule_index.rules
+        self.event_queue = [
+            Event(time = event_time,
+                  rule = rules[rule_number],
+                  participants = [nodes[first]] if second < 0 else
+                                 [nodes[first], nodes[second]],
+                  time_issued = self.time)
+            for event_time, rule_number, first, second in
+                zip(event_times.tolist(), rule_numbers.tolist(),
+                    first_nodes.tolist(), second_nodes.tolist())]
+        heapq.heapify(self.event_queue)
+
     def done(self):
         '''
         True iff there are no more reactions or the simulation has reached
@@ -162,6 +194,7 @@ class QueueSimulator:
         if local_debugging:
             print("process_next_reaction() returning event " +
                   str(next_reaction))
+        self.hash_event(next_reaction)
         return next_reaction
     #end def process_next_reaction
 
@@ -179,29 +212,54 @@ class QueueSimulator:
         surface easier.
 
         Nodes in exclusion_list are not considered eligible for reaction.
+
+        Candidate reactions come from the precompiled rule index, so this costs
+        O(degree + matching reactions) rather than O(rules for state x degree).
+        Reactions are still scheduled in the order a scan of
+        rules_by_state[node.state] would produce, so runs with a given seed
+        are unchanged.
         '''
         local_debugging = False
         if exclusion_list is None:
             exclusion_list = []
-        if node.state not in self.rules_by_state:
+        state = node.state
+        if state not in self.rules_by_state:
             if local_debugging:
-                print("No reactions possible with state " + node.state)
+                print("No reactions possible with state " + state)
             return
-        for rule in self.rules_by_state[node.state]:
-            if local_debugging:
-                print("Checking rule\n\t" + str(rule) + "\nagainst node\n\t" + \
-                      str(node))
-            if (first_reactant_only     and node.state != rule.inputs[0]) or \
-               (not first_reactant_only and not node.state in rule.inputs):
-                    # Not eligible for reaction. Don't add.
-                    if local_debugging:
-                        print("Rule rejected: input 1 doesn't match.")
-                    continue
 
+        # Each channel is (rule order, neighbor order, rule, neighbor node,
+        # node index, edge weight, number of reactions).
+        channels = [(order, -1, rule, None, 0, 1, 1) for
+                    order, rule, _, _ in
+                    self.rule_index.unimolecular_channels(state)]
+        partners = self.rule_index.bimolecular_partners(state,
+                                                        first_reactant_only)
+        if partners:
+            n_unimolecular = len(channels)
+            neighbor_order = 0
+            for neighbor_node, weight in node.neighbors:
+                matches = partners.get(neighbor_node.state)
+                if matches and neighbor_node not in exclusion_list:
+                    for order, rule, node_index, num_reactions in matches:
+                        channels.append((order, neighbor_order, rule,
+                                         neighbor_node, node_index, weight,
+                                         num_reactions))
+                neighbor_order += 1
+            # (rule order, neighbor order) is unique, so sorting never needs
+            # to compare the rules themselves.
+            if len(channels) > 1 and len(channels) > n_unimolecular:
+                channels.sort()
+
+        for _, _, rule, neighbor_node, node_index, weight, num_reactions in \
+                                                                    channels:
+            if local_debugging:
+                print("Scheduling rule\n\t" + str(rule) + \
+                      "\nfor node\n\t" + str(node))
             # If it's a unimolecular reaction, we can now add the reaction to
             # the event queue.
-            if len(rule.inputs) == 1:
-                time_to_reaction = np.log(1.0 / random.random()) / rule.rate
+            if neighbor_node is None:
+                time_to_reaction = self.rng.waiting_time(rule.rate)
                 if math.isinf(time_to_reaction):
                     continue
                 event_time       = self.time + time_to_reaction
@@ -212,63 +270,29 @@ class QueueSimulator:
                 heapq.heappush(self.event_queue, new_event)
                 if local_debugging:
                     print("Event added: " + str(new_event))
-                    print(str(new_event))
+                continue
 
-            elif len(rule.inputs) == 2:
-                # If a bimolecular reaction, then we need to keep track of
-                # which reactant this node is, so that we can check the other
-                # one against each neighbor.
-                if first_reactant_only:
-                    node_index = 0
-                else:
-                    node_index = rule.inputs.index(node.state)
+            # If the two inputs are identical and the this node could be
+            # either reactant, then the reaction needs to be counted twice.
+            for x in range(num_reactions):
+                rate = rule.rate * weight
+                time_to_reaction = self.rng.waiting_time(rate)
+                if math.isinf(time_to_reaction):
+                    continue
+                event_time       = self.time + time_to_reaction
+                new_participants = [None, None]
+                new_participants[node_index] = node
+                new_participants[1-node_index] = neighbor_node
+                # If counting the reaction twice, it needs to be flipped
+                # for the second reaction. Example: A + A -> B + C
+                if x == 2:
+                    new_participants.reverse()
+                new_event = Event(time = event_time,
+                                  rule = rule,
+                                  participants = new_participants,
+                                  time_issued = self.time)
+                heapq.heappush(self.event_queue, new_event)
                 if local_debugging:
-                    print("First node has index " + str(node_index))
-
-                for neighbor_node, weight in node.neighbors:
-                    if local_debugging:
-                        print("\tChecking neighbor node with state " + \
-                                neighbor_node.state)
-                    if neighbor_node.state != rule.inputs[1-node_index]:
-                        # Not eligible for reaction
-                        if local_debugging:
-                            print("Rule rejected: input 2 doesn't match.")
-                        continue
-                    if neighbor_node in exclusion_list:
-                        if local_debugging:
-                            print("Neighbor is on exclusion list. Moving on.")
-                        continue
-
-                    # If the two inputs are identical and the this node could
-                    # be either reactant, then the reaction needs to be counted
-                    # twice.
-                    if not first_reactant_only and \
-                       rule.inputs[0] == rule.inputs[1]:
-                        num_reactions = 2
-                    else:
-                        num_reactions = 1
-                    for x in range(num_reactions):
-                        rate = rule.rate * weight
-                        time_to_reaction = np.log(1.0/random.random())/rate
-                        if math.isinf(time_to_reaction):
-                            continue
-                        event_time       = self.time + time_to_reaction
-                        new_participants = [None, None]
-                        new_participants[node_index] = node
-                        new_participants[1-node_index] = neighbor_node
-                        # If counting the reaction twice, it needs to be flipped
-                        # for the second reaction. Example: A + A -> B + C
-                        if x == 2:
-                            new_participants.reverse()
-                        new_event = Event(time = event_time,
-                                          rule = rule,
-                                          participants = new_participants,
-                                          time_issued = self.time)
-                        heapq.heappush(self.event_queue, new_event)
-                        if local_debugging:
-                            print("Event added: " + str(new_event))
-            else:
-                raise Exception("Error in transition rule " + str(rule) + \
-                                "\nOnly rules with one or two inputs allowed!")
+                    print("Event added: " + str(new_event))
     #end def add_next_reactions_with_node
 # end class QueueSimulator
\ No newline at end of file
@@ -1,10 +1,10 @@
-import numpy as np
-import random
 import math
-import heapq
 from surface_crns.simulators.event import Event
+from surface_crns.simulators.random_stream import RandomStream
+from surface_crns.simulators.state_hash import HashedStateMixin
+from surface_crns.simulators.indexed_priority_queue import IndexedPriorityQueue
 
-class EagerQueueSimulator:
+class EagerQueueSimulator(HashedStateMixin):
     '''
     Surface CRN simulator based on Gillespie-like next-reaction determination
     at each node. Upcoming reactions are stored in a priority queue, sorted
@@ -13,17 +13,19 @@ class EagerQueueSimulator:
     are used to ensure that a node does not react if it was changed between the
     time its reaction was issued and the time the reaction would occur.
 
-    Removes out-of-date reactions eagerly, meaning that each time a new reaction
-    is added to the queue, out-of-date reactions are immediately removed. This 
-    takes time (linearly) proportional to the number of possible reactions, but 
-    makes each (logN) dequeue reaction faster. 
-
-    Not sure yet if this is efficient for any practical problems.
+    Removes out-of-date reactions eagerly, meaning that as soon as a node
+    changes state, every reaction it was scheduled to take part in is removed
+    from the queue. Events are kept in an indexed priority queue, along with an
+    index of the keys of the events each node takes part in, so invalidating a
+    node's events costs O(log N) per event rather than a pass over the whole
+    queue. The queue never holds out-of-date events, and every dequeued event
+    is a real reaction.
 
     Uses unimolecular and bimolecular reactions only.
     '''
     def __init__(self, surface = None, transition_rules = None, seed = None,
-                 simulation_duration = 100, debug = False):
+                 simulation_duration = 100, debug = False,
+                 legacy_rng = False):
         self.debug = debug
         if transition_rules is None:
             self.rule_set = []
@@ -35,7 +37,7 @@ class EagerQueueSimulator:
         else:
             import time
             self.seed = int(time.time()) # use fractional seconds
-        random.seed(self.seed)
+        self.rng = RandomStream(self.seed, legacy = legacy_rng)
         self.simulation_duration = simulation_duration
         self.surface = surface
         self.init_state = surface.get_global_state()
@@ -63,8 +65,13 @@ class EagerQueueSimulator:
         '''
         Clear any reactions in the queue and populate with available reactions.
         '''
-        self.event_queue = []
+        self.event_queue = IndexedPriorityQueue()
+        # Keys of the queued events each node takes part in, for nodes that
+        # take part in any.
+        self.node_events = dict()
+        self.next_key = 0
         self.initialize_reactions()
+        self.rehash_state()
 
     def initialize_reactions(self):
         '''
@@ -77,7 +84,30 @@ class EagerQueueSimulator:
                                               exclusion_list = [])
 
     def add_reaction_to_queue(self, reaction):
-        heapq.heappush(self.event_queue, reaction)
+        key = self.next_key
+        self.next_key += 1
+        self.event_queue.push(key, reaction.time, reaction)
+        for node in reaction.participants:
+            if node in self.node_events:
+                self.node_events[node].add(key)
+            else:
+                self.node_events[node] = {key}
+
+    def remove_reactions_with_node(self, node):
+        '''
+        Remove every queued reaction that node takes part in.
+        '''
+        keys = self.node_events.pop(node, None)
+        if keys is None:
+            return
+        for key in keys:
+            reaction = self.event_queue.remove(key)
+            for other in reaction.participants:
+                if other != node:
+                    other_keys = self.node_events[other]
+                    other_keys.discard(key)
+                    if not other_keys:
+                        del self.node_events[other]
 
     def done(self):
         '''
@@ -101,7 +131,7 @@ class EagerQueueSimulator:
             self.time = self.simulation_duration
             return None
 
-        next_reaction = heapq.heappop(self.event_queue)
+        next_reaction = self.event_queue.peek()[2]
         if next_reaction.time > self.simulation_duration:
             self.time = self.simulation_duration
             return None
@@ -123,12 +153,10 @@ class EagerQueueSimulator:
         if local_debugging:
             print("processed.")
 
-        # Empty the priority queue of anything involving site changed in 
-        # this reaction.
+        # Empty the priority queue of anything involving a site changed in
+        # this reaction (including this reaction itself).
         for site in participants:
-            self.event_queue = [r for r in self.event_queue 
-                                if not site in r.participants]
-        heapq.heapify(self.event_queue)
+            self.remove_reactions_with_node(site)
 
         # Determine the next reactions performed by each participant
         # changed in this reaction.
@@ -148,6 +176,7 @@ class EagerQueueSimulator:
                                         exclusion_list = [participants[0]])
         if local_debugging:
             print(f"process_next_reaction() returning event {next_reaction}")
+        self.hash_event(next_reaction)
         return next_reaction
     #end def process_next_reaction
 
@@ -187,7 +216,7 @@ class EagerQueueSimulator:
             # If it's a unimolecular reaction, we can now add the reaction to
             # the event queue.
             if len(rule.inputs) == 1:
-                time_to_reaction = np.log(1.0 / random.random()) / rule.rate
+                time_to_reaction = self.rng.waiting_time(rule.rate)
                 if math.isinf(time_to_reaction):
                     continue
                 event_time       = self.time + time_to_reaction
@@ -235,7 +264,7 @@ class EagerQueueSimulator:
                         num_reactions = 1
                     for x in range(num_reactions):
                         rate = rule.rate * weight
-                        time_to_reaction = np.log(1.0/random.random())/rate
+                        time_to_reaction = self.rng.waiting_time(rate)
                         if math.isinf(time_to_reaction):
                             continue
                         event_time       = self.time + time_to_reaction
@@ -257,4 +286,4 @@ class EagerQueueSimulator:
                 raise Exception("Error in transition rule " + str(rule) + \
                                 "\nOnly rules with one or two inputs allowed!")
     #end def add_next_reactions_with_node
-# end class QueueSimulator
\ No newline at end of file
+# end class EagerQueueSimulator
\ No newline at end of file
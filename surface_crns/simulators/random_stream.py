@@ -0,0 +1,78 @@
+import numpy as np
+import random
+
+class RandomStream(object):
+    '''
+    Source of the random numbers used by a simulator.
+
+    Each stream owns a numpy.random.Generator seeded from seed, so simulators
+    don't share random state with each other or with anything else using the
+    random module. Exponential and uniform variates are drawn from the
+    generator in blocks of block_size and handed out one at a time, which
+    costs far less per number than calling numpy on scalars. A stream with a
+    given seed always produces the same numbers.
+
+    If legacy is True, the stream instead seeds the global random module and
+    reproduces the numbers the simulators used before, np.log(1/random.random())
+    for exponentials and random.random() for uniforms, so that runs can be
+    compared bit for bit with results from older versions.
+    '''
+    def __init__(self, seed = None, legacy = False, block_size = 4096):
+        self.seed       = seed
+        self.legacy     = legacy
+        self.block_size = block_size
+        self.exponentials = []
+        self.uniforms     = []
+        if legacy:
+            random.seed(seed)
+            self.generator = None
+        else:
+            self.generator = np.random.default_rng(seed)
+
+    def exponential(self):
+        '''
+        Returns a standard (mean 1) exponential variate.
+        '''
+        if self.legacy:
+            return np.log(1.0 / random.random())
+        try:
+            return self.exponentials.pop()
+        except IndexError:
+            self.exponentials = self.generator.standard_exponential(
+                                                    self.block_size).tolist()
+            return self.exponentials.pop()
+
+    def exponential_array(self, n):
+        '''
+        Returns a numpy array of n standard exponential variates.
+        '''
+        if self.legacy:
+            return np.array([np.log(1.0 / random.random()) for _ in range(n)])
+        return self.generator.standard_exponential(n)
+
+    def waiting_time(self, rate):
+        '''
+        Returns an exponentially distributed waiting time with the given rate
+        (infinite if the rate is 0).
+        '''
+        if self.legacy:
+            return np.log(1.0 / random.random()) / rate
+        if rate <= 0:
+            return float("inf")
+        try:
+            return self.exponentials.pop() / rate
+        except IndexError:
+            return self.exponential() / rate
+
+    def uniform(self):
+        '''
+        Returns a uniform variate on [0, 1).
+        '''
+        if self.legacy:
+            return random.random()
+        try:
+            return self.uniforms.pop()
+        except IndexError:
+            self.uniforms = self.generator.random(self.block_size).tolist()
+            return self.uniforms.pop()
+#end class RandomStream
@@ -0,0 +1,141 @@
+import math
+
+class RateBuckets(object):
+    '''
+    Reaction channels grouped by rate, for composition-rejection sampling.
+
+    Channels are grouped either by exact rate or, if exact_rates is False, by
+    power of two (a channel with rate r goes in the bucket for 2**(e-1) <= r <
+    2**e). Each bucket keeps its channels in flat lists, so adding a channel
+    is an append and removing one swaps the last channel into its place; both
+    are O(1).
+
+    Sampling picks a bucket with probability proportional to its total
+    propensity (a scan over the buckets, of which there are only ever a
+    handful), then a channel inside the bucket uniformly at random, accepting
+    it with probability rate / (bucket's upper bound) and retrying otherwise.
+    Since every rate in a bucket is more than half its upper bound, fewer than
+    two tries are needed on average, and with exact rates every try succeeds.
+    The cost of a sample therefore doesn't depend on the number of channels.
+
+    Iterating over the buckets yields the stored items, in no particular order.
+    '''
+    def __init__(self, exact_rates = False):
+        self.exact_rates = exact_rates
+        self.buckets   = dict() # group -> _RateBucket
+        self.locations = dict() # key -> (bucket, position in bucket)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def __contains__(self, key):
+        return key in self.locations
+
+    def __iter__(self):
+        for bucket in self.buckets.values():
+            for item in bucket.items:
+                yield item
+
+    @property
+    def total(self):
+        return sum(bucket.total for bucket in self.buckets.values())
+
+    def add(self, key, rate, item = None):
+        '''
+        Add a channel with the given key, rate (> 0), and item, or, if the key
+        is already present, replace its rate and item.
+        '''
+        if key in self.locations:
+            self.remove(key)
+        if self.exact_rates:
+            group = rate
+        else:
+            group = math.frexp(rate)[1]
+        bucket = self.buckets.get(group)
+        if bucket is None:
+            if self.exact_rates:
+                bucket = _RateBucket(rate)
+            else:
+                bucket = _RateBucket(math.ldexp(1.0, group))
+            self.buckets[group] = bucket
+        self.locations[key] = (bucket, len(bucket.keys))
+        bucket.keys.append(key)
+        bucket.rates.append(rate)
+        bucket.items.append(item)
+        bucket.total += rate
+
+    def remove(self, key):
+        '''
+        Remove the channel with key and return its item.
+        '''
+        bucket, position = self.locations.pop(key)
+        item = bucket.items[position]
+        rate = bucket.rates[position]
+        last_key  = bucket.keys.pop()
+        last_rate = bucket.rates.pop()
+        last_item = bucket.items.pop()
+        if position < len(bucket.keys):
+            bucket.keys[position]  = last_key
+            bucket.rates[position] = last_rate
+            bucket.items[position] = last_item
+            self.locations[last_key] = (bucket, position)
+        if not bucket.keys:
+            bucket.total   = 0.0
+            bucket.removed = 0
+        else:
+            bucket.total   -= rate
+            bucket.removed += 1
+            # Re-add the bucket's rates now and then, so that rounding errors
+            # from the running total can't build up.
+            if bucket.removed > 65536 + len(bucket.keys):
+                bucket.total   = math.fsum(bucket.rates)
+                bucket.removed = 0
+        return item
+
+    def discard(self, key):
+        '''
+        Remove the channel with key, if there is one.
+        '''
+        if key in self.locations:
+            self.remove(key)
+
+    def sample(self, u, uniform):
+        '''
+        Returns (key, rate, item) for a channel chosen with probability
+        proportional to its rate. u is uniform on [0, self.total); uniform is
+        a function returning uniform random numbers on [0, 1), used to pick
+        (and accept or reject) channels inside the chosen bucket.
+        '''
+        bucket = None
+        for candidate in self.buckets.values():
+            if not candidate.keys:
+                continue
+            bucket = candidate
+            if u < candidate.total:
+                break
+            u -= candidate.total
+        keys  = bucket.keys
+        rates = bucket.rates
+        n_channels = len(keys)
+        upper_bound = bucket.upper_bound
+        while True:
+            # The fractional part of r is independent of its integer part, so
+            # one uniform serves for both the pick and the acceptance test.
+            r = uniform() * n_channels
+            position = int(r)
+            if (r - position) * upper_bound < rates[position]:
+                return keys[position], rates[position], bucket.items[position]
+#end class RateBuckets
+
+
+class _RateBucket(object):
+    __slots__ = ('upper_bound', 'total', 'removed', 'keys', 'rates', 'items')
+
+    def __init__(self, upper_bound):
+        self.upper_bound = upper_bound
+        self.total   = 0.0
+        self.removed = 0
+        self.keys    = []
+        self.rates   = []
+        self.items   = []
+#end class _RateBucket
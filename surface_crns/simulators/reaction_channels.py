@@ -0,0 +1,418 @@
+import numpy as np
+from surface_crns.models.compact_grids import CompactNode
+from surface_crns.simulators.event import Event
+from surface_crns.simulators.random_stream import RandomStream
+from surface_crns.simulators.state_hash import HashedStateMixin
+from surface_crns.simulators.rule_index import RuleIndex
+
+class ReactionChannels(object):
+    '''
+    Enumerates the reaction channels of a surface CRN: every way a single
+    transition rule could fire on a particular node or pair of neighboring
+    nodes, given the surface's current states.
+
+    Every node has a node number (see node_number). A channel is identified by
+    the key
+
+        (rule number, first reactant's node number, neighbor slot)
+
+    where the rule number comes from the RuleIndex and the neighbor slot is the
+    position of the second reactant in the first reactant's neighbor list (-1
+    for unimolecular rules). A bimolecular channel fires at rate
+    rule.rate * (weight of that neighbor connection); a unimolecular channel at
+    rule.rate. Channels with rate 0 never fire and are never reported.
+
+    Keying on the neighbor slot rather than on the second node keeps channels
+    distinct even when a node is listed twice as a neighbor (as on a wrapped
+    grid only two nodes wide), matching how QueueSimulator counts them.
+
+    Channels are reported as (key, rule, participant node numbers, rate).
+
+    On grids of Node objects, nodes are numbered in the order the surface
+    iterates over them and the neighbor lists are built up front. On compact
+    grids (see surface_crns.models.compact_grids), node numbers are the grid's
+    own node indices and everything is read from the grid's arrays on demand,
+    so nothing proportional to the size of the surface is allocated.
+    '''
+    def __init__(self, surface, rule_index):
+        self.surface    = surface
+        self.rule_index = rule_index
+        self.compact    = hasattr(surface, "neighbor_index")
+        if self.compact:
+            self.nodes     = _CompactNodes(surface)
+            self.neighbors = _CompactNeighbors(surface)
+            self.in_edges  = _CompactInEdges(surface)
+            self.weights   = set(surface.offset_weights)
+        else:
+            self.nodes = list(surface)
+            self.node_numbers = {node: i for i, node in enumerate(self.nodes)}
+            # neighbors[i] is a list of (neighbor number, weight); in_edges[i]
+            # lists every (j, k) such that neighbors[j][k] refers to node i.
+            self.neighbors = []
+            self.in_edges  = [[] for _ in self.nodes]
+            self.weights   = set()
+            for i, node in enumerate(self.nodes):
+                neighbor_list = [(self.node_numbers[neighbor], weight)
+                                 for neighbor, weight in node.neighbors]
+                self.neighbors.append(neighbor_list)
+                for k, (j, weight) in enumerate(neighbor_list):
+                    self.in_edges[j].append((i, k))
+                    self.weights.add(weight)
+        # Flattened copies of the rule index, holding (rule number, rule) for
+        # rules that can fire at all.
+        self.unimolecular = dict()
+        for state, channels in rule_index.unimolecular.items():
+            self.unimolecular[state] = [(rule_index.rule_number(rule), rule)
+                                        for _, rule, _, _ in channels
+                                        if rule.rate > 0]
+        self.bimolecular = dict()
+        for state, partners in rule_index.first_bimolecular.items():
+            self.bimolecular[state] = dict()
+            for partner, channels in partners.items():
+                self.bimolecular[state][partner] = \
+                            [(rule_index.rule_number(rule), rule)
+                             for _, rule, _, _ in channels if rule.rate > 0]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def node_number(self, node):
+        if self.compact:
+            return node.index
+        return self.node_numbers[node]
+
+    def possible_rates(self):
+        '''
+        The set of rates a channel could possibly have.
+        '''
+        rates = set()
+        for rule in self.rule_index.rules:
+            if len(rule.inputs) == 1:
+                rates.add(rule.rate)
+            else:
+                rates.update(rule.rate * weight for weight in self.weights)
+        return set(rate for rate in rates if rate > 0)
+
+    def set_timestamps(self, time):
+        '''
+        Set the timestamp of every node to time.
+        '''
+        if self.compact:
+            self.surface.timestamps[:] = time
+        else:
+            for node in self.nodes:
+                node.timestamp = time
+
+    def active_nodes(self):
+        '''
+        Returns the numbers of the nodes whose state could be the first (or
+        only) reactant of some rule, i.e. the only nodes for which
+        channels_from_node can return anything.
+        '''
+        if self.compact:
+            species = self.surface.species
+            reactive = np.zeros(len(species), dtype = bool)
+            for state in list(self.unimolecular) + list(self.bimolecular):
+                if state in species:
+                    reactive[species.codes[state]] = True
+            return np.flatnonzero(reactive[self.surface.states]).tolist()
+        return [i for i, node in enumerate(self.nodes)
+                if node.state in self.unimolecular or
+                   node.state in self.bimolecular]
+
+    def channels_from_node(self, i):
+        '''
+        Returns a list of the live channels with node number i as the first
+        (or only) reactant. Enumerating this for every node lists every live
+        channel on the surface exactly once.
+        '''
+        nodes    = self.nodes
+        state    = nodes[i].state
+        channels = []
+        for rule_number, rule in self.unimolecular.get(state, ()):
+            channels.append(((rule_number, i, -1), rule, (i,), rule.rate))
+        partners = self.bimolecular.get(state)
+        if partners:
+            for k, (j, weight) in enumerate(self.neighbors[i]):
+                if j < 0:
+                    continue
+                matches = partners.get(nodes[j].state)
+                if not matches:
+                    continue
+                for rule_number, rule in matches:
+                    rate = rule.rate * weight
+                    if rate > 0:
+                        channels.append(((rule_number, i, k), rule, (i, j),
+                                         rate))
+        return channels
+
+    def channels_with_node(self, i):
+        '''
+        Returns a dictionary mapping key -> (rule, participant numbers, rate)
+        for every live channel with node number i as either reactant.
+        '''
+        channels = dict()
+        for key, rule, participants, rate in self.channels_from_node(i):
+            channels[key] = (rule, participants, rate)
+        nodes       = self.nodes
+        bimolecular = self.bimolecular
+        state       = nodes[i].state
+        for j, k in self.in_edges[i]:
+            partners = bimolecular.get(nodes[j].state)
+            if not partners:
+                continue
+            matches = partners.get(state)
+            if not matches:
+                continue
+            weight = self.neighbors[j][k][1]
+            for rule_number, rule in matches:
+                rate = rule.rate * weight
+                if rate > 0:
+                    channels[(rule_number, j, k)] = (rule, (j, i), rate)
+        return channels
+
+    def participants(self, key):
+        '''
+        Returns the participant node numbers of the channel with the given key.
+        '''
+        _, first_node, slot = key
+        if slot < 0:
+            return (first_node,)
+        return (first_node, self.neighbors[first_node][slot][0])
+#end class ReactionChannels
+
+
+class ChannelSimulator(HashedStateMixin):
+    '''
+    Base class for simulators that keep every live reaction channel (see
+    ReactionChannels) in self.event_queue, and after each event only revisit
+    the channels involving nodes whose state changed.
+
+    Subclasses supply the container and how the next channel is picked:
+        make_event_queue(): Returns a new, empty container.
+        add_channel(key, rule, participants, rate): Put a live channel in the
+            container, then call track_channel.
+        remove_channel(key): Take a channel out of the container, then call
+            untrack_channel.
+        select_channel(): Returns (key, participant numbers, event) for the
+            next channel to fire, or None if none fires before
+            simulation_duration.
+    and can override channel_fired to update the channel that fired.
+
+    Drop-in replacement for QueueSimulator. Uses unimolecular and bimolecular
+    reactions only.
+    '''
+    def __init__(self, surface = None, transition_rules = None, seed = None,
+                 simulation_duration = 100, debug = False,
+                 legacy_rng = False):
+        self.debug = debug
+        if transition_rules is None:
+            self.rule_set = []
+        else:
+            self.rule_set = transition_rules
+
+        if seed:
+            self.seed = seed
+        else:
+            import time
+            self.seed = int(time.time()) # use fractional seconds
+        self.rng = RandomStream(self.seed, legacy = legacy_rng)
+        self.simulation_duration = simulation_duration
+        self.surface = surface
+        self.init_state = surface.get_global_state()
+
+        self.rule_index = RuleIndex(self.rule_set)
+        self.rules_by_state = self.rule_index.rules_by_state
+        self.channels = ReactionChannels(self.surface, self.rule_index)
+
+        self.time = 0
+        self.surface.set_global_state(self.init_state)
+        if self.debug:
+            print(type(self).__name__ + " initialized with global state:")
+            print(str(self.init_state))
+        self.reset()
+        if self.debug:
+            print(self.surface)
+
+    def reset(self):
+        '''
+        Empty the event queue and populate it with available reactions.
+        '''
+        self.event_queue = self.make_event_queue()
+        # Keys of the live channels each node takes part in, for nodes that
+        # take part in any.
+        self.node_channels = dict()
+        self.initialize_reactions()
+        self.rehash_state()
+
+    def initialize_reactions(self):
+        '''
+        Populate the event queue with every live reaction channel.
+        '''
+        self.channels.set_timestamps(self.time)
+        for i in self.channels.active_nodes():
+            for key, rule, participants, rate in \
+                                        self.channels.channels_from_node(i):
+                self.add_channel(key, rule, participants, rate)
+
+    def done(self):
+        '''
+        True iff there are no more reactions or the simulation has reached
+        final time.
+        '''
+        return len(self.event_queue) == 0 or self.time >= self.simulation_duration
+
+    def make_event_queue(self):
+        raise NotImplementedError("You need to override the " +
+                                  "'make_event_queue' method of " +
+                                  "ChannelSimulator.")
+
+    def add_channel(self, key, rule, participants, rate):
+        raise NotImplementedError("You need to override the 'add_channel' " +
+                                  "method of ChannelSimulator.")
+
+    def remove_channel(self, key):
+        raise NotImplementedError("You need to override the " +
+                                  "'remove_channel' method of " +
+                                  "ChannelSimulator.")
+
+    def select_channel(self):
+        raise NotImplementedError("You need to override the " +
+                                  "'select_channel' method of " +
+                                  "ChannelSimulator.")
+
+    def channel_fired(self, key, participants, event):
+        '''
+        Called after each event, once the channels of the nodes it changed are
+        up to date. Does nothing by default.
+        '''
+        pass
+
+    def track_channel(self, key, participants):
+        '''
+        Record that the channel with the given key and participant node
+        numbers is live.
+        '''
+        for i in participants:
+            self.node_channels.setdefault(i, set()).add(key)
+
+    def untrack_channel(self, key, participants):
+        '''
+        Record that the channel with the given key and participant node
+        numbers is no longer live.
+        '''
+        for i in participants:
+            node_keys = self.node_channels.get(i)
+            if node_keys is not None:
+                node_keys.discard(key)
+                if not node_keys:
+                    del self.node_channels[i]
+
+    def process_next_reaction(self):
+        '''
+        Process and return the next reaction:
+        (1) Pick the channel that fires next (see select_channel).
+        (2) Update the surface based on the reaction.
+        (3) Update the channels involving every node whose state changed.
+        '''
+        local_debugging = False
+        selected = self.select_channel()
+        if selected is None:
+            self.time = self.simulation_duration
+            return None
+        key, participants, next_reaction = selected
+        self.time = next_reaction.time
+        if local_debugging:
+            print("Processing event " + str(next_reaction))
+
+        changed = []
+        for i, node, output in zip(participants, next_reaction.participants,
+                                   next_reaction.rule.outputs):
+            if node.state != output:
+                node.state = output
+                if i not in changed:
+                    changed.append(i)
+            node.timestamp = self.time
+
+        # Diff the channels of the changed nodes before and after the event.
+        old_keys = set()
+        new_channels = dict()
+        for i in changed:
+            old_keys.update(self.node_channels.get(i, ()))
+            new_channels.update(self.channels.channels_with_node(i))
+        for old_key in old_keys:
+            if old_key not in new_channels:
+                self.remove_channel(old_key)
+        for new_key, (new_rule, new_participants, rate) in \
+                                                    new_channels.items():
+            if new_key not in old_keys:
+                self.add_channel(new_key, new_rule, new_participants, rate)
+        self.channel_fired(key, participants, next_reaction)
+
+        if local_debugging:
+            print("process_next_reaction() returning event " +
+                  str(next_reaction))
+        self.hash_event(next_reaction)
+        return next_reaction
+    #end def process_next_reaction
+#end class ChannelSimulator
+
+
+class _CompactNodes(object):
+    '''
+    Sequence of CompactNode views of a compact grid, by node index.
+    '''
+    def __init__(self, surface):
+        self.surface = surface
+
+    def __len__(self):
+        return len(self.surface.states)
+
+    def __getitem__(self, i):
+        return CompactNode(self.surface, i)
+
+    def __iter__(self):
+        return (CompactNode(self.surface, i) for i in range(len(self)))
+#end class _CompactNodes
+
+
+class _CompactNeighbors(object):
+    '''
+    Sequence of (neighbor index, weight) lists of a compact grid, by node
+    index. Missing neighbors have index -1.
+    '''
+    def __init__(self, surface):
+        self.surface = surface
+
+    def __len__(self):
+        return len(self.surface.states)
+
+    def __getitem__(self, i):
+        return list(zip(self.surface.neighbor_index[i].tolist(),
+                        self.surface.offset_weights))
+#end class _CompactNeighbors
+
+
+class _CompactInEdges(object):
+    '''
+    Sequence of the (j, k) pairs such that node i is neighbor k of node j, by
+    node index i, read from a compact grid's neighbor array. Grid connectivity
+    is symmetric, so only i's own neighbors need to be checked.
+    '''
+    def __init__(self, surface):
+        self.surface = surface
+
+    def __len__(self):
+        return len(self.surface.states)
+
+    def __getitem__(self, i):
+        neighbor_index = self.surface.neighbor_index
+        edges = []
+        for j in set(neighbor_index[i].tolist()):
+            if j < 0:
+                continue
+            for k, neighbor in enumerate(neighbor_index[j].tolist()):
+                if neighbor == i:
+                    edges.append((j, k))
+        return edges
+#end class _CompactInEdges
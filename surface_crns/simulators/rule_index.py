@@ -0,0 +1,104 @@
+class RuleIndex(object):
+    '''
+    Precompiled dispatch table for a set of unimolecular and bimolecular
+    transition rules, built once so that simulators don't have to search the
+    rule list every time a node changes.
+
+    Each entry ("channel") records a rule a node can take part in, along with
+    which reactant the node would be. Channels are stored as tuples
+
+        (order, rule, node_index, num_reactions)
+
+    where order is the rule's position in rules_by_state[state] (so channels
+    can be processed in the same order as a plain scan of the rule list),
+    node_index is which input of the rule the node fills, and num_reactions is
+    2 for rules with two identical inputs when the node could be either one
+    (see QueueSimulator.add_next_reactions_with_node), otherwise 1.
+
+    Lookups:
+        unimolecular[state]: channels for unimolecular rules with input state.
+        bimolecular[state][neighbor_state]: channels for bimolecular rules
+            where a node with state state reacts with a neighbor with state
+            neighbor_state, with the node as either reactant.
+        first_bimolecular[state][neighbor_state]: the same, but only with the
+            node as the first reactant.
+
+    Rules that compare equal (same inputs and outputs, see
+    TransitionRule.__eq__) are only counted once, as in rules_by_state. The
+    distinct rules are listed in self.rules; rule_number(rule) gives a rule's
+    position in that list.
+    '''
+    def __init__(self, transition_rules = None):
+        if transition_rules is None:
+            transition_rules = []
+        # Mapping of states to the possible transitions they could undergo.
+        self.rules_by_state = dict()
+        for rule in transition_rules:
+            for input_state in rule.inputs:
+                if not input_state in self.rules_by_state:
+                    self.rules_by_state[input_state] = []
+                if not rule in self.rules_by_state[input_state]:
+                    self.rules_by_state[input_state].append(rule)
+
+        self.rules        = []
+        self.rule_numbers = dict() # id(rule) -> position in self.rules
+        self.unimolecular       = dict()
+        self.bimolecular        = dict()
+        self.first_bimolecular  = dict()
+        for state, rules in self.rules_by_state.items():
+            for order, rule in enumerate(rules):
+                if id(rule) not in self.rule_numbers:
+                    self.rule_numbers[id(rule)] = len(self.rules)
+                    self.rules.append(rule)
+                if len(rule.inputs) == 1:
+                    self.unimolecular.setdefault(state, []).append(
+                                                        (order, rule, 0, 1))
+                elif len(rule.inputs) == 2:
+                    node_index = rule.inputs.index(state)
+                    partner    = rule.inputs[1 - node_index]
+                    if rule.inputs[0] == rule.inputs[1]:
+                        num_reactions = 2
+                    else:
+                        num_reactions = 1
+                    self.bimolecular.setdefault(state, dict()).setdefault(
+                            partner, []).append(
+                            (order, rule, node_index, num_reactions))
+                    if node_index == 0:
+                        self.first_bimolecular.setdefault(state,
+                            dict()).setdefault(partner, []).append(
+                            (order, rule, 0, 1))
+                else:
+                    raise Exception("Error in transition rule " + str(rule) + \
+                                "\nOnly rules with one or two inputs allowed!")
+
+    def rule_number(self, rule):
+        '''
+        Returns the position of rule in self.rules.
+        '''
+        return self.rule_numbers[id(rule)]
+
+    def unimolecular_channels(self, state):
+        '''
+        Returns the unimolecular channels available to a node with state state.
+        '''
+        return self.unimolecular.get(state, ())
+
+    def bimolecular_partners(self, state, first_reactant_only = False):
+        '''
+        Returns a dictionary mapping neighbor states to the bimolecular
+        channels available to a node with state state next to a neighbor with
+        that state. Empty if state can't take part in a bimolecular rule.
+        '''
+        if first_reactant_only:
+            return self.first_bimolecular.get(state, {})
+        return self.bimolecular.get(state, {})
+
+    def bimolecular_channels(self, state, neighbor_state,
+                             first_reactant_only = False):
+        '''
+        Returns the bimolecular channels available to a node with state state
+        next to a neighbor with state neighbor_state.
+        '''
+        return self.bimolecular_partners(state, first_reactant_only).get(
+                                                        neighbor_state, ())
+#end class RuleIndex
@@ -0,0 +1,84 @@
+import importlib
+
+# Simulator classes selectable with the manifest's "simulator" option, by
+# simulation type. Classes are given by module path and name so that only the
+# simulator actually used gets imported.
+ASYNCHRONOUS_SIMULATORS = {
+    "queue": ("surface_crns.simulators.queue_simulator", "QueueSimulator"),
+    "eager": ("surface_crns.simulators.queue_simulator_eager",
+              "EagerQueueSimulator"),
+    "next_reaction": ("surface_crns.simulators.next_reaction_simulator",
+                      "NextReactionSimulator"),
+    "direct": ("surface_crns.simulators.direct_method_simulator",
+               "DirectMethodSimulator"),
+    "composition_rejection": (
+            "surface_crns.simulators.composition_rejection_simulator",
+            "CompositionRejectionSimulator")
+}
+SYNCHRONOUS_SIMULATORS = {
+    "synchronous": ("surface_crns.simulators.synchronous_simulator",
+                    "SynchronousSimulator"),
+    "totalistic": ("surface_crns.simulators.totalistic_simulator",
+                   "TotalisticSimulator"),
+    "binary": ("surface_crns.simulators.binary_totalistic_simulator",
+               "BinaryTotalisticSimulator"),
+    "hashlife": ("surface_crns.simulators.hashlife_simulator",
+                 "HashLifeSimulator")
+}
+DEFAULT_SIMULATORS = {"asynchronous": "queue",
+                      "synchronous":  "totalistic"}
+
+def simulator_names(simulation_type):
+    '''
+    Returns the simulator names available for a simulation type
+    ("asynchronous" or "synchronous").
+    '''
+    if simulation_type == "asynchronous":
+        return list(ASYNCHRONOUS_SIMULATORS)
+    elif simulation_type == "synchronous":
+        return list(SYNCHRONOUS_SIMULATORS)
+    else:
+        raise Exception('Unknown simulation type "' + simulation_type + '".')
+
+def get_simulator_class(simulation_type, name = None):
+    '''
+    Returns the simulator class with the given name for a simulation type.
+    If name is None, returns the default simulator for that type.
+    '''
+    if name is None:
+        name = DEFAULT_SIMULATORS[simulation_type]
+    if simulation_type == "asynchronous":
+        simulators = ASYNCHRONOUS_SIMULATORS
+    elif simulation_type == "synchronous":
+        simulators = SYNCHRONOUS_SIMULATORS
+    else:
+        raise Exception('Unknown simulation type "' + simulation_type + '".')
+    if name not in simulators:
+        raise Exception('Unknown ' + simulation_type + ' simulator "' + name +
+                        '". Options are: ' + ", ".join(simulators))
+    module_name, class_name = simulators[name]
+    return getattr(importlib.import_module(module_name), class_name)
+
+def make_simulator(opts, surface = None, seed = None, duration = None):
+    '''
+    Build the simulator described by a SurfaceCRNOptionParser. surface, seed,
+    and duration default to the manifest's grid, rng_seed, and max_duration.
+    '''
+    if surface is None:
+        surface = opts.grid
+    if seed is None:
+        seed = opts.rng_seed
+    if duration is None:
+        duration = opts.max_duration
+    simulator_class = get_simulator_class(opts.simulation_type, opts.simulator)
+    if opts.simulation_type == "asynchronous":
+        return simulator_class(surface = surface,
+                               transition_rules = opts.transition_rules,
+                               seed = seed,
+                               simulation_duration = duration,
+                               legacy_rng = opts.legacy_rng)
+    else:
+        return simulator_class(surface = surface,
+                               update_rule = opts.update_rule,
+                               seed = seed,
+                               simulation_duration = duration)
@@ -0,0 +1,172 @@
+import hashlib
+import collections
+import numpy as np
+
+# Mixed into the seed of every state's keys, so the keys don't depend on
+# anything but the state.
+KEY_SEED = 0x5A0B0157
+
+class StateHash(object):
+    '''
+    Zobrist hash of the global state of a surface: the XOR, over every node,
+    of a random 64-bit key for that node being in its current state.
+
+    Changing one node's state changes the hash by XORing out the key for its
+    old state and XORing in the key for its new one, so a simulator can keep
+    the hash up to date as it goes at a cost proportional to the number of
+    nodes that change, and compare states by comparing hashes. Two different
+    states get the same hash with probability about 2^-64.
+
+    Nodes are numbered by their index on compact grids and in the order the
+    surface iterates over them otherwise. The keys for a state depend only on
+    the state and the node number, so hashes of states of the same surface are
+    comparable between simulators.
+    '''
+    def __init__(self, surface):
+        self.surface = surface
+        self.compact = hasattr(surface, "neighbor_index")
+        if self.compact:
+            self.n_nodes = len(surface.states)
+        else:
+            self.node_numbers = {node: i for i, node in enumerate(surface)}
+            self.n_nodes = len(self.node_numbers)
+        self.keys = dict() # state -> uint64 array of keys by node number
+        self.compute()
+
+    def state_keys(self, state):
+        '''
+        Returns the array of every node's key for the given state.
+        '''
+        keys = self.keys.get(state)
+        if keys is None:
+            digest = hashlib.blake2b(str(state).encode(), digest_size = 8)
+            generator = np.random.default_rng(
+                            [KEY_SEED, int.from_bytes(digest.digest(), "little")])
+            keys = np.frombuffer(generator.bytes(8 * self.n_nodes),
+                                 dtype = np.uint64)
+            self.keys[state] = keys
+        return keys
+
+    def key_table(self, states, nodes = None):
+        '''
+        Returns an array whose [i, c] entry is the key for node number i (or
+        for nodes[i], if nodes is given) being in state states[c].
+        '''
+        table = np.stack([self.state_keys(state) for state in states],
+                         axis = 1)
+        if nodes is not None:
+            table = table[np.array([self.node_number(node) for node in nodes],
+                                   dtype = np.int64)]
+        return table
+
+    def node_number(self, node):
+        if self.compact:
+            return node.index
+        return self.node_numbers[node]
+
+    def compute(self):
+        '''
+        Hash the surface's current state from scratch.
+        '''
+        if self.compact:
+            codes   = self.surface.states
+            species = self.surface.species.species
+            groups  = [(species[code], np.flatnonzero(codes == code))
+                       for code in np.unique(codes).tolist()]
+        else:
+            numbers_by_state = dict()
+            for node, i in self.node_numbers.items():
+                numbers_by_state.setdefault(node.state, []).append(i)
+            groups = list(numbers_by_state.items())
+        value = np.uint64(0)
+        for state, numbers in groups:
+            value ^= np.bitwise_xor.reduce(self.state_keys(state)[numbers])
+        self.value = int(value)
+        return self.value
+
+    def change(self, node, old_state, new_state):
+        '''
+        Update the hash for node changing from old_state to new_state.
+        '''
+        if old_state == new_state:
+            return
+        i = self.node_number(node)
+        self.value ^= int(self.state_keys(old_state)[i] ^
+                          self.state_keys(new_state)[i])
+
+    def apply_event(self, event):
+        '''
+        Update the hash for an event that has just happened: each participant
+        changed from the corresponding input of the event's rule to the
+        corresponding output.
+        '''
+        for node, old_state, new_state in zip(event.participants,
+                                              event.rule.inputs,
+                                              event.rule.outputs):
+            self.change(node, old_state, new_state)
+#end class StateHash
+
+
+class HashedStateMixin(object):
+    '''
+    Gives an asynchronous simulator a state_hash method. The hash is only
+    made the first time it's asked for; from then on the simulator keeps it
+    up to date by calling rehash_state whenever its surface is reset and
+    hash_event after every event.
+    '''
+    zobrist = None
+
+    def state_hash(self):
+        '''
+        Zobrist hash of the surface's current state (see StateHash), for cheap
+        comparisons of states. Once asked for, it is kept up to date with
+        every event.
+        '''
+        if self.zobrist is None:
+            self.zobrist = StateHash(self.surface)
+        return self.zobrist.value
+
+    def rehash_state(self):
+        if self.zobrist is not None:
+            self.zobrist.compute()
+
+    def hash_event(self, event):
+        if self.zobrist is not None:
+            self.zobrist.apply_event(event)
+#end class HashedStateMixin
+
+
+class CycleDetector(object):
+    '''
+    Remembers the state hashes of a deterministic simulation at its last
+    window times, to notice when it comes back to a state it has already been
+    in. From then on the simulation repeats itself with the period found: a
+    period of 1 is a fixed point.
+    '''
+    def __init__(self, window = 1024):
+        self.window = window
+        self.clear()
+
+    def clear(self):
+        self.times  = dict()                # hash -> time it was last seen
+        self.recent = collections.deque()   # (hash, time), oldest first
+
+    def record(self, value, time):
+        '''
+        Record that the simulation was in the state with hash value at time.
+        Returns the period if it was in the same state within the last window
+        times recorded, and None otherwise.
+        '''
+        if self.window <= 0:
+            return None
+        last_time = self.times.get(value)
+        self.times[value] = time
+        self.recent.append((value, time))
+        if len(self.recent) > self.window:
+            old_value, old_time = self.recent.popleft()
+            if self.times.get(old_value) == old_time:
+                del self.times[old_value]
+        if last_time is None:
+            return None
+        return time - last_time
+#end class CycleDetector
@@ -1,6 +1,7 @@
 import random
 from surface_crns.base.transition_rule import TransitionRule
 from surface_crns.simulators.event import Event
+from surface_crns.simulators.state_hash import StateHash, CycleDetector
 
 class SynchronousSimulator:
     '''
@@ -8,19 +9,26 @@ class SynchronousSimulator:
     update_rule, which is a function taking parameters "neighbor_states" and
     "current_state" and returning the next state for that node, based on the
     neighbors' states and the node's own state.
+
+    Keeps a Zobrist hash of the surface (see StateHash) and the hashes of the
+    last cycle_window ticks. Once the surface comes back to a state it has
+    been in, period and cycle_start record the cycle it is in, and if it has
+    reached a fixed point the simulation ends at once.
     '''
     def __init__(self, surface = None, update_rule = None, seed = None,
-                 simulation_duration = 100):
+                 simulation_duration = 100, cycle_window = 1024):
         self.debugging = False
         if update_rule is None:
             self.update_rule = []
         else:
             self.update_rule = update_rule
 
+        self.seed = seed
         random.seed(seed)
         self.simulation_duration = simulation_duration
         self.surface = surface
         self.init_state = surface.get_global_state()
+        self.cycles = CycleDetector(cycle_window)
 
         self.initialize()
 
@@ -29,7 +37,28 @@ class SynchronousSimulator:
         Start the simulation from the initial condition.
         '''
         self.time = 0
+        # Ticks actually computed, rather than skipped at a fixed point.
+        self.ticks_computed = 0
         self.surface.set_global_state(self.init_state)
+        self.zobrist = StateHash(self.surface)
+        self.reset()
+
+    def reset(self):
+        '''
+        Re-hash the surface, e.g. after its states have been changed from
+        outside the simulator, and start looking for cycles afresh.
+        '''
+        self.zobrist.compute()
+        self.period      = None
+        self.cycle_start = None
+        self.cycles.clear()
+        self.cycles.record(self.zobrist.value, self.time)
+
+    def state_hash(self):
+        '''
+        Zobrist hash of the surface's current state.
+        '''
+        return self.zobrist.value
 
     def done(self):
         '''
@@ -43,17 +72,20 @@ class SynchronousSimulator:
         update_rule
         '''
         changed_nodes = []
+        new_states    = []
         for node in self.surface:
             neighbor_states = list(map(lambda tup:tup[0].state, node.neighbors))
             new_state = self.update_rule(neighbor_states, node.state)
             if node.state != new_state:
                 changed_nodes.append(node)
-                node.new_state = new_state
+                new_states.append(new_state)
 
         # Have to make a second pass, because we can't make any changes until
-        # all nodes have been checked.
-        for node in changed_nodes:
-            node.state = node.new_state
+        # all nodes have been checked. New states are kept here rather than on
+        # the nodes, which can't hold extra attributes on compact grids.
+        for node, new_state in zip(changed_nodes, new_states):
+            self.zobrist.change(node, node.state, new_state)
+            node.state = new_state
 
         # Return a bogus Event object to tell the controller which nodes to
         # update
@@ -64,6 +96,17 @@ class SynchronousSimulator:
                           participants = changed_nodes,
                           time_issued = self.time)
         self.time += 1
+        self.ticks_computed += 1
+        period = self.cycles.record(self.zobrist.value, self.time)
+        if period == 1 and changed_nodes:
+            # A hash collision: some nodes did change this tick.
+            period = None
+        if period is not None and self.period is None:
+            self.period      = period
+            self.cycle_start = self.time - period
+        if period == 1:
+            # Fixed point: nothing will ever change again.
+            self.time = max(self.time, self.simulation_duration)
         return new_event
     #end def process_next_reaction
 # end class SynchronousSimulator
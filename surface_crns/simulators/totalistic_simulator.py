@@ -0,0 +1,416 @@
+import math
+import numpy as np
+from surface_crns.base.transition_rule import TransitionRule
+from surface_crns.simulators.event import Event
+from surface_crns.simulators.reaction_channels import _CompactNodes
+from surface_crns.simulators.state_hash import StateHash, CycleDetector
+from surface_crns.models.grids import SquareGrid, HexGrid, \
+                                     SquareGridWithCornerLeak
+from surface_crns.models.compact_grids import CompactSquareGrid, \
+                                             CompactHexGrid, \
+                                             CompactSquareGridWithCornerLeak
+
+class TotalisticSimulator:
+    '''
+    Simulator for synchronous totalistic cellular automata, computed with
+    numpy instead of node by node.
+
+    Does the same thing as SynchronousSimulator, for update rules read from a
+    totalistic rule section (see
+    surface_crns.readers.totalistic_readers.parse_totalistic_rule_stream):
+    each tick, every node's new state is looked up from the sum of its
+    neighbors' (integer) states and its own state.
+
+    States are coded as integers and the whole lattice is held in a state code
+    array. The rule is compiled once into a lookup table indexed by
+    (neighbor sum, state code). On square, square-with-corner-leak (where every
+    node has 8 neighbors, as in the Game of Life), and hex grids, node or
+    compact, neighbor sums are computed by adding shifted copies of the array
+    of state values, taking each hex row's offset into account and wrapping
+    around the edges if the grid wraps; on any other surface they are
+    gathered through an array of neighbor indices. Each tick fills a second
+    state code array from the table, and the two arrays swap roles, so no
+    per-node Python work is done except writing the changed states back to
+    the surface.
+
+    The simulator keeps a Zobrist hash of the lattice (see StateHash), updated
+    from the nodes that change each tick, and remembers the hashes of the last
+    cycle_window ticks. Since the automaton is deterministic, once the lattice
+    comes back to a state it has been in, it repeats itself forever; period
+    and cycle_start record the first such repeat. A fixed point ends the
+    simulation at once, and advance skips whole periods of a cycle without
+    computing them.
+    '''
+    def __init__(self, surface = None, update_rule = None, seed = None,
+                 simulation_duration = 100, cycle_window = 1024):
+        self.debugging = False
+        if update_rule is None or not hasattr(update_rule, "update_options"):
+            raise Exception("TotalisticSimulator needs a totalistic update " +
+                            "rule, as read from a totalistic rule section. " +
+                            "Use SynchronousSimulator for other update rules.")
+        self.update_rule = update_rule
+        self.seed = seed
+        self.simulation_duration = simulation_duration
+        self.surface = surface
+        self.init_state = surface.get_global_state()
+        self.compact = hasattr(surface, "neighbor_index")
+
+        if type(surface) in (SquareGrid, CompactSquareGrid):
+            self.geometry = "square"
+        elif type(surface) in (SquareGridWithCornerLeak,
+                               CompactSquareGridWithCornerLeak):
+            self.geometry = "moore"
+        elif type(surface) in (HexGrid, CompactHexGrid):
+            self.geometry = "hex"
+        else:
+            self.geometry = "general"
+        self.build_connectivity()
+        self.compile_rule(update_rule.update_options)
+
+        # Key of each node (by node number) in each state (by state code).
+        self.zobrist   = StateHash(surface)
+        self.hash_keys = self.zobrist.key_table(
+                                self.states, None if self.compact else self.nodes)
+        self.cycles = CycleDetector(cycle_window)
+        self.initialize()
+
+    def build_connectivity(self):
+        '''
+        Number the surface's nodes and, if the surface isn't a plain square or
+        hex grid, record each node's neighbors in an index array.
+        '''
+        surface = self.surface
+        if self.geometry == "general":
+            if self.compact:
+                self.nodes = _CompactNodes(surface)
+                self.neighbor_index = surface.neighbor_index
+            else:
+                self.nodes = list(surface)
+                node_numbers = {node: i for i, node in enumerate(self.nodes)}
+                degree = max([len(node.neighbors) for node in self.nodes],
+                             default = 0)
+                self.neighbor_index = np.full((len(self.nodes), degree), -1,
+                                              dtype = np.int64)
+                for i, node in enumerate(self.nodes):
+                    for k, (neighbor, _) in enumerate(node.neighbors):
+                        self.neighbor_index[i, k] = node_numbers[neighbor]
+            self.shape = (len(self.nodes),)
+            self.degree = self.neighbor_index.shape[1]
+        else:
+            # Node number x * y_size + y, so a (x_size, y_size) array holds
+            # the nodes in node number order.
+            if self.compact:
+                self.nodes = _CompactNodes(surface)
+            else:
+                self.nodes = list(surface.grid.ravel())
+            self.shape = (surface.x_size, surface.y_size)
+            self.degree = {"square": 4, "moore": 8, "hex": 6}[self.geometry]
+
+    def compile_rule(self, update_options):
+        '''
+        Code every state and build the lookup table from (neighbor sum, state
+        code) to new state code.
+        '''
+        self.states = []
+        self.state_codes = dict()
+        init_states = set(self.init_state.ravel().tolist())
+        rule_states = [state for (_, state), new_state in
+                       update_options.items() for state in (state, new_state)]
+        for state in list(init_states) + rule_states:
+            if state not in self.state_codes:
+                self.state_codes[state] = len(self.states)
+                self.states.append(state)
+        try:
+            self.values = np.array([int(state) for state in self.states],
+                                   dtype = np.int64)
+        except ValueError:
+            raise Exception("States of a totalistic cellular automaton must " +
+                            "be integers. Found states " + str(self.states))
+        if self.compact:
+            # State code -> the surface's species code.
+            self.species_codes = np.array(
+                            [self.surface.species.intern(state)
+                             for state in self.states], dtype = np.int64)
+
+        # Every sum a node could possibly see, from degree copies of the
+        # smallest value (or none) to degree copies of the largest.
+        n_states = len(self.states)
+        self.min_sum = self.degree * min(int(self.values.min()), 0)
+        max_sum      = self.degree * max(int(self.values.max()), 0)
+        self.table = np.full((max_sum - self.min_sum + 1) * n_states, -1,
+                             dtype = np.int64)
+        for (neighbor_sum, state), new_state in update_options.items():
+            if self.min_sum <= neighbor_sum <= max_sum:
+                self.table[(neighbor_sum - self.min_sum) * n_states +
+                           self.state_codes[state]] = \
+                                                self.state_codes[new_state]
+
+    def initialize(self):
+        '''
+        Start the simulation from the initial condition.
+        '''
+        self.time = 0
+        # Ticks actually computed, rather than skipped as repeats of a cycle.
+        self.ticks_computed = 0
+        self.surface.set_global_state(self.init_state)
+        self.reset()
+
+    def reset(self):
+        '''
+        Re-read the lattice from the surface, e.g. after the surface's states
+        have been changed from outside the simulator.
+        '''
+        if self.compact:
+            states = self.surface.get_global_state().ravel()
+        else:
+            states = [node.state for node in self.nodes]
+        try:
+            codes = [self.state_codes[state] for state in states]
+        except KeyError as err:
+            raise Exception("State " + str(err) + " does not appear in the " +
+                            "totalistic rule.")
+        self.current = np.array(codes, dtype = np.int64).reshape(self.shape)
+        self.next    = np.empty_like(self.current)
+        self.rehash()
+        self.period      = None
+        self.cycle_start = None
+        self.cycles.clear()
+        self.cycles.record(self.zobrist.value, self.time)
+
+    def done(self):
+        '''
+        True iff the simulation has reached final time.
+        '''
+        return self.time >= self.simulation_duration
+
+    def state_hash(self):
+        '''
+        Zobrist hash of the lattice's current state.
+        '''
+        return self.zobrist.value
+
+    def rehash(self):
+        '''
+        Hash the lattice from scratch.
+        '''
+        codes = self.current.ravel()
+        self.zobrist.value = int(np.bitwise_xor.reduce(
+                        self.hash_keys[np.arange(len(codes)), codes]))
+
+    def hash_changes(self, numbers, old_codes, new_codes):
+        '''
+        Update the hash for the nodes with the given node numbers changing from
+        old_codes to new_codes.
+        '''
+        keys = self.hash_keys.ravel()
+        rows = numbers * self.hash_keys.shape[1]
+        self.zobrist.value ^= int(np.bitwise_xor.reduce(
+                                    keys.take(rows + old_codes) ^
+                                    keys.take(rows + new_codes)))
+
+    def hash_update(self):
+        '''
+        Update the hash for the tick just computed by update.
+        '''
+        # After update, self.next holds the previous tick.
+        old_codes = self.next.ravel()
+        new_codes = self.current.ravel()
+        changed = np.flatnonzero(old_codes != new_codes)
+        self.hash_changes(changed, old_codes[changed], new_codes[changed])
+
+    def record_state(self):
+        '''
+        Record the lattice's hash at the current time. Returns the period of
+        the cycle the simulation is in, if it has been in this state within
+        the last cycle_window ticks, and None otherwise.
+        '''
+        period = self.cycles.record(self.zobrist.value, self.time)
+        if period == 1 and not self.unchanged():
+            # Same hash, different lattice: not a fixed point after all.
+            period = None
+        return self.found_period(period)
+
+    def unchanged(self):
+        '''
+        True iff the last tick left every node as it was, by comparing the
+        lattices themselves rather than their hashes.
+        '''
+        # After update, self.next holds the previous tick.
+        return np.array_equal(self.current, self.next)
+
+    def found_period(self, period):
+        '''
+        Note the first cycle found (if period isn't None). Returns period.
+        '''
+        if period is not None and self.period is None:
+            self.period      = period
+            self.cycle_start = self.time - period
+        return period
+
+    def neighbor_sums(self, values):
+        '''
+        Returns an array holding the sum of the values of each node's
+        neighbors.
+        '''
+        if self.geometry == "general":
+            padded = np.append(values, 0)
+            return padded[self.neighbor_index].sum(axis = 1)
+        wrap = self.surface.wrap
+        vertical = _shifted(values, 0, -1, wrap) + _shifted(values, 0, 1, wrap)
+        sums = vertical + _shifted(values, -1, 0, wrap) + \
+               _shifted(values, 1, 0, wrap)
+        if self.geometry == "hex":
+            # Odd rows are also connected diagonally to the right, even rows to
+            # the left.
+            sums[:, 1::2] += _shifted(vertical, 1, 0, wrap)[:, 1::2]
+            sums[:, 0::2] += _shifted(vertical, -1, 0, wrap)[:, 0::2]
+        elif self.geometry == "moore":
+            sums += _shifted(vertical, -1, 0, wrap) + \
+                    _shifted(vertical, 1, 0, wrap)
+        return sums
+
+    def changed_nodes(self, changed):
+        '''
+        Returns the node numbers of the nodes marked in the boolean array
+        changed (in node number order), in the order the surface iterates
+        over them.
+        '''
+        if not self.compact and self.geometry == "general":
+            return np.flatnonzero(changed)
+        # Nodes are numbered x * y_size + y, but the surface iterates with x
+        # fastest.
+        x_size, y_size = self.surface.x_size, self.surface.y_size
+        ys, xs = np.divmod(np.flatnonzero(changed.reshape((x_size, y_size)).T),
+                           x_size)
+        return xs * y_size + ys
+
+    def update(self):
+        '''
+        Advance the lattice one tick, without touching the surface.
+        '''
+        n_states = len(self.states)
+        sums = self.neighbor_sums(self.values[self.current])
+        index = (sums - self.min_sum) * n_states + self.current
+        np.take(self.table, index, out = self.next)
+        if (self.next < 0).any():
+            i = np.flatnonzero(self.next.ravel() < 0)[0]
+            raise Exception("No update option for neighbor total " +
+                            str(int(sums.ravel()[i])) + " and state " +
+                            self.states[self.current.ravel()[i]] + ".")
+        self.current, self.next = self.next, self.current
+        self.ticks_computed += 1
+
+    def step(self):
+        '''
+        Advance the lattice one tick, without touching the surface. Returns the
+        node numbers of the nodes that changed, in the order the surface
+        iterates over them, and their new state codes.
+        '''
+        self.update()
+        # After update, self.next holds the previous tick.
+        changed = self.changed_nodes(self.current != self.next)
+        new_codes = self.current.ravel()[changed]
+        self.hash_changes(changed, self.next.ravel()[changed], new_codes)
+        return changed, new_codes
+
+    def advance(self, ticks):
+        '''
+        Advance the simulation by up to ticks ticks (stopping at the end of
+        the simulation) without producing events, then write the result to
+        the surface. Much faster than calling process_next_reaction repeatedly
+        when the intermediate states aren't needed.
+        '''
+        ticks = min(ticks, max(0, math.ceil(self.simulation_duration -
+                                            self.time)))
+        while ticks > 0:
+            self.update()
+            self.hash_update()
+            self.time += 1
+            ticks -= 1
+            period = self.record_state()
+            if period is not None:
+                # From here on, the lattice is back where it was every period
+                # ticks, so only the last ticks % period need computing.
+                self.time += ticks - ticks % period
+                ticks %= period
+        self.write_surface()
+
+    def write_surface(self):
+        '''
+        Write the states of every node to the surface.
+        '''
+        codes = self.current.ravel()
+        if self.compact:
+            self.surface.states[:] = self.species_codes[codes]
+        else:
+            states = self.states
+            for node, code in zip(self.nodes, codes.tolist()):
+                node.state = states[code]
+
+    def process_next_reaction(self):
+        '''
+        Update the surface one clock tick according to the totalistic rule.
+        '''
+        changed, new_codes = self.step()
+        if self.compact:
+            self.surface.states[changed] = self.species_codes[new_codes]
+            changed_nodes = _ChangedNodes(self.nodes, changed)
+        else:
+            changed_nodes = []
+            states = self.states
+            for i, code in zip(changed.tolist(), new_codes.tolist()):
+                node = self.nodes[i]
+                node.state = states[code]
+                changed_nodes.append(node)
+
+        # Return a bogus Event object to tell the controller which nodes to
+        # update
+        rule = TransitionRule(inputs = [0]*len(changed_nodes),
+                              outputs = [1]*len(changed_nodes))
+        new_event = Event(time = self.time,
+                          rule = rule,
+                          participants = changed_nodes,
+                          time_issued = self.time)
+        self.time += 1
+        if self.record_state() == 1:
+            # Fixed point: nothing will ever change again.
+            self.time = max(self.time, self.simulation_duration)
+        return new_event
+    #end def process_next_reaction
+# end class TotalisticSimulator
+
+class _ChangedNodes(object):
+    '''
+    Sequence of the nodes with the given node numbers. Node views are only
+    made when asked for, so a tick that changes much of a compact grid
+    doesn't have to make one for every changed node.
+    '''
+    def __init__(self, nodes, numbers):
+        self.nodes   = nodes
+        self.numbers = numbers
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __getitem__(self, i):
+        return self.nodes[int(self.numbers[i])]
+
+    def __iter__(self):
+        nodes = self.nodes
+        return (nodes[i] for i in self.numbers.tolist())
+#end class _ChangedNodes
+
+def _shifted(values, dx, dy, wrap):
+    '''
+    Returns an array holding values[x + dx, y + dy] at each [x, y], wrapping
+    around the edges if wrap is True and 0 beyond the edges otherwise.
+    '''
+    if wrap:
+        return np.roll(values, (-dx, -dy), axis = (0, 1))
+    shifted = np.zeros_like(values)
+    x_size, y_size = values.shape
+    shifted[max(-dx, 0):x_size + min(-dx, 0),
+            max(-dy, 0):y_size + min(-dy, 0)] = \
+        values[max(dx, 0):x_size + min(dx, 0),
+               max(dy, 0):y_size + min(dy, 0)]
+    return shifted
@@ -0,0 +1,333 @@
+'''
+Trajectory files record a whole asynchronous run, so that it can be analysed
+any number of times without re-simulating it or holding its events in memory.
+
+A trajectory file is:
+    * the 8 bytes "SCRNTRAJ", then the format version and the length of the
+      header, as little-endian uint32s;
+    * the header, as JSON: the species table, the rule table, the shape of the
+      lattice (or null if it isn't a grid), the number of nodes, and the
+      dtype of the initial lattice;
+    * the initial lattice: the species code of each node;
+    * one EVENT_DTYPE record per event, in the order the events happened.
+
+The header and the initial lattice are padded to a multiple of 8 bytes. On
+grids, node (x, y) is node number x * y_size + y, so the lattice reshapes to
+(x_size, y_size); on other surfaces, nodes are numbered in the order the
+surface iterates over them. Events are only ever appended, so a file whose
+run was cut short can still be read up to its last complete record.
+'''
+import os
+import json
+import struct
+import numpy as np
+from surface_crns.base.transition_rule import TransitionRule
+from surface_crns.models.compact_grids import SpeciesTable
+from surface_crns.simulators.event_index import NodeEventIndex
+
+MAGIC   = b"SCRNTRAJ"
+VERSION = 1
+# One record per event: the event's time, its rule number, and the node
+# numbers of its participants (the second -1 for unimolecular reactions).
+EVENT_DTYPE = np.dtype([("time",   "<f8"),
+                        ("rule",   "<i4"),
+                        ("first",  "<i4"),
+                        ("second", "<i4")])
+
+
+class TrajectoryWriter(object):
+    '''
+    Writes the events of a run to a trajectory file as they happen.
+
+    Make the writer while the surface is in its initial state, then pass it
+    each event returned by the simulator's process_next_reaction, as you would
+    to an EventHistory. Events are buffered and written buffer_size at a time;
+    call close (or use the writer as a context manager) to write the rest.
+
+    Works with events of the asynchronous simulators, which apply one of the
+    given transition rules to one or two nodes.
+    '''
+    def __init__(self, filename, surface, transition_rules,
+                 buffer_size = 65536):
+        self.surface = surface
+        self.rules   = list(transition_rules)
+        self.buffer_size = buffer_size
+        self.buffer  = []
+        self.n_events = 0
+        self.rule_ids = dict() # id(rule) -> rule number
+
+        self.compact = hasattr(surface, "neighbor_index")
+        self.gridded = hasattr(surface, "x_size") and \
+                       hasattr(surface, "y_size")
+        nodes = list(surface)
+        if self.gridded:
+            shape = [surface.x_size, surface.y_size]
+            numbers = [x * surface.y_size + y
+                       for x, y in (node.position for node in nodes)]
+        else:
+            shape = None
+            numbers = range(len(nodes))
+        if not self.compact:
+            self.node_numbers = {node: i for node, i in zip(nodes, numbers)}
+
+        # Every state the run can ever be in is an initial state or the
+        # output of some rule.
+        species = SpeciesTable()
+        states  = [None] * len(nodes)
+        for node, i in zip(nodes, numbers):
+            states[i] = node.state
+        initial_codes = [species.intern(state) for state in states]
+        for rule in self.rules:
+            for state in rule.inputs + rule.outputs:
+                species.intern(state)
+        code_dtype = species.code_dtype()
+        initial_codes = np.array(initial_codes, dtype = code_dtype)
+
+        header = {"species":  species.species,
+                  "rules":    [[rule.inputs, rule.outputs, rule.rate]
+                               for rule in self.rules],
+                  "shape":    shape,
+                  "n_nodes":  len(nodes),
+                  "code_dtype": code_dtype.str}
+        header_bytes = json.dumps(header).encode()
+        self.file = open(filename, "wb")
+        self.file.write(MAGIC + struct.pack("<II", VERSION,
+                                            len(header_bytes)))
+        self.file.write(_padded(header_bytes))
+        self.file.write(_padded(initial_codes.tobytes()))
+
+    def node_number(self, node):
+        if self.compact:
+            return node.index
+        return self.node_numbers[node]
+
+    def rule_number(self, rule):
+        number = self.rule_ids.get(id(rule))
+        if number is None:
+            try:
+                number = self.rules.index(rule)
+            except ValueError:
+                raise Exception("Event rule " + str(rule) + " is not one of "
+                                "the trajectory's transition rules.")
+            self.rule_ids[id(rule)] = number
+        return number
+
+    def add_event(self, event):
+        '''
+        Record an event. Returns immediately unless the buffer is full.
+        '''
+        participants = event.participants
+        if len(participants) == 1:
+            second = -1
+        elif len(participants) == 2:
+            second = self.node_number(participants[1])
+        else:
+            raise Exception("Trajectories can only record events with one "
+                            "or two participants, not " +
+                            str(len(participants)) + ".")
+        self.buffer.append((event.time, self.rule_number(event.rule),
+                            self.node_number(participants[0]), second))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        Write any buffered events to the file.
+        '''
+        if self.buffer:
+            self.file.write(np.array(self.buffer,
+                                     dtype = EVENT_DTYPE).tobytes())
+            self.n_events += len(self.buffer)
+            self.buffer = []
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+#end class TrajectoryWriter
+
+
+def record_trajectory(simulator, filename, buffer_size = 65536):
+    '''
+    Run an asynchronous simulator to completion from its current state,
+    writing every event to a trajectory file. Returns the number of events.
+    '''
+    with TrajectoryWriter(filename, simulator.surface, simulator.rule_set,
+                          buffer_size = buffer_size) as writer:
+        while not simulator.done():
+            event = simulator.process_next_reaction()
+            if event is None:
+                break
+            writer.add_event(event)
+    return writer.n_events
+
+
+class TrajectoryReader(object):
+    '''
+    Reads a trajectory file written by TrajectoryWriter.
+
+    The events are memory-mapped rather than read, as the structured array
+    events (with fields time, rule, first and second), so opening a file is
+    quick however long the run was, and only the parts of it that are used
+    are read from disk. codes_at and states_at rebuild the lattice at any time
+    by applying the events up to that time to the initial lattice, many
+    thousands at once. The last lattice built is kept, so going forward
+    through a run only applies each event once.
+    '''
+    # Events applied per numpy operation when rebuilding the lattice.
+    chunk_size = 1 << 20
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            start = f.read(len(MAGIC) + 8)
+            if start[:len(MAGIC)] != MAGIC:
+                raise Exception("File " + str(filename) + " is not a surface "
+                                "CRN trajectory.")
+            version, header_length = struct.unpack("<II", start[len(MAGIC):])
+            if version != VERSION:
+                raise Exception("Unknown trajectory file version " +
+                                str(version) + ".")
+            header = json.loads(f.read(header_length).decode())
+        self.species = header["species"]
+        self.rules   = [TransitionRule(inputs, outputs, rate)
+                        for inputs, outputs, rate in header["rules"]]
+        self.shape   = tuple(header["shape"]) if header["shape"] else None
+        self.n_nodes = header["n_nodes"]
+        code_dtype   = np.dtype(header["code_dtype"])
+
+        lattice_offset = len(MAGIC) + 8 + _padded_length(header_length)
+        self.initial_codes = np.fromfile(filename, dtype = code_dtype,
+                                         count = self.n_nodes,
+                                         offset = lattice_offset)
+        events_offset = lattice_offset + \
+                        _padded_length(self.n_nodes * code_dtype.itemsize)
+        file_size = os.path.getsize(filename)
+        n_events  = max(0, (file_size - events_offset) // EVENT_DTYPE.itemsize)
+        if n_events:
+            self.events = np.memmap(filename, dtype = EVENT_DTYPE, mode = "r",
+                                    offset = events_offset,
+                                    shape = (n_events,))
+        else:
+            self.events = np.zeros(0, dtype = EVENT_DTYPE)
+        self.times = self.events["time"]
+
+        # Output codes of each rule's participants (-1 past its last one).
+        species_codes = {state: i for i, state in enumerate(self.species)}
+        self.rule_outputs = np.full((max(1, len(self.rules)), 2), -1,
+                                    dtype = np.int64)
+        for number, rule in enumerate(self.rules):
+            for i, state in enumerate(rule.outputs[:2]):
+                self.rule_outputs[number, i] = species_codes[state]
+
+        self.count = 0
+        self.codes = self.initial_codes.copy()
+
+    def __len__(self):
+        return len(self.events)
+
+    def index_at(self, time):
+        '''
+        Returns the number of events that happened at or before time.
+        '''
+        return int(np.searchsorted(self.times, time, side = "right"))
+
+    def codes_after(self, count):
+        '''
+        Returns the species code of every node after the first count events,
+        indexed by node number. The array returned is the reader's own, and
+        changes on the next call.
+        '''
+        count = min(max(count, 0), len(self.events))
+        if count < self.count:
+            self.count = 0
+            self.codes[:] = self.initial_codes
+        while self.count < count:
+            stop   = min(count, self.count + self.chunk_size)
+            chunk  = self.events[self.count:stop]
+            rules  = chunk["rule"]
+            # Each event's first participant, then its second, so that the
+            # last write to a node is the last one in this order.
+            nodes  = np.stack([chunk["first"], chunk["second"]],
+                              axis = 1).ravel()
+            values = self.rule_outputs[rules].ravel()
+            valid  = nodes >= 0
+            nodes  = nodes[valid]
+            values = values[valid]
+            written, last = np.unique(nodes[::-1], return_index = True)
+            self.codes[written] = values[::-1][last]
+            self.count = stop
+        return self.codes
+
+    def codes_at(self, time):
+        '''
+        Returns the species code of every node at the given time (after every
+        event at or before it), shaped like the lattice if it is a grid.
+        '''
+        codes = self.codes_after(self.index_at(time))
+        if self.shape is not None:
+            return codes.reshape(self.shape)
+        return codes
+
+    def states_at(self, time):
+        '''
+        Returns an object array of the state of every node at the given time,
+        shaped like the lattice if it is a grid.
+        '''
+        lookup = np.empty(len(self.species), dtype = object)
+        lookup[:] = self.species
+        return lookup[self.codes_at(time)]
+
+    def event_entries(self):
+        '''
+        Returns every change the trajectory makes to a node, in the order they
+        happen, as three arrays: the number of the event, the number of the
+        node it touches, and the state code it leaves the node in.
+        '''
+        first  = np.asarray(self.events["first"], dtype = np.int64)
+        second = np.asarray(self.events["second"], dtype = np.int64)
+        rules  = np.asarray(self.events["rule"], dtype = np.int64)
+        # Each event's first participant, then its second.
+        events = np.repeat(np.arange(len(self.events), dtype = np.int64), 2)
+        nodes  = np.stack([first, second], axis = 1).ravel()
+        codes  = self.rule_outputs[rules].ravel()
+        touched = nodes >= 0
+        return events[touched], nodes[touched], codes[touched]
+
+    def node_grid(self):
+        '''
+        Returns the array of the node number at each (x, y) position, or None
+        if the lattice isn't a grid.
+        '''
+        if self.shape is None:
+            return None
+        return np.arange(self.n_nodes).reshape(self.shape)
+
+    def event_index(self):
+        '''
+        Returns a NodeEventIndex of the trajectory's events, for looking up
+        the events that touched a node or region.
+        '''
+        events, nodes, codes = self.event_entries()
+        return NodeEventIndex(times     = self.times,
+                              nodes     = nodes,
+                              events    = events,
+                              new_codes = codes,
+                              initial_codes = self.initial_codes,
+                              species   = self.species,
+                              node_grid = self.node_grid())
+#end class TrajectoryReader
+
+
+def _padded_length(length):
+    return (length + 7) // 8 * 8
+
+def _padded(data):
+    return data + b"\0" * (_padded_length(len(data)) - len(data))
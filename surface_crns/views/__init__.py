@@ -1 +1,4 @@
-__all__ = ["grid_display", "legend_display", "time_display"]
\ No newline at end of file
+from surface_crns.lazy_import import lazy_submodules
+__all__ = ["grid_display", "legend_display", "time_display",
+           "frame_pacer", "movie_renderer"]
+__getattr__ = lazy_submodules(__name__)
\ No newline at end of file
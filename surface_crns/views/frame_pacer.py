@@ -0,0 +1,69 @@
+import time as wall_clock
+
+class FramePacer(object):
+    '''
+    Decides how far simulated time moves each frame of a live display, so
+    that the display keeps up with the wall clock.
+
+    Ideally each frame moves simulated time on by speedup_factor / fps. When
+    frames take longer than 1 / fps, to draw or to simulate, time moves on by
+    speedup_factor times the wall-clock time the frame took instead, as if
+    the frames in between had been dropped. Only up to max_frame_skip
+    frames' worth are dropped at once: past that, moving on further would
+    only give the next frame more events to simulate and make it slower
+    still, so playback slows down instead, to whatever speed the frames can
+    manage.
+
+    The pacer also keeps smoothed rates of the speed reached (simulated time
+    per second) and of events and frames per second, for display with status.
+    '''
+    # Weight of the newest frame in the smoothed rates.
+    smoothing = 0.1
+
+    def __init__(self, fps, speedup_factor, max_frame_skip = 4):
+        self.fps = fps
+        self.speedup_factor = speedup_factor
+        self.max_frame_skip = max_frame_skip
+        self.last_frame = None # Wall-clock time of the last frame.
+        self.speed = speedup_factor
+        self.events_per_second = 0
+        self.frames_per_second = 0
+
+    def time_step(self, events = 0):
+        '''
+        Call once per frame while running, with the number of events shown in
+        the last frame. Returns how far simulated time should move on.
+        '''
+        now = wall_clock.perf_counter()
+        frame_time = 1. / self.fps
+        if self.last_frame is None:
+            self.last_frame = now
+            return self.speedup_factor * frame_time
+        elapsed = max(now - self.last_frame, 1e-6)
+        self.last_frame = now
+        step = self.speedup_factor * \
+               min(max(elapsed, frame_time), self.max_frame_skip * frame_time)
+        self.speed += self.smoothing * (step / elapsed - self.speed)
+        self.frames_per_second += self.smoothing * \
+                                  (1. / elapsed - self.frames_per_second)
+        self.events_per_second += self.smoothing * \
+                                  (events / elapsed - self.events_per_second)
+        return step
+
+    def pause(self):
+        '''
+        Call while the display is paused, so that time spent paused isn't
+        taken for lag.
+        '''
+        self.last_frame = None
+
+    def status(self):
+        '''
+        Returns a short description of the speed and rates reached.
+        '''
+        text = "%.0f events/s, %.0f fps" % (self.events_per_second,
+                                            self.frames_per_second)
+        if self.speed < 0.95 * self.speedup_factor:
+            text = "%.2gx speed, " % self.speed + text
+        return text
+#end class FramePacer
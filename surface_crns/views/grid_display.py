@@ -1,4 +1,5 @@
 from surface_crns.base import *
+import numpy as np
 import pygame
 import math
 '''
@@ -54,7 +55,11 @@ class SurfaceDisplay(object):
     def render(self, parent_surface, x_pos = 0, y_pos = 0):
         '''
         This function should blit the entire surface onto its parent. This will
-        be called once at the beginning of the simulation.
+        be called once at the beginning of the simulation. The displays in this
+        file do this by passing every node to update_node and then calling
+        flush, so that subclasses only need to change how nodes are drawn.
+        (SquareGridDisplay without text instead colors the whole grid at once,
+        but only if neither update_node nor draw_node is overridden.)
 
         Params:
             parent_surface: The pygame.Surface object representing the entire
@@ -69,9 +74,13 @@ class SurfaceDisplay(object):
 
     def update_node(self, node):
         '''
-        This function should blit a single node, or otherwise do whatever is
-        required when a node changes state. This will be called whenever the
-        state of a node is changed, passing the node that changed.
+        This function should do whatever is required when a node changes
+        state. This will be called whenever the state of a node is changed,
+        passing the node that changed. It may be called for the same node many
+        times before the next flush, so the displays in this file only note
+        the node here and draw it in flush; displays that draw the node here
+        straight away will have it painted over by anything drawn later in
+        flush.
 
         params:
             node: The node that just changed state.
@@ -79,6 +88,47 @@ class SurfaceDisplay(object):
         raise NotImplementedError("You need to override the 'update_node' " + \
                                   "method of Surface.")
 
+    def flush(self):
+        '''
+        This function should draw any node updates that haven't been drawn yet
+        (for the displays in this file, this is where nodes are actually
+        drawn). It will be called once per frame, before the frame is displayed or
+        saved, and should return the list of rectangles of parent_surface that
+        changed since the last call, so that only those are sent to the
+        screen. Displays that draw each node as soon as it's updated, and
+        don't keep track of what they drew, can leave this as it is, and the
+        whole window will be sent to the screen every frame.
+        '''
+        return None
+
+
+class GlyphCache(object):
+    '''
+    Rendered text of node states, so that each state is only rendered once
+    per text color and font size rather than every time a node is drawn.
+    Fonts and glyphs are made the first time they're asked for.
+    '''
+    def __init__(self, font_name = 'monospace'):
+        self.font_name = font_name
+        self.fonts  = dict() # font size -> pygame.font.Font
+        self.glyphs = dict() # (state, text color, font size) -> pygame.Surface
+
+    def render(self, state, text_color, font_size):
+        '''
+        Returns a surface with the text of state drawn in text_color.
+        '''
+        key = (state, text_color, font_size)
+        glyph = self.glyphs.get(key)
+        if glyph is None:
+            font = self.fonts.get(font_size)
+            if font is None:
+                font = pygame.font.SysFont(self.font_name, font_size)
+                self.fonts[font_size] = font
+            glyph = font.render(state, True, text_color)
+            self.glyphs[key] = glyph
+        return glyph
+#end class GlyphCache
+
 
 class SquareGridDisplay(object):
     '''
@@ -142,6 +192,8 @@ class SquareGridDisplay(object):
             else:
                 raise Exception("Invalid argument for pixels_per_node: " +
                                 str(value))
+            # Text is sized to fit nodes, so drop any rendered at the old size.
+            self.glyph_cache = GlyphCache()
             self.recalculate_display_sizes()
         def fdel(self):
             del self.node_width
@@ -167,23 +219,135 @@ class SquareGridDisplay(object):
         self.parent_surface = parent_surface
         self.display_surface = parent_surface.subsurface(
                         (x_pos, y_pos, self.display_width, self.display_height))
+        # Nodes changed since the last flush, by position, so that a node
+        # changed many times in one frame is only drawn once.
+        self.dirty = dict()
+        # A subclass's update_node may draw nodes itself, without marking them.
+        self.marks_updates = \
+            type(self).update_node is SquareGridDisplay.update_node
+        # Without text, nodes are drawn by keeping the state code of each node
+        # in an array and coloring them from that in flush. That skips
+        # update_node and draw_node, so only do it if neither is overridden.
+        self.draw_from_array = not self.display_text and self.marks_updates \
+            and type(self).draw_node is SquareGridDisplay.draw_node
         # Initial render
-        for node in self.grid:
-            self.update_node(node)
+        if not self.draw_from_array:
+            for node in self.grid:
+                self.update_node(node)
+            self.flush()
+        else:
+            self.grid_rectangle = self.make_grid_rectangle()
+            self.grid_surface = self.display_surface.subsurface(
+                                                        self.grid_rectangle)
+            self.palette     = np.zeros((0, 3), dtype = np.uint8)
+            self.state_codes = dict()
+            if hasattr(self.grid, "get_state_codes"):
+                # Compact grids already keep their states as codes.
+                species = self.grid.species
+                states, codes = np.unique(self.grid.get_state_codes(),
+                                          return_inverse = True)
+                states = [species[code] for code in states]
+            else:
+                states, codes = np.unique(self.grid.get_global_state(),
+                                          return_inverse = True)
+            lookup = np.array([self.state_code(state) for state in states],
+                              dtype = np.int64)
+            self.codes = lookup[codes].reshape((self.grid.x_size,
+                                                self.grid.y_size))
+            self.draw_grid()
 
     def update_node(self, node):
         '''
-        Redraw a specified node.
+        Mark a specified node to be redrawn, with whatever state it has then,
+        on the next flush.
+        '''
+        self.dirty[node.position] = node
+
+    def flush(self):
+        '''
+        Redraw the nodes updated since the last flush. Returns the list of
+        rectangles of the parent surface that changed, or None if a subclass's
+        update_node could have drawn nodes this display doesn't know about.
+        '''
+        if not self.dirty:
+            return [] if self.marks_updates else None
+        if not self.draw_from_array:
+            rects = [self.draw_node(node) for node in self.dirty.values()]
+        else:
+            for (x, y), node in self.dirty.items():
+                self.codes[x, y] = self.state_code(node.state)
+            if len(self.dirty) > self.codes.size // 16:
+                # Cheaper to color the whole grid than node by node.
+                self.draw_grid()
+                rects = [self.grid_rectangle]
+            else:
+                rects = [self.draw_node_color(x, y) for x, y in self.dirty]
+        self.dirty = dict()
+        return [rect.move(self.x_pos, self.y_pos) for rect in rects]
+
+    def draw_grid(self):
+        '''
+        Draw every node from the array of node states.
+        '''
+        # Color every node with one lookup, then scale each node up to
+        # node_width x node_height pixels. Arrays are indexed (x, y), as
+        # surfarray expects.
+        image = self.palette[self.codes]
+        if self.node_width > 1:
+            image = np.repeat(image, self.node_width, axis = 0)
+        if self.node_height > 1:
+            image = np.repeat(image, self.node_height, axis = 1)
+        pygame.surfarray.blit_array(self.grid_surface, image)
+
+    def draw_node_color(self, x, y):
+        '''
+        Draw the node at (x, y) from the array of node states. Returns the
+        rectangle drawn, relative to this display.
+        '''
+        rect = pygame.Rect(x * self.node_width, y * self.node_height,
+                           self.node_width, self.node_height)
+        self.grid_surface.fill(self.palette[self.codes[x, y]].tolist(), rect)
+        return rect.move(self.grid_rectangle.topleft)
+
+    def draw_node(self, node):
+        '''
+        Draw a specified node, with its text if display_text is set. Returns
+        the rectangle drawn, relative to this display.
         '''
         new_rect   = self.make_node_rectangle(node)
         node_color = self.colormap[node.state]
         pygame.draw.rect(self.display_surface, node_color, new_rect)
-        if self.display_text:
-            node_text_surface = self.make_node_text(node)
-            text_rect = node_text_surface.get_rect()
-            text_rect.center = new_rect.center
-            self.display_surface.blit(node_text_surface,
-                                      text_rect)
+        if not self.display_text:
+            return new_rect
+        node_text_surface = self.make_node_text(node)
+        text_rect = node_text_surface.get_rect()
+        text_rect.center = new_rect.center
+        self.display_surface.blit(node_text_surface, text_rect)
+        return new_rect.union(text_rect)
+
+    def state_code(self, state):
+        '''
+        Returns the row of the palette holding the color of state, adding one
+        if this is a new state.
+        '''
+        code = self.state_codes.get(state)
+        if code is None:
+            color = pygame.Color(self.colormap[state])
+            code  = len(self.palette)
+            self.palette = np.vstack([self.palette,
+                                      [[color.r, color.g, color.b]]]
+                                     ).astype(np.uint8)
+            self.state_codes[state] = code
+        return code
+
+    def make_grid_rectangle(self):
+        '''
+        Returns the rectangle covered by the nodes of the grid.
+        '''
+        corner = self.make_node_rectangle(self.grid.getnode(0, 0))
+        return pygame.Rect(corner.left, corner.top,
+                           self.grid.x_size * self.node_width,
+                           self.grid.y_size * self.node_height)
 
     def make_node_rectangle(self, node):
         x = node.position[0]
@@ -212,9 +376,8 @@ class SquareGridDisplay(object):
             text_color = WHITE
         else:
             text_color = BLACK
-        font = pygame.font.SysFont('monospace', int(0.3*self.pixels_per_node[0]))
-        text_surface = font.render(node.state, True, text_color)
-        return text_surface
+        return self.glyph_cache.render(node.state, text_color,
+                                       int(0.3*self.pixels_per_node[0]))
 #end class SquareGridDisplay
 
 
@@ -287,6 +450,8 @@ class HexGridDisplay(object):
             else:
                 raise Exception("Invalid argument for pixels_per_node: " +
                                 str(value))
+            # Text is sized to fit nodes, so drop any rendered at the old size.
+            self.glyph_cache = GlyphCache()
             self.recalculate_display_sizes()
         def fdel(self):
             del self.node_width
@@ -312,24 +477,49 @@ class HexGridDisplay(object):
         self.parent_surface = parent_surface
         self.display_surface = parent_surface.subsurface(
                         (x_pos, y_pos, self.display_width, self.display_height))
+        # Nodes changed since the last flush. Keyed by node rather than by
+        # position, since subclasses may have nodes sharing positions.
+        self.dirty = dict()
         # Initial render
         for node in self.grid:
             self.update_node(node)
+        self.flush()
 
     def update_node(self, node):
         '''
-        Redraw a specified node.
+        Mark a specified node to be redrawn, with whatever state it has then,
+        on the next flush.
+        '''
+        self.dirty[node] = node
+
+    def flush(self):
+        '''
+        Redraw the nodes updated since the last flush. Returns the list of
+        rectangles of the parent surface that changed.
+        '''
+        rects = [self.draw_node(node).move(self.x_pos, self.y_pos)
+                 for node in self.dirty.values()]
+        self.dirty = dict()
+        return rects
+
+    def draw_node(self, node):
+        '''
+        Draw a specified node. Returns the rectangle drawn, relative to this
+        display.
         '''
         new_hex    = self.make_node_hex(node)
         node_color = self.colormap[node.state]
-        pygame.draw.polygon(self.display_surface, node_color, new_hex)
-        pygame.draw.lines(self.display_surface, (0,0,0), True, new_hex)
+        rect = pygame.draw.polygon(self.display_surface, node_color, new_hex)
+        rect = rect.union(pygame.draw.lines(self.display_surface, (0,0,0),
+                                            True, new_hex))
         if self.display_text:
             node_text_surface = self.make_node_text(node)
             text_rect = node_text_surface.get_rect()
             text_rect.center = self.get_center(node)
             self.display_surface.blit(node_text_surface,
                                       text_rect)
+            rect = rect.union(text_rect)
+        return rect
 
     def make_node_hex(self, node):
         '''
@@ -385,9 +575,7 @@ class HexGridDisplay(object):
             text_color = WHITE
         else:
             text_color = BLACK
-        font = pygame.font.SysFont('monospace', 10)
-        text_surface = font.render(node.state, True, text_color)
-        return text_surface
+        return self.glyph_cache.render(node.state, text_color, 10)
 #end class HexGridDisplay
 
 
@@ -482,6 +670,8 @@ class ParallelEmulatedSquareGridDisplay(object):
             else:
                 raise Exception("Invalid argument for pixels_per_node: " +
                                 str(value))
+            # Text is sized to fit nodes, so drop any rendered at the old size.
+            self.glyph_cache = GlyphCache()
             self.recalculate_display_sizes()
         def fdel(self):
             del self.node_width
@@ -507,28 +697,52 @@ class ParallelEmulatedSquareGridDisplay(object):
         self.parent_surface = parent_surface
         self.display_surface = parent_surface.subsurface(
                         (x_pos, y_pos, self.display_width, self.display_height))
+        # Nodes changed since the last flush, by position.
+        self.dirty = dict()
         # Initial render
         for x in range(self.grid.x_size):
             for y in range(self.grid.y_size):
                 self.update_node_at_position(x, y)
+        self.flush()
 
     def update_node_at_position(self, x, y):
         self.update_node(self.grid.getnode(x,y))
 
     def update_node(self, node):
         '''
-        Redraw a specified node, and its emulated node if that emulated node
-        changed state
+        Mark a specified node to be redrawn, with whatever state it has then,
+        on the next flush.
+        '''
+        self.dirty[node.position] = node
+
+    def flush(self):
+        '''
+        Redraw the nodes updated since the last flush. Returns the list of
+        rectangles of the parent surface that changed.
+        '''
+        rects = []
+        for node in self.dirty.values():
+            rects.extend(rect.move(self.x_pos, self.y_pos)
+                         for rect in self.draw_node(node))
+        self.dirty = dict()
+        return rects
+
+    def draw_node(self, node):
+        '''
+        Draw a specified node, and its emulated node if that emulated node
+        changed state. Returns the list of rectangles drawn, relative to this
+        display.
         '''
         new_rect   = self.make_node_rectangle(node)
         node_color = self.colormap[node.state]
-        pygame.draw.rect(self.display_surface, node_color, new_rect)
+        rects = [pygame.draw.rect(self.display_surface, node_color, new_rect)]
         if self.display_text:
             node_text_surface = self.make_node_text(node)
             text_rect = node_text_surface.get_rect()
             text_rect.center = new_rect.center
             self.display_surface.blit(node_text_surface,
                                       text_rect)
+            rects.append(text_rect)
 
         # Update the emulated node if necessary
         x = (node.position[0]-self.horizontal_buffer) % self.emulated_cell_width
@@ -545,7 +759,9 @@ class ParallelEmulatedSquareGridDisplay(object):
                 node_color = self.emulation_colormap[node.state[0]]
             else:
                 node_color = self.emulation_colormap['B']
-            pygame.draw.rect(self.display_surface, node_color, new_rect)
+            rects.append(pygame.draw.rect(self.display_surface, node_color,
+                                          new_rect))
+        return rects
 
     def make_node_rectangle(self, node):
         x = node.position[0]
@@ -594,8 +810,6 @@ class ParallelEmulatedSquareGridDisplay(object):
             text_color = WHITE
         else:
             text_color = BLACK
-        font = pygame.font.SysFont('monospace', 10)
-        text_surface = font.render(node.state, True, text_color)
-        return text_surface
+        return self.glyph_cache.render(node.state, text_color, 10)
 
 #end class ParallelEmulatedSquareGridDisplay
\ No newline at end of file
@@ -0,0 +1,346 @@
+'''
+Renders movies of recorded runs offline, without pygame and without running
+the simulation again.
+
+The frame timeline (one frame every 1/capture_rate time units, as the live
+capture in SurfaceCRNQueueSimulator takes them) is split into one contiguous
+chunk per worker process. Each worker rebuilds the lattice at the start of its
+chunk straight from the recorded events, then steps through its frames,
+coloring each one with a single numpy lookup of the colormap and handing it
+to the encoder: either a numbered PNG file per frame, or an ffmpeg process
+per chunk, whose segments are joined into one movie at the end.
+
+Every surface is drawn as a square grid, node (x, y) being a block of
+pixels_per_node pixels whose corner is x blocks right and y blocks down from
+the corner of the grid, inside a white border.
+'''
+import os
+import math
+import shutil
+import struct
+import zlib
+import tempfile
+import subprocess
+import multiprocessing
+import threading
+import queue
+import numpy as np
+from surface_crns.constants import COLOR_CLASSES
+from surface_crns.simulators.trajectory import TrajectoryReader
+
+BORDER = 5
+BACKGROUND = (255, 255, 255)
+
+def render_movie(source, colormap, output, capture_rate = 5, duration = None,
+                 pixels_per_node = 5, fps = 25, processes = None,
+                 title = None):
+    '''
+    Render a movie of a recorded run.
+
+    Params:
+        source: The run, as the filename of a trajectory file (see
+                surface_crns.simulators.trajectory) or as a
+                CompactEventHistory.
+        colormap: Dictionary mapping states to RGB colors, as in
+                  SurfaceCRNOptionParser.COLORMAP. States not in it are drawn
+                  black.
+        output: If it ends in ".mp4", the movie file to write with ffmpeg.
+                Otherwise, a directory to write the frames to, as PNG files
+                named <title>_1.png, <title>_2.png, ...
+        capture_rate: Frames per unit of simulated time.
+        duration: Simulated time to render up to; by default, the time of the
+                  last event.
+        pixels_per_node: Width and height of each node, in pixels, either as
+                         a single integer or as a (width, height) pair.
+        fps: Frame rate of the movie.
+        processes: Number of worker processes (by default, one per core).
+        title: Base name of the frame files (by default, the name of output).
+    Returns the number of frames rendered.
+    '''
+    source_spec, species, times = _source_spec(source)
+    palette = colormap_palette(colormap, species)
+    if duration is None:
+        duration = float(times[-1]) if len(times) else 0
+    n_frames = int(math.floor(duration * capture_rate + 1e-9)) + 1
+    frame_times = np.arange(n_frames) / capture_rate
+    if isinstance(pixels_per_node, int):
+        pixels_per_node = (pixels_per_node, pixels_per_node)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, n_frames))
+
+    movie = output.lower().endswith(".mp4")
+    if title is None:
+        title = os.path.splitext(os.path.basename(os.path.normpath(output)))[0]
+    if movie:
+        ffmpeg = find_ffmpeg()
+        frame_directory = tempfile.mkdtemp(
+                            dir = os.path.dirname(os.path.abspath(output)))
+    else:
+        ffmpeg = None
+        frame_directory = output
+        os.makedirs(frame_directory, exist_ok = True)
+
+    # Contiguous chunks of frames, the earlier ones no smaller.
+    bounds = np.linspace(0, n_frames, processes + 1).round().astype(int)
+    tasks = [{"source":      source_spec,
+              "palette":     palette,
+              "pixels_per_node": pixels_per_node,
+              "frame_times": frame_times[start:end],
+              "first_frame": start + 1,
+              "directory":   frame_directory,
+              "title":       title,
+              "ffmpeg":      ffmpeg,
+              "fps":         fps}
+             for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+    if len(tasks) == 1:
+        results = [_render_chunk(tasks[0])]
+    else:
+        with multiprocessing.Pool(len(tasks)) as pool:
+            results = pool.map(_render_chunk, tasks)
+
+    if movie:
+        # Join the chunks' segments, in order, without re-encoding them.
+        list_filename = os.path.join(frame_directory, "segments.txt")
+        with open(list_filename, "w") as list_file:
+            for segment in results:
+                list_file.write("file '" + os.path.abspath(segment) + "'\n")
+        subprocess.run([ffmpeg, "-y", "-f", "concat", "-safe", "0",
+                        "-i", list_filename, "-c", "copy", output],
+                       stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL,
+                       check = True)
+        shutil.rmtree(frame_directory)
+    return n_frames
+
+def colormap_palette(colormap, species):
+    '''
+    Returns a (number of species, 3) uint8 array of the color of each species
+    code.
+    '''
+    palette = np.zeros((len(species), 3), dtype = np.uint8)
+    for code, state in enumerate(species):
+        if state != COLOR_CLASSES and state in colormap:
+            palette[code] = [int(round(c)) for c in colormap[state][:3]]
+    return palette
+
+def rasterize(codes, palette, pixels_per_node):
+    '''
+    Returns the (height, width, 3) uint8 image of an (x_size, y_size) array of
+    species codes.
+    '''
+    node_width, node_height = pixels_per_node
+    x_size, y_size = codes.shape
+    image = np.empty((2 * BORDER + y_size * node_height,
+                      2 * BORDER + x_size * node_width, 3), dtype = np.uint8)
+    image[:] = BACKGROUND
+    # Rows of the image are y, columns are x.
+    colors = palette[codes.T]
+    image[BORDER:BORDER + y_size * node_height,
+          BORDER:BORDER + x_size * node_width] = \
+            np.repeat(np.repeat(colors, node_height, axis = 0),
+                      node_width, axis = 1)
+    return image
+
+def find_ffmpeg():
+    '''
+    Returns the path of the ffmpeg executable.
+    '''
+    name = shutil.which("ffmpeg")
+    if name is None:
+        for possible_name in ['/usr/local/bin/ffmpeg', '/usr/bin/ffmpeg']:
+            if os.path.isfile(possible_name):
+                name = possible_name
+                break
+    if name is None:
+        raise Exception("Could not find executable ffmpeg in any of the "
+                        "expected locations!")
+    return name
+
+def write_png(filename, image):
+    '''
+    Write a (height, width, 3) uint8 image to a PNG file.
+    '''
+    height, width, _ = image.shape
+    # Each row starts with filter type 0 (none).
+    rows = np.zeros((height, 3 * width + 1), dtype = np.uint8)
+    rows[:, 1:] = image.reshape(height, 3 * width)
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + \
+               struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    with open(filename, "wb") as png_file:
+        png_file.write(b"\x89PNG\r\n\x1a\n" +
+                       chunk(b"IHDR", struct.pack(">IIBBBBB", width, height,
+                                                  8, 2, 0, 0, 0)) +
+                       chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)) +
+                       chunk(b"IEND", b""))
+
+def _source_spec(source):
+    '''
+    Returns a picklable description of a run that _open_source can rebuild it
+    from in a worker, the run's species, and its event times.
+    '''
+    if isinstance(source, str):
+        reader = TrajectoryReader(source)
+        if reader.shape is None:
+            raise Exception("Only trajectories on grids can be rendered.")
+        return ("trajectory", source), reader.species, reader.times
+    node_grid = source.node_grid()
+    if node_grid is None:
+        raise Exception("Only histories on grids can be rendered.")
+    events, nodes, codes = source.event_entries()
+    times = source.times.values
+    # Species may have been added since the first keyframe was stored.
+    initial_codes = source.keyframes[0].astype(source.species.code_dtype())
+    return ("entries", times[events], nodes, codes, initial_codes,
+            node_grid), \
+           list(source.species.species), times
+
+def _open_source(spec):
+    if spec[0] == "trajectory":
+        return TrajectoryReader(spec[1])
+    return _EntryReplay(*spec[1:])
+
+def _render_chunk(task):
+    '''
+    Render one chunk of frames. Returns the segment's filename when encoding
+    a movie.
+    '''
+    run = _open_source(task["source"])
+    palette, pixels_per_node = task["palette"], task["pixels_per_node"]
+    frames = (rasterize(run.codes_at(t), palette, pixels_per_node)
+              for t in task["frame_times"])
+    if task["ffmpeg"] is None:
+        for number, image in enumerate(frames, task["first_frame"]):
+            write_png(os.path.join(task["directory"], task["title"] + "_" +
+                                   str(number) + ".png"), image)
+        return None
+
+    segment = os.path.join(task["directory"],
+                           "segment_" + str(task["first_frame"]) + ".mp4")
+    encoder = None
+    for image in frames:
+        if encoder is None:
+            height, width, _ = image.shape
+            encoder = FramePipe(task["ffmpeg"], segment, width, height,
+                                task["fps"])
+        encoder.write(image.tobytes())
+    if encoder.close() != 0:
+        raise Exception("ffmpeg failed to encode " + segment + ".")
+    return segment
+
+
+class FramePipe(object):
+    '''
+    Encodes a movie by writing raw RGB frames to the stdin of an ffmpeg
+    process, so that frames never touch the disk.
+
+    Frames are handed to a background thread through a queue holding at most
+    queue_size of them, so the caller can get on with the next frame while
+    ffmpeg encodes, and only waits when ffmpeg falls that far behind.
+    '''
+    def __init__(self, ffmpeg, filename, width, height, fps = 25,
+                 queue_size = 8, log = None):
+        '''
+        Params:
+            ffmpeg: Path of the ffmpeg executable (see find_ffmpeg).
+            filename: The movie file to write.
+            width, height: Size of every frame, in pixels.
+            fps: Frame rate of the movie.
+            queue_size: Number of frames that can be waiting to be encoded.
+            log: File to send ffmpeg's output to (by default, it's dropped).
+        '''
+        self.frame_size = 3 * width * height
+        if log is None:
+            log = subprocess.DEVNULL
+        self.process = subprocess.Popen(
+                    [ffmpeg, "-y", # Overwrite output file
+                     "-f", "rawvideo", "-pix_fmt", "rgb24",
+                     "-s", str(width) + "x" + str(height),
+                     "-framerate", str(fps),
+                     "-i", "-",
+                     # Try to use better-than-default decoder
+                     "-vcodec", "h264",
+                     # Need this for Quicktime to be able to read it
+                     "-pix_fmt", "yuv420p",
+                     # Set a higher-than-default bitrate
+                     "-crf", "18",
+                     "-an", # no audio
+                     # Width and height need to be divisible by 2.
+                     # Round up if necessary.
+                     "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                     filename],
+                    stdin = subprocess.PIPE, stdout = log, stderr = log)
+        self.frames = queue.Queue(maxsize = queue_size)
+        self.error  = None
+        self.thread = threading.Thread(target = self.write_frames,
+                                       daemon = True)
+        self.thread.start()
+
+    def write(self, frame):
+        '''
+        Queue one frame, as width * height * 3 bytes of RGB, to be encoded.
+        '''
+        if self.error is not None:
+            raise Exception("Writing to ffmpeg failed: " + str(self.error))
+        if len(frame) != self.frame_size:
+            raise Exception("Frame of " + str(len(frame)) + " bytes given to "
+                            "a movie of " + str(self.frame_size) +
+                            "-byte frames.")
+        self.frames.put(frame)
+
+    def write_frames(self):
+        '''
+        Body of the background thread: feed queued frames to ffmpeg until
+        close queues None.
+        '''
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.process.stdin.write(frame)
+            except (BrokenPipeError, OSError) as error:
+                # Keep emptying the queue so write never blocks forever.
+                self.error = error
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+    def close(self):
+        '''
+        Finish encoding the queued frames and wait for ffmpeg to write the
+        movie. Returns ffmpeg's exit code.
+        '''
+        self.frames.put(None)
+        self.thread.join()
+        return self.process.wait()
+#end class FramePipe
+
+
+class _EntryReplay(object):
+    '''
+    Rebuilds the lattice of a run at increasing times from its changes to
+    nodes (see CompactEventHistory.event_entries), many at a time.
+    '''
+    def __init__(self, times, nodes, codes, initial_codes, node_grid):
+        self.times = times
+        self.nodes = nodes
+        self.new_codes = codes
+        self.codes = initial_codes.copy()
+        self.node_grid = node_grid
+        self.count = 0
+
+    def codes_at(self, time):
+        count = int(np.searchsorted(self.times, time, side = "right"))
+        if count < self.count:
+            raise Exception("Runs can only be replayed forward.")
+        nodes = self.nodes[self.count:count]
+        # The last change to each node wins.
+        written, last = np.unique(nodes[::-1], return_index = True)
+        self.codes[written] = self.new_codes[self.count:count][::-1][last]
+        self.count = count
+        return self.codes[self.node_grid]
+#end class _EntryReplay
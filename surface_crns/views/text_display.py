@@ -8,6 +8,7 @@ class TextDisplay(object):
     This object is assigned a width on creation. Text is centered within that
     space.
     '''
+    pygame.font.init()
     TIME_FONT         = pygame.font.SysFont('monospace', 24)
     BLACK             = (0,0,0)
     WHITE             = (255,255,255)
@@ -9,10 +9,15 @@ class TimeDisplay(TextDisplay):
     '''
     def __init__(self, width):
         super(TimeDisplay, self).__init__(width)
+        # Shown after the time, if set (see FramePacer.status).
+        self.status = None
         self.time = 0
 
     def update_time_text(self):
-        self.text = "T = {0:.2f}".format(self.time)
+        text = "T = {0:.2f}".format(self.time)
+        if self.status:
+            text += " (" + self.status + ")"
+        self.text = text
 
     def get_time(self):
         return self._time